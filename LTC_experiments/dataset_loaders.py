@@ -0,0 +1,340 @@
+"""
+Fast loaders for the datasets of the MIT experiments, with the same results as the loaders copied from the MIT code.
+
+The text files are parsed with numpy a large chunk at a time, rather than one line at a time, and the parsed
+arrays are cached in a .cache.npz file next to the source file. The cache is used for as long as the source file
+has the same size and modification time, so that later runs of an experiment load the dataset in milliseconds.
+"""
+
+import importlib.util
+import io
+import os
+import numpy as np
+import unittest
+
+
+CACHE_FORMAT = 1  # changed whenever a parser changes, so that old caches are parsed again
+
+POWER_PATH = "data/power/household_power_consumption.txt"
+OZONE_PATH = "data/ozone/eighthr.data"
+PERSON_PATH = "data/person/ConfLongDemo_JSI.txt"
+
+
+def load_cached(source_path, parse):
+    """
+    INTENT: load the arrays parsed from source_path from its cache, parsing and caching them first if needed
+
+    PRE 1: parse is a function which takes source_path and returns a dict of numpy arrays
+
+    POST 1: the cache is used if it was made by the same parser of this CACHE_FORMAT,
+        from a source file of the same size and modification time
+    POST 2: otherwise the source is parsed and the cache is written under another name
+        and then replaced in one step, so that an interrupted run never leaves half a cache
+
+    RETURN: the dict of arrays
+    """
+    cache_path = source_path + '.cache.npz'
+    status = os.stat(source_path)
+    source_key = np.array([CACHE_FORMAT, status.st_size, status.st_mtime_ns], np.int64)
+
+    # ---- POST 1
+    try:
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached['source_key'], source_key) and cached['parser'] == parse.__name__:
+                return {name: cached[name] for name in cached.files if name not in ('source_key', 'parser')}
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # ---- POST 2
+    arrays = parse(source_path)
+    with open(cache_path + '.tmp', 'wb') as f:
+        np.savez(f, source_key=source_key, parser=parse.__name__, **arrays)
+    os.replace(cache_path + '.tmp', cache_path)
+
+    return arrays
+
+
+def read_line_chunks(f, chunk_size=2 ** 24):
+    """
+    INTENT: read a text file in chunks of about chunk_size characters, each ending at the end of a line
+
+    RETURN: a generator of the chunks
+    """
+    remainder = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        chunk = remainder + chunk
+        end = chunk.rfind('\n') + 1
+        if end == 0:
+            remainder = chunk
+            continue
+        remainder = chunk[end:]
+        yield chunk[:end]
+    if remainder:
+        yield remainder
+
+
+def parse_power(source_path):
+    """
+    INTENT: parse the household power file as power_exp.load_crappy_formatted_csv does
+
+    POST 1: the header is skipped, and each chunk of lines is read by np.loadtxt, with a missing value
+        ('?', or an empty last field) read as nan. A chunk with lines of other lengths is split line by line,
+        leaving out lines with fewer than 8 fields, as the MIT code does.
+    POST 2: each nan is filled with the last value of its column before it, which starts as the column number
+
+    RETURN: a dict with the (rows, 7) float32 array of features, with the target first
+    """
+    memory = np.arange(7, dtype=float)  # the MIT code starts with [i for i in range(7)]
+    chunks = []
+
+    with open(source_path, 'r') as f:
+        f.readline()
+        for chunk in read_line_chunks(f):
+            # ---- POST 1
+            chunk = chunk.replace('?', 'nan').replace(';\n', ';nan\n')
+            try:
+                values = np.loadtxt(io.StringIO(chunk), delimiter=';', usecols=range(2, 9), ndmin=2)
+            except ValueError:
+                lines = [line.split(';') for line in chunk.split('\n')]
+                values = np.array([arr[2:] for arr in lines if len(arr) >= 8], dtype=float).reshape(-1, 7)
+
+            # ---- POST 2
+            values = np.concatenate(([memory], values))
+            last_found = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+            np.maximum.accumulate(last_found, axis=0, out=last_found)
+            values = values[last_found, np.arange(7)]
+            memory = values[-1]
+            chunks.append(values[1:].astype(np.float32))
+
+    return {'features': np.concatenate(chunks) if chunks else np.empty((0, 7), np.float32)}
+
+
+def load_power(source_path=POWER_PATH):
+    """
+    INTENT: load the household power dataset, as power_exp.load_crappy_formatted_csv does
+
+    RETURN: all_x and all_y, as float32 arrays
+    """
+    all_x = load_cached(source_path, parse_power)['features']
+
+    all_y = all_x[:, 0].reshape([-1, 1])
+    all_x = all_x[:, 1:]
+
+    return all_x, all_y
+
+
+def parse_ozone(source_path):
+    """
+    INTENT: parse the ozone file as ozone_exp.load_trace does
+
+    POST 1: the lines are read up to the first one which does not have 74 fields, which is the end of the file
+        if every line does. As readline does, the file's last character is dropped if it is not a newline.
+    POST 2: the lines are split all at once, and '?' features are read as 0
+    POST 3: the samples with a '?' feature are counted, including the line which ended the reading,
+        and total counts that line as well, as in the MIT code
+
+    RETURN: a dict of the features, labels, number of samples missing features and total number of lines
+    """
+    with open(source_path, 'r') as f:
+        text = f.read()
+
+    # ---- POST 1
+    lines = text.split('\n')
+    if lines[-1] != '':
+        lines[-1] = lines[-1][:-1]
+        lines.append('')
+    num_lines = 0
+    while lines[num_lines].count(',') == 73:
+        num_lines += 1
+
+    # ---- POST 2
+    fields = np.array(','.join(lines[:num_lines]).split(',') if num_lines > 0 else [], dtype=str).reshape(-1, 74)
+    features = fields[:, 1:-1]
+    missing = features == '?'
+    x = np.where(missing, '0', features).astype(float)
+    y = fields[:, -1].astype(float).astype(int)
+
+    # ---- POST 3
+    miss = np.count_nonzero(missing.any(axis=1)) + ('?' in lines[num_lines].split(',')[1:-1])
+
+    return {'x': x, 'y': y, 'miss': np.array(miss), 'total': np.array(num_lines + 1)}
+
+
+def load_ozone(source_path=OZONE_PATH):
+    """
+    INTENT: load the ozone dataset, as ozone_exp.load_trace does, printing the same messages
+
+    RETURN: all_x and all_y
+    """
+    arrays = load_cached(source_path, parse_ozone)
+    all_x, all_y = arrays['x'], arrays['y']
+    miss, total = int(arrays['miss']), int(arrays['total'])
+
+    print("Missing features in {} out of {} samples ({:0.2f})".format(miss, total, 100*miss/total))
+    print("Read {} lines".format(len(all_x)))
+    print("Imbalance: {:0.2f}%".format(100*np.mean(all_y)))
+
+    return all_x, all_y
+
+
+def parse_person(source_path):
+    """
+    INTENT: parse the person activity file as person.load_crappy_formated_csv does
+
+    PRE 1: the class and sensor names are those of person.class_map and person.sensor_ids
+
+    POST 1: the lines are read up to the first one with fewer than 6 fields, and split all at once
+    POST 2: each row of features is the one-hot sensor followed by the three coordinates, as float32
+    POST 3: a person's rows are only kept as a series once the next person starts, so the last person
+        is left out of the series, as in the MIT code, though not out of the features and labels
+
+    RETURN: a dict of the features and labels of every line, and the lengths of the series
+    """
+    from person import class_map, sensor_ids
+
+    with open(source_path, 'r') as f:
+        lines = f.read().split('\n')
+
+    # ---- POST 1
+    num_lines = 0
+    while num_lines < len(lines) and lines[num_lines].count(',') >= 5:
+        num_lines += 1
+    fields = np.array([line.split(',') for line in lines[:num_lines]], dtype=str).reshape(num_lines, -1)
+
+    # ---- POST 2
+    sensors = np.array([sensor_ids[sensor] for sensor in fields[:, 1]], dtype=np.intp)
+    features = np.zeros((num_lines, 7), np.float32)
+    features[np.arange(num_lines), sensors] = 1
+    features[:, 4:] = fields[:, 4:7].astype(np.float32)
+    labels = np.array([class_map[label] for label in fields[:, 7]], dtype=np.int32)
+
+    # ---- POST 3
+    people = fields[:, 0]
+    previous_people = np.concatenate((["A01"], people[:-1]))  # the MIT code starts with current_person = "A01"
+    series_ends = np.flatnonzero(people != previous_people)
+    series_lengths = np.diff(series_ends, prepend=0)
+
+    return {'features': features, 'labels': labels, 'series_lengths': series_lengths}
+
+
+def load_person(source_path=PERSON_PATH):
+    """
+    INTENT: load the person activity dataset, as person.load_crappy_formated_csv does, printing the same messages
+
+    RETURN: all_x and all_y, as lists of the float32 features and int32 labels of each series
+    """
+    arrays = load_cached(source_path, parse_person)
+    all_feats, labels, series_lengths = arrays['features'], arrays['labels'], arrays['series_lengths']
+
+    series_ends = np.cumsum(series_lengths)
+    all_x = np.split(all_feats[:series_ends[-1] if len(series_ends) else 0], series_ends[:-1])
+    all_y = np.split(labels[:series_ends[-1] if len(series_ends) else 0], series_ends[:-1])
+
+    all_labels = np.eye(7, dtype=np.float32)[labels]
+    print("all_labels.shape: ",str(all_labels.shape))
+    prior = np.mean(all_labels,axis=0)
+    print("Resampled Prior: ",str(prior*100))
+    print("all_feats.shape: ",str(all_feats.shape))
+
+    all_mean = np.mean(all_feats,axis=0)
+    all_std = np.std(all_feats,axis=0)
+    all_mean[3:] = 0
+    all_std[3:] = 1
+    print("all_mean: ",str(all_mean))
+    print("all_std: ",str(all_std))
+
+    return all_x, all_y
+
+
+class DatasetLoaderTests(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.experiments_directory = os.path.dirname(os.path.abspath(__file__))
+        self.working_directory = os.getcwd()
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        os.chdir(self.working_directory)
+        self.directory.cleanup()
+
+    def test_load_ozone(self):
+        from ozone_exp import load_trace
+
+        source_path = os.path.join(self.experiments_directory, OZONE_PATH)
+        os.makedirs('data/ozone')
+        with open(source_path) as f:
+            lines = f.readlines()
+        with open(OZONE_PATH, 'w') as f:  # with a line which ends the reading, and features missing after it
+            f.writelines(lines[:300] + ['bad,line\n'] + lines[300:310])
+
+        for trial in range(2):  # parsing, and then from the cache
+            all_x, all_y = load_ozone()
+            expected_x, expected_y = load_trace()
+            assert(np.array_equal(all_x, expected_x) and all_x.dtype == expected_x.dtype)
+            assert(np.array_equal(all_y, expected_y))
+        assert(os.path.exists(OZONE_PATH + '.cache.npz'))
+
+        # a changed file is parsed again
+        with open(OZONE_PATH, 'w') as f:
+            f.writelines(lines[:50])
+        all_x, all_y = load_ozone()
+        assert(len(all_x) == 50)
+
+    def test_load_power(self):
+        from power_exp import load_crappy_formatted_csv
+        import power_exp
+
+        rng = np.random.default_rng(22)
+        lines = ["Date;Time;Global_active_power;Global_reactive_power;Voltage;Global_intensity;"
+                 "Sub_metering_1;Sub_metering_2;Sub_metering_3\n"]
+        for i in range(2000):
+            values = [f"{value:.3f}" for value in rng.random(7) * 100]
+            if rng.random() < 0.1:
+                values = ['?'] * 6 + ['']  # as in the power file
+            if i == 0:
+                values[2] = '?'  # filled with the starting memory
+            lines.append(f"16/12/2006;17:{i:02d}:00;" + ';'.join(values) + '\n')
+        lines.insert(500, "short;line\n")
+
+        os.makedirs('data/power')
+        with open(POWER_PATH, 'w') as f:
+            f.writelines(lines)
+
+        for trial in range(2):
+            all_x, all_y = load_power()
+            expected_x, expected_y = load_crappy_formatted_csv()
+            assert(np.array_equal(all_x, expected_x) and all_x.dtype == np.float32)
+            assert(np.array_equal(all_y, expected_y))
+        assert(power_exp.load_data_from_mit().shape == (2000 - 1, 7))
+
+    @unittest.skipUnless(importlib.util.find_spec('pandas'), "person.py imports pandas")
+    def test_load_person(self):
+        from person import class_map, load_crappy_formated_csv, sensor_ids
+
+        rng = np.random.default_rng(22)
+        lines = []
+        for person, num_lines in (('A01', 40), ('A02', 1), ('A03', 25), ('B01', 30), ('A01', 12)):
+            for i in range(num_lines):
+                coordinates = ','.join(f"{value:.6f}" for value in rng.normal(0, 2, 3))
+                lines.append(f"{person},{rng.choice(list(sensor_ids))},{633790226051280329 + i},"
+                             f"27.05.2009 14:03:25:127,{coordinates},{rng.choice(list(class_map))}\n")
+        lines.append("the,end\n")  # ends the reading, as in the MIT code
+        lines.append(lines[0])
+
+        os.makedirs('data/person')
+        with open(PERSON_PATH, 'w') as f:
+            f.writelines(lines)
+
+        for trial in range(2):  # parsing, and then from the cache
+            all_x, all_y = load_person()
+            expected_x, expected_y = load_crappy_formated_csv()
+            assert(len(all_x) == len(expected_x) == 4 and len(all_y) == len(expected_y))
+            for x, y, x_expected, y_expected in zip(all_x, all_y, expected_x, expected_y):
+                assert(np.array_equal(x, x_expected) and x.dtype == x_expected.dtype)
+                assert(np.array_equal(y, y_expected) and y.dtype == y_expected.dtype)
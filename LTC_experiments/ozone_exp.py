@@ -11,6 +11,7 @@ import time
 from sklearn.metrics import f1_score
 
 from run_experiment import cut_in_sequences, run_full_experiment
+from dataset_loaders import OZONE_PATH, load_ozone
 
 
 # The following three functions are from the MIT experiments, copied here without alteration
@@ -65,9 +66,11 @@ def load_data_from_mit():
     """
     INTENT: Load the dataset from the MIT experiment.
 
-    POST 1: The dataset is ready for MaRz usage and returned.
+    POST 1: The dataset is loaded with dataset_loaders.load_ozone, which gives the same result
+        as load_trace but is cached after the first run.
+    POST 2: The dataset is ready for MaRz usage and returned.
     """
-    data_, targets_ = load_trace()
+    data_, targets_ = load_ozone()
 
     data_, targets_ = cut_in_sequences(data_, targets_, 1, 1)  # numbers from person.py: 32, 32//2
     data_ = data_.squeeze(0)  # remove extra dimension from sequences
@@ -93,7 +96,8 @@ if __name__ == '__main__':
     load_time = time.time() - loading_timer
     print('=' * 20, f"loaded ozone dataset in {load_time:.2f} seconds", '=' * 20)
 
-    y_actual, y_predicted = run_full_experiment(ozone_dataset)
+    y_actual, y_predicted = run_full_experiment(ozone_dataset, prepared_directory='prepared/ozone',
+                                                source_path=OZONE_PATH)
 
     # Calculate F1 score
     y_predicted = np.rint(np.array(y_predicted))  # convert to binary array to match targets type
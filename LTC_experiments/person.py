@@ -108,20 +108,21 @@ def load_crappy_formated_csv():
 
 
 def cut_in_sequences(all_x,all_y,seq_len,inc=1):
-
+    # the windows of each person are strided views, with the same starts as range(0,x.shape[0] - seq_len,inc),
+    # so the only copy made is of the windows of every person joined together. A person with no more rows than
+    # seq_len has no windows, as in the MIT loop. The result is a writable view of that copy in the
+    # (seq_len, windows, features) layout, which is not contiguous, so copy it where that is needed
     sequences_x = []
     sequences_y = []
 
     for i in range(len(all_x)):
         x,y = all_x[i],all_y[i]
+        if x.shape[0] <= seq_len:
+            continue
+        sequences_x.append(np.lib.stride_tricks.sliding_window_view(x,seq_len,axis=0)[:x.shape[0] - seq_len:inc])
+        sequences_y.append(np.lib.stride_tricks.sliding_window_view(y,seq_len,axis=0)[:y.shape[0] - seq_len:inc])
 
-        for s in range(0,x.shape[0] - seq_len,inc):
-            start = s
-            end = start+seq_len
-            sequences_x.append(x[start:end])
-            sequences_y.append(y[start:end])
-
-    return np.stack(sequences_x,axis=1),np.stack(sequences_y,axis=1)
+    return np.moveaxis(np.concatenate(sequences_x),-1,0),np.moveaxis(np.concatenate(sequences_y),-1,0)
 
 class PersonData:
 
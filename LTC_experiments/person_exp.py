@@ -8,15 +8,19 @@ The original code from the paper can be found at: https://github.com/raminmh/liq
 """
 
 import numpy as np
+from statistics import NormalDist
 import time
 from sklearn.model_selection import train_test_split
 
 # todo: copy and paste in functions, remove normalization, test a bit more
-from person import load_crappy_formated_csv, cut_in_sequences
-from run_dataset import preprocessing, run_dataset
+from person import cut_in_sequences
+from dataset_loaders import PERSON_PATH, load_person  # the same as person.load_crappy_formated_csv, but cached
+from prepared_model import load_or_prepare
+from progressive_metrics import RunningProportion
+from run_dataset import run_dataset_progressive
 
 loading_timer = time.time()
-data_, targets_ = load_crappy_formated_csv()
+data_, targets_ = load_person()
 data_, targets_ = cut_in_sequences(data_, targets_, 1, 1)  # numbers from person.py: 32, 32//2
 data_ = data_.squeeze(0)  # remove extra dimension from sequences
 targets_ = targets_.reshape(targets_.shape[1], 1)  # make it match for concatenation
@@ -30,7 +34,9 @@ load_time = time.time() - loading_timer
 print('=' * 20, f"loaded person dataset in {load_time:.2f} seconds", '=' * 20)
 
 preprocessing_timer = time.time()
-index_table, base_fuzzy = preprocessing(person_dataset)
+# the sorted test split is saved the first time, and loaded from then on until the data file changes
+person_dataset, index_table, base_fuzzy, unused_sorted_columns, unused_metadata = load_or_prepare(
+    'prepared/person', PERSON_PATH, lambda path: person_dataset)
 
 preprocessing_time = time.time() - preprocessing_timer
 print('=' * 20, f"preprocessed dataset in {preprocessing_time:.2f} seconds", '=' * 20)
@@ -42,8 +48,10 @@ print(f"target min/max/range: {t_min}/{t_max}/{t_max - t_min}")
 print("Targets are integers 0-6, so outputs should be rounded to nearest int.")
 
 run_timer = time.time()
-y_actual, y_predicted = run_dataset(person_dataset, index_table, base_fuzzy,
-                                    points=1, close_threshold=0.5, start=0, step=1000)  # NOTICE: BIG STEP HERE
+# random lines until the 95% interval of the accuracy is 1% wide, or an hour passes, rather than every 1000th line
+y_actual, y_predicted, estimates = run_dataset_progressive(person_dataset, index_table, base_fuzzy, points=1,
+                                                           close_threshold=0.5, metric='accuracy', ci_width=0.01,
+                                                           time_budget=3600)
 
 run_time = time.time() - run_timer
 print(f"dataset run time was {run_time:.2f} seconds")
@@ -56,6 +64,10 @@ acc_array = y_actual - y_predicted
 num_wrong = np.count_nonzero(acc_array)
 perc_correct = 1 - (num_wrong / n)
 
-print(f"MaRz accuracy Score: {perc_correct * 100:.2f}% correct.")
+# the Wilson interval of the accuracy is not centred on it, so print its ends rather than ± its half width
+correct = RunningProportion()
+correct.add(y_predicted == np.array(y_actual))
+low, high = correct.interval(NormalDist().inv_cdf(0.975), population=len(person_dataset))
+print(f"MaRz accuracy Score: {perc_correct * 100:.2f}% correct, 95% interval {low * 100:.2f}% to {high * 100:.2f}%.")
 print("Best from MIT paper: 97.26% correct.")
 print("LTC method accuracy: 95.67% correct.")
@@ -8,9 +8,9 @@ The original code from the paper can be found at: https://github.com/raminmh/liq
 
 import numpy as np
 import time
-from sklearn.metrics import mean_squared_error
 
-from run_experiment import cut_in_sequences, run_full_experiment
+from run_experiment import cut_in_sequences, run_progressive_experiment
+from dataset_loaders import POWER_PATH, load_power
 from get_alpha_sorted import get_alpha
 from marz_get_output import get_output
 
@@ -58,9 +58,11 @@ def load_data_from_mit():
     """
     INTENT: Load the dataset from the MIT experiment.
 
-    POST 1: The dataset is ready for MaRz usage and returned.
+    POST 1: The dataset is loaded with dataset_loaders.load_power, which gives the same result
+        as load_crappy_formatted_csv but is cached after the first run.
+    POST 2: The dataset is ready for MaRz usage and returned.
     """
-    data_, targets_ = load_crappy_formatted_csv()
+    data_, targets_ = load_power()
     data_, targets_ = cut_in_sequences(data_, targets_, 1, 1)  # numbers from person.py: 32, 32//2
     data_ = data_.squeeze(0)  # remove extra dimension from sequences
     targets_ = targets_.reshape(targets_.shape[1], 1)  # make it match for concatenation
@@ -81,7 +83,12 @@ if __name__ == '__main__':
     t_max = max(power_dataset[:, -1])
     print(f"target min/max/range: {t_min:.4f}/{t_max:.4f}/{t_max - t_min:.4f}")
 
-    y_actual, y_predicted = run_full_experiment(power_dataset, split=True, step=100)
+    # random lines until the 95% interval of the squared error is narrower than the paper's ± 0.003, or an hour passes,
+    # rather than every 100th line
+    y_actual, y_predicted, estimates = run_progressive_experiment(power_dataset, split=True, metric='mse',
+                                                                  ci_width=0.006, time_budget=3600,
+                                                                  prepared_directory='prepared/power',
+                                                                  source_path=POWER_PATH)
 
     """
     # run a single query from the dataset
@@ -93,7 +100,7 @@ if __name__ == '__main__':
     """
 
     # TODO: write output lists to a file as csv or something for reproducibility, since they take so long to make
-    squared_error = mean_squared_error(y_actual, y_predicted)
-    print(f"Mean squared error on very small sample of data: {squared_error:.3f}")
+    squared_error, half_width = estimates['mse']
+    print(f"Mean squared error on {len(y_actual)} random lines: {squared_error:.3f} ± {half_width:.3f}")
     print("Best squared error from paper: 0.586 ± 0.003")
     print("LTC squared error from paper: 0.642 ± 0.021")
@@ -1,28 +1,79 @@
 # common code to run MIT experiments with MaRz
 
+import importlib.util
 import numpy as np
 from sklearn.model_selection import train_test_split
 import time
+import unittest
 
-from run_dataset import preprocessing, run_dataset
+from prepared_model import load_or_prepare
+from run_dataset import preprocessing, run_dataset, run_dataset_progressive
+
+
+def sequence_windows(x, seq_len, inc=1):
+    """
+    INTENT: cut x into windows of seq_len rows, starting every inc rows, without copying x
+
+    POSTCONDITION 1: the windows start at range(0, x.shape[0] - seq_len, inc), as in the MIT sequencing code,
+        which leaves out the last window that would end on the last row
+
+    RETURN: a read only view of x of shape (seq_len, number of windows, ...), in the layout of stacking
+        every window along axis 1. Copy it (e.g. with np.array) to write to it or to keep it contiguous.
+    """
+    # ---- POST 1
+    windows = np.lib.stride_tricks.sliding_window_view(x, seq_len, axis=0)[:x.shape[0] - seq_len:inc]
+    return np.moveaxis(windows, -1, 0)
 
 
-# unmodified sequencing code from MIT to make running data more convenient
 def cut_in_sequences(x, y, seq_len, inc=1):
+    """
+    INTENT: cut x and y into sequences, as in the MIT sequencing code, which stacked a copy of each window
 
-    sequences_x = []
-    sequences_y = []
+    RETURN: the windows of x and y from sequence_windows. Unlike the MIT code, which returned writable
+        contiguous copies, these are read only strided views of x and y, so a caller which writes into the windows,
+        or needs them contiguous (e.g. to save them or pass them to a library that requires it), must copy them first.
+    """
+    return sequence_windows(x, seq_len, inc), sequence_windows(y, seq_len, inc)
 
-    for s in range(0, x.shape[0] - seq_len, inc):
-        start = s
-        end = start + seq_len
-        sequences_x.append(x[start:end])
-        sequences_y.append(y[start:end])
 
-    return np.stack(sequences_x, axis=1), np.stack(sequences_y, axis=1)
+def iterate_sequences(x, y, seq_len, inc=1, batch_size=1024):
+    """
+    INTENT: cut x and y into sequences as cut_in_sequences does, a batch of windows at a time,
+        so that long sequences do not need every window in memory at once
+
+    RETURN: a generator of (windows of x, windows of y) for up to batch_size windows each, in order,
+        as contiguous copies of shape (seq_len, number of windows in the batch, ...)
+    """
+    windows_x, windows_y = cut_in_sequences(x, y, seq_len, inc)
+    for start in range(0, windows_x.shape[1], batch_size):
+        yield (np.ascontiguousarray(windows_x[:, start:start + batch_size]),
+               np.ascontiguousarray(windows_y[:, start:start + batch_size]))
+
+
+def prepare_experiment(some_data, prepared_directory=None, source_path=None):
+    """
+    INTENT: preprocess the dataset of an experiment, or load it already prepared from an earlier run
+
+    PRE 1: some_data is a dataset formatted for MaRz, made from the file at source_path
+    PRE 2: prepared_directory is None to preprocess some_data every run, or a directory for this dataset only,
+        e.g. 'prepared/power'. The prepared model is only made again when source_path changes, so the directory
+        should be removed (or another one used) if the way some_data is made from the file changes.
 
+    POSTCONDITION 1: some_data is prepared with prepared_model.load_or_prepare if prepared_directory is given,
+        and the prepared data, memory mapped read only, is used in place of some_data
 
-def run_full_experiment(some_data, split=False, step=1):
+    RETURN: the dataset, index_table and base_fuzzy
+    """
+    if prepared_directory is None:
+        return (some_data,) + preprocessing(some_data)
+
+    # ---- POST 1
+    some_data, index_table, base_fuzzy, unused_sorted_columns, unused_metadata = load_or_prepare(
+        prepared_directory, source_path, lambda path: some_data)
+    return some_data, index_table, base_fuzzy
+
+
+def run_full_experiment(some_data, split=False, step=1, workers=1, prepared_directory=None, source_path=None):
     """
     INTENT: run and time an experiment based on the MIT liquid experiments
 
@@ -32,6 +83,9 @@ def run_full_experiment(some_data, split=False, step=1):
         for step=1, run every line
         for step=2, run every other line
         for step=100, run every 100 lines
+    PRE 4: workers is the number of processes to run the lines with, as for run_dataset
+    PRE 5: prepared_directory and source_path are as for prepare_experiment, to save the prepared dataset
+        (after the split) and load it on later runs
 
     POSTCONDITION 1: the number of seconds taken to preprocess and run the dataset are printed to the console
     POST 2: two parallel lists are returned, first the actual targets from the data and second MaRz predictions
@@ -42,17 +96,128 @@ def run_full_experiment(some_data, split=False, step=1):
         unused_train, some_data = train_test_split(some_data, test_size=.2, random_state=0)
 
     preprocessing_timer = time.time()
-    index_table, base_fuzzy = preprocessing(some_data)
+    some_data, index_table, base_fuzzy = prepare_experiment(some_data, prepared_directory, source_path)
 
     preprocessing_time = time.time() - preprocessing_timer
     print('=' * 20, f"pre-processed dataset in {preprocessing_time:.2f} seconds", '=' * 20)
 
     run_timer = time.time()
     y_actual, y_predicted = run_dataset(some_data, index_table, base_fuzzy, points=1,
-                                        close_threshold=0.5, step=step, verbose=False)
+                                        close_threshold=0.5, step=step, verbose=False, workers=workers)
 
     run_time = time.time() - run_timer
     print(f"dataset run time was {run_time:.2f} seconds")
 
     return y_actual, y_predicted
 
+
+def run_progressive_experiment(some_data, split=False, metric='mse', ci_width=None, time_budget=None, workers=1,
+                               prepared_directory=None, source_path=None):
+    """
+    INTENT: run and time an experiment as run_full_experiment does, but on random lines of the dataset until
+        metric is known well enough, with run_dataset_progressive, rather than on every step-th line
+
+    PRECONDITION 1: as for run_full_experiment
+    PRE 2: metric, ci_width and time_budget are as for run_dataset_progressive
+    PRE 3: prepared_directory and source_path are as for run_full_experiment
+
+    POSTCONDITION 1: the number of seconds taken to preprocess and run the dataset are printed to the console
+    POST 2: the actual targets and MaRz predictions of the lines run are returned, in the order they were run,
+        with the dict of the estimates of the metrics and the half widths of their 95% confidence intervals
+    """
+    if split:
+        unused_train, some_data = train_test_split(some_data, test_size=.2, random_state=0)
+
+    preprocessing_timer = time.time()
+    some_data, index_table, base_fuzzy = prepare_experiment(some_data, prepared_directory, source_path)
+
+    preprocessing_time = time.time() - preprocessing_timer
+    print('=' * 20, f"pre-processed dataset in {preprocessing_time:.2f} seconds", '=' * 20)
+
+    run_timer = time.time()
+    y_actual, y_predicted, estimates = run_dataset_progressive(some_data, index_table, base_fuzzy, points=1,
+                                                               close_threshold=0.5, metric=metric, ci_width=ci_width,
+                                                               time_budget=time_budget, workers=workers)
+
+    run_time = time.time() - run_timer
+    print(f"dataset run time was {run_time:.2f} seconds")
+
+    return y_actual, y_predicted, estimates
+
+
+def stack_sequences(x, y, seq_len, inc=1):
+    """
+    INTENT: cut x and y into sequences with the MIT sequencing code, to test the views against
+    """
+    sequences_x = []
+    sequences_y = []
+    for s in range(0, x.shape[0] - seq_len, inc):
+        start = s
+        end = start + seq_len
+        sequences_x.append(x[start:end])
+        sequences_y.append(y[start:end])
+    return np.stack(sequences_x, axis=1), np.stack(sequences_y, axis=1)
+
+
+class PrepareExperimentTests(unittest.TestCase):
+
+    def test_prepare_experiment(self):
+        import os
+        import tempfile
+
+        some_data = np.round(np.random.default_rng(17).random((200, 4)) * 10)
+        index_table, base_fuzzy = preprocessing(some_data)
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, 'data.txt')
+            np.savetxt(source_path, some_data)
+
+            # prepared on the first run, and then loaded from the same files without calling the loader
+            for trial in range(2):
+                prepared = prepare_experiment(some_data if trial == 0 else None, os.path.join(directory, 'prepared'),
+                                              source_path)
+                assert(np.array_equal(prepared[0], some_data) and isinstance(prepared[0], np.memmap))
+                assert(np.array_equal(prepared[1], index_table) and np.array_equal(prepared[2], base_fuzzy))
+            del prepared
+
+
+class SequenceTests(unittest.TestCase):
+
+    SEQUENCE_SIZES = [(1, 1), (2, 1), (5, 3), (32, 16), (32, 32), (7, 50)]
+
+    def test_cut_in_sequences(self):
+        rng = np.random.default_rng(21)
+        x = rng.random((300, 6)).astype(np.float32)
+        y = rng.integers(0, 7, (300, 1))
+
+        for seq_len, inc in self.SEQUENCE_SIZES:
+            expected_x, expected_y = stack_sequences(x, y, seq_len, inc)
+            windows_x, windows_y = cut_in_sequences(x, y, seq_len, inc)
+            assert(np.array_equal(windows_x, expected_x) and windows_x.dtype == expected_x.dtype)
+            assert(np.array_equal(windows_y, expected_y))
+
+            # the windows are views of x, which cannot be written through
+            assert(np.shares_memory(windows_x, x) and not windows_x.flags.writeable)
+            with self.assertRaises(ValueError):
+                windows_x[0, 0, 0] = 1
+
+            # the batches joined together are the same windows, as contiguous copies
+            batches = list(iterate_sequences(x, y, seq_len, inc, batch_size=7))
+            assert(all(batch_x.flags.c_contiguous and batch_x.shape[1] <= 7 for batch_x, batch_y in batches))
+            assert(np.array_equal(np.concatenate([batch_x for batch_x, batch_y in batches], axis=1), expected_x))
+            assert(np.array_equal(np.concatenate([batch_y for batch_x, batch_y in batches], axis=1), expected_y))
+
+    @unittest.skipUnless(importlib.util.find_spec('pandas'), "person.py imports pandas")
+    def test_person_cut_in_sequences(self):
+        import person
+
+        rng = np.random.default_rng(21)
+        lengths = [100, 32, 33, 5, 70, 48]  # a person with no more rows than seq_len has no windows
+        all_x = [rng.random((length, 7)).astype(np.float32) for length in lengths]
+        all_y = [rng.integers(0, 7, length).astype(np.int32) for length in lengths]
+
+        for seq_len, inc in self.SEQUENCE_SIZES[:-1]:
+            windows_x, windows_y = person.cut_in_sequences(all_x, all_y, seq_len, inc)
+            stacked = [stack_sequences(x, y, seq_len, inc) for x, y in zip(all_x, all_y) if len(x) > seq_len]
+            assert(np.array_equal(windows_x, np.concatenate([x for x, y in stacked], axis=1)))
+            assert(np.array_equal(windows_y, np.concatenate([y for x, y in stacked], axis=1)))
+            assert(windows_x.dtype == np.float32 and windows_y.dtype == np.int32)
@@ -2,37 +2,163 @@
 Build a query-able dataset in real time.
 """
 
+from bisect import bisect_left, bisect_right
 import numpy as np
+import threading
 import time
+import unittest
+
+from dataset_preprocessing import index_dtype
+
+
+BLOCK_SIZE = 1024  # rows per block of a sorted column, which is split in two when it reaches twice this size
+
+
+def read_only(an_array):
+    """
+    INTENT: get a view of an_array which cannot be written through, leaving an_array itself writeable
+
+    RETURN: the read only view
+    """
+    view = an_array.view()
+    view.flags.writeable = False
+    return view
+
+
+class RealtimeSnapshot:
+    """
+    An immutable view of a RealtimeDataCollector at one version, which readers can use without any locking.
+    The sorted blocks it holds are never written to again by the collector, which copies a block before
+    changing it once it has been published in a snapshot.
+    The blocks hold the collector's ids of the rows, which are first_id more than their indices in data.
+    In compact mode, the sorter and sorted indices are made in the smallest unsigned integer type for the data.
+    The data, sorter and sorted columns are read only, so a reader cannot change them under the other readers.
+    """
+
+    def __init__(self, version, data, base_fuzzy, first_id, block_values, block_ids, block_counts, compact=False):
+        self.version = version
+        self.length = len(data)
+        self.data = read_only(data)  # a view of the collector's buffer, which it still writes later rows into
+        self.base_fuzzy = base_fuzzy
+        self.first_id = first_id
+        self.block_values = block_values
+        self.block_ids = block_ids
+        self.block_counts = block_counts
+        self.compact = compact
+
+        self.sorter = None
+        self.sorted_columns = None
+
+    def join_blocks(self, blocks, dtype):
+        """
+        INTENT: Join the used part of each block of every column into a (data_width, length) array.
+        """
+        joined = np.empty((len(blocks), self.length), dtype)
+        for i in range(len(blocks)):
+            column_blocks = zip(blocks[i], self.block_counts[i])
+            joined[i] = np.concatenate([block[:count] for block, count in column_blocks])
+        return joined
+
+    def get_sorter(self):
+        """
+        INTENT: Get the sorter of the snapshot as an index table, made the first time it is asked for.
+        """
+        if self.sorter is None:
+            sorter = self.join_blocks(self.block_ids, np.intp) - self.first_id
+            if self.compact:
+                sorter = sorter.astype(index_dtype(self.length))
+            sorter.flags.writeable = False
+            self.sorter = sorter.T
+        return self.sorter
+
+    def get_sorted_columns(self):
+        """
+        INTENT: Get the sorted values and indices of the snapshot, as from generate_sorted_columns,
+            for the sorted_columns of get_alpha. They are made the first time they are asked for.
+        """
+        if self.sorted_columns is None:
+            sorted_values = self.join_blocks(self.block_values, self.data.dtype)
+            sorted_values.flags.writeable = False
+            self.sorted_columns = (sorted_values, np.ascontiguousarray(self.get_sorter().T))
+        return self.sorted_columns
+
+    def get_sorter_data(self):
+        return self.get_sorter(), self.data
 
 
 class RealtimeDataCollector:
 
     input_dataset = None  # to store a dataset for experiments
 
-    def __init__(self, num_attributes):
+    def __init__(self, num_attributes, capacity=1024, block_size=BLOCK_SIZE, publish_every=None,
+                 max_rows=None, max_age=None, compact=False):
         self.data_width = num_attributes
+        self.initial_capacity = capacity
+        self.block_size = block_size
 
-        # container for storing/accessing data/sorter as arrays
-        self.arrays_tuple = ([], [])
+        # in compact mode the data is stored as float32, and snapshots have compact sorters, as in run_dataset
+        self.compact = compact
+        self.dtype = np.dtype(np.float32 if compact else float)
 
-        # setup empty lists
-        self.data_lists = []
-        self.sort_lists = []
-        self.setup_lists()
+        # only the last max_rows rows, and the rows from the last max_age seconds, are kept
+        self.max_rows = max_rows
+        self.max_age = max_age
 
-    def setup_lists(self):
+        # a new snapshot is published every publish_every rows, as well as whenever a reader asks for one
+        self.publish_every = publish_every
+        self.publish_requested = False
+
+        # the lock is held by the writer while changing the data, and by a reader only to publish a snapshot
+        #   when no writer has it, so readers never wait for it
+        self.lock = threading.Lock()
+
+        # setup empty storage
+        self.length = 0
+        self.first_id = 0
+        self.buffer_first_id = 0
+        self.columns = None
+        self.times = None
+        self.block_values = []
+        self.block_ids = []
+        self.block_counts = []
+        self.block_maxes = []
+        self.block_owned = []
+        self.version = 0
+        self.snapshot = None  # the most recently published RealtimeSnapshot
+        self.setup_storage()
+
+    def setup_storage(self):
         """
-        INTENT: Set up empty lists for data and sorter.
+        INTENT: Set up empty column buffers and sorted columns for data and sorter.
+
+        POSTCONDITION 1: the data is kept in a (data_width, capacity) buffer, one row per column of the dataset,
+            next to a buffer of the time each row was added. Each row has an id which counts up from 0
+            and is not reused. The rows in use have ids from first_id, and are at first_id - buffer_first_id
+            in the buffers.
+        POST 2: each column is also kept sorted, as a list of blocks of values and ids, with the largest
+            value of each block in block_maxes to find the block for a new value by bisection.
+            Each block has room for 2 * block_size rows, of which the first block_counts are in use.
+        POST 3: an empty snapshot is published
         """
-        # clear lists just in case
-        self.data_lists = []
-        self.sort_lists = []
+        with self.lock:
+            self.length = 0
+            self.first_id = 0
+            self.buffer_first_id = 0
 
-        # fill empty lists with empty lists
-        for i in range(self.data_width):
-            self.sort_lists.append([])
-            self.data_lists.append([])
+            # ---- POST 1
+            self.columns = np.empty((self.data_width, self.initial_capacity), self.dtype)
+            self.times = np.empty(self.initial_capacity)
+
+            # ---- POST 2
+            self.block_values = [[np.empty(2 * self.block_size, self.dtype)] for i in range(self.data_width)]
+            self.block_ids = [[np.empty(2 * self.block_size, np.intp)] for i in range(self.data_width)]
+            self.block_counts = [[0] for i in range(self.data_width)]
+            self.block_maxes = [[] for i in range(self.data_width)]
+            self.block_owned = [[True] for i in range(self.data_width)]
+
+            # ---- POST 3
+            self.version += 1
+            self.publish()
 
     def full_dataset(self, ds):
         self.input_dataset = ds
@@ -40,7 +166,7 @@ class RealtimeDataCollector:
     # make a thread object, start it with thread.run (or thread.start?)
     def realtime_data_input(self):
         """
-        INTENT: Add data to the data_ and sort_lists in simulated "real time."
+        INTENT: Add data to the column buffers and sorted columns in simulated "real time."
 
         PRECONDITION 1: self.input_dataset contains a dataset
 
@@ -49,7 +175,7 @@ class RealtimeDataCollector:
         """
         # prime class variables for the dataset
         self.data_width = self.input_dataset.shape[1]
-        self.setup_lists()
+        self.setup_storage()
 
         # ---- POST 1
         for i in range(self.input_dataset.shape[0]):  # rows
@@ -61,58 +187,593 @@ class RealtimeDataCollector:
             #   since there is no point in adding more data after there are no more queries.
             time.sleep(0.23)
 
-    def add_datum(self, a_datum):
+    def add_datum(self, a_datum, timestamp=None):
         """
-        INTENT: Add a a_datum to the data_lists and sort_lists.
+        INTENT: Add a_datum to the column buffers and sorted columns.
 
         PRE 1: a_datum is a list or array of len() == self.data_width.
+        PRE 2: timestamp is the time of a_datum in seconds, no earlier than the data before it,
+            or None for the current time
 
-        POSTCONDITION 1: The a_datum's index is sorted into sort_lists.
-        POST 2: The a_datum is appended to the data_lists.
-        POST 3: The most recent in-sync pair of data/sorter is saved to the tuple for external access.
+        POSTCONDITION 1: The a_datum is appended to the column buffers, which grow when they are full.
+        POST 2: The a_datum's index is sorted into each sorted column, before any equal values,
+            which is where a stable search of the data would put it.
+        POST 3: Rows beyond max_rows, or older than max_age before timestamp, are removed.
+        POST 4: A new snapshot is published if a reader asked for one, or publish_every rows have been added.
         """
-        datum_id = len(self.data_lists[0])
+        with self.lock:
+            datum_id = self.first_id + self.length
+
+            # ---- POST 1
+            self.reserve(1)
+            row = datum_id - self.buffer_first_id
+            self.columns[:, row] = a_datum
+            self.times[row] = time.time() if timestamp is None else timestamp
 
-        if len(self.data_lists[0]) > 0:
-            # the item is sorted into the sort_lists and then added to the data_lists
+            # ---- POST 2
             for i in range(self.data_width):
-                index = np.searchsorted(self.data_lists[i], a_datum[i], sorter=self.sort_lists[i])
+                self.insert_sorted(i, self.columns[i, row], datum_id)
 
-                # ---- POST 1
-                # edge case: new index is at the end
-                if index == len(self.sort_lists[i]):
-                    self.sort_lists[i].append(datum_id)
-                else:
-                    self.sort_lists[i].insert(index, datum_id)
+            self.length += 1
+            self.version += 1
 
-                # ---- POST 2
-                self.data_lists[i].append(a_datum[i])
-        # edge case: adding the first item to the lists (POST 1 and 2)
-        else:
+            # ---- POST 3
+            self.apply_retention(self.times[row])
+
+            # ---- POST 4
+            self.publish_if_due()
+
+    def add_batch(self, rows, timestamps=None):
+        """
+        INTENT: Add several rows at once, with the same result as adding each of them in order with add_datum.
+
+        PRE 1: rows is a 2D list or array with rows of len() == self.data_width.
+        PRE 2: timestamps is a non-decreasing list of the times of the rows, as for add_datum,
+            or None for the current time
+
+        POSTCONDITION 1: The rows are appended to the column buffers, which grow until they fit.
+        POST 2: Each column of the rows is sorted once and merged into the sorted column, see merge_sorted.
+        POST 3: Rows beyond max_rows, or older than max_age before the last timestamp, are removed.
+        POST 4: A new snapshot is published if a reader asked for one, or publish_every rows have been added.
+        """
+        rows = np.asarray(rows, dtype=self.dtype).reshape(-1, self.data_width)
+        if len(rows) == 0:
+            return
+
+        with self.lock:
+            first_id = self.first_id + self.length
+
+            # ---- POST 1
+            self.reserve(len(rows))
+            first_row = first_id - self.buffer_first_id
+            self.columns[:, first_row:first_row + len(rows)] = rows.T
+            self.times[first_row:first_row + len(rows)] = time.time() if timestamps is None else timestamps
+
+            # ---- POST 2
+            batch_ids = np.arange(first_id, first_id + len(rows))
             for i in range(self.data_width):
-                self.data_lists[i].append(a_datum[i])
-                self.sort_lists[i].append(0)
+                self.merge_sorted(i, self.columns[i, first_row:first_row + len(rows)], batch_ids)
+
+            self.length += len(rows)
+            self.version += 1
+
+            # ---- POST 3
+            self.apply_retention(self.times[first_row + len(rows) - 1])
+
+            # ---- POST 4
+            self.publish_if_due()
+
+    def reserve(self, num_new_rows):
+        """
+        INTENT: Make sure the buffers have room for num_new_rows after the last row.
+
+        PRE 1: the caller holds self.lock
+
+        POSTCONDITION 1: if there is not enough room, the rows in use are moved to the start of new buffers,
+            leaving out any removed rows. The old buffers are not changed, since snapshots may be using them.
+        POST 2: the new buffers are doubled in size as many times as needed to fit the rows. If rows have been
+            removed, they are made at least twice the size needed, so that they are not moved again too soon.
+        """
+        start = self.first_id - self.buffer_first_id
+        num_rows = self.length + num_new_rows
+        capacity = self.columns.shape[1]
+
+        # ---- POST 1
+        if start + num_rows > capacity:
+            # ---- POST 2
+            while capacity < num_rows or (start > 0 and capacity < 2 * num_rows):
+                capacity = 2 * max(capacity, 1)
+
+            larger_columns = np.empty((self.data_width, capacity), self.dtype)
+            larger_columns[:, :self.length] = self.columns[:, start:start + self.length]
+            larger_times = np.empty(capacity)
+            larger_times[:self.length] = self.times[start:start + self.length]
+
+            self.columns, self.times = larger_columns, larger_times
+            self.buffer_first_id = self.first_id
+
+    def apply_retention(self, now):
+        """
+        INTENT: Remove the oldest rows, so that there are no more than max_rows,
+            and none from more than max_age seconds before now.
+
+        PRE 1: the caller holds self.lock
+        """
+        num_removed = 0
+        if self.max_rows is not None:
+            num_removed = max(0, self.length - self.max_rows)
+        if self.max_age is not None:
+            start = self.first_id - self.buffer_first_id
+            num_removed = max(num_removed,
+                              np.searchsorted(self.times[start:start + self.length], now - self.max_age))
+
+        if num_removed > 0:
+            self.remove_oldest(int(num_removed))
+
+    def expire(self, now=None):
+        """
+        INTENT: Remove the rows older than max_age seconds before now, for when no data has been added for a while.
+
+        PRE 1: now is a time in the same units as the timestamps of the data, or None for the current time
+        """
+        with self.lock:
+            self.apply_retention(time.time() if now is None else now)
+
+    def remove_oldest(self, num_rows):
+        """
+        INTENT: Remove the num_rows oldest rows from the data.
+
+        PRE 1: the caller holds self.lock
+
+        POSTCONDITION 1: their ids are removed from each sorted column, see remove_sorted
+        POST 2: the rows are left in the buffers, which stop using them, until they are moved by reserve
+        """
+        start = self.first_id - self.buffer_first_id
+
+        # ---- POST 1
+        for i in range(self.data_width):
+            self.remove_sorted(i, self.columns[i, start:start + num_rows], self.first_id + num_rows)
+
+        # ---- POST 2
+        self.first_id += num_rows
+        self.length -= num_rows
+        self.version += 1
+
+    def insert_sorted(self, column, value, datum_id):
+        """
+        INTENT: Insert datum_id into the sorted blocks of a column, in O(log n) comparisons
+            and a shift of part of a single block.
+
+        PRE 1: the caller holds self.lock
+
+        POSTCONDITION 1: the block is the first one whose largest value is at least value (or the last block),
+            so every value in the blocks before it is smaller
+        POST 2: if the block is part of a published snapshot, it is copied before being changed
+        POST 3: the value is inserted into that block before any equal values, shifting the rest of the block up
+        POST 4: a block which is full is split into two
+        """
+        values_list, ids_list = self.block_values[column], self.block_ids[column]
+        counts, maxes, owned = self.block_counts[column], self.block_maxes[column], self.block_owned[column]
+
+        # ---- POST 1
+        b = min(bisect_left(maxes, value), len(counts) - 1)
+
+        # ---- POST 2
+        if not owned[b]:
+            values_list[b], ids_list[b] = values_list[b].copy(), ids_list[b].copy()
+            owned[b] = True
+        values, ids, count = values_list[b], ids_list[b], counts[b]
 
         # ---- POST 3
-        self.arrays_tuple = (np.array(self.sort_lists).transpose(), np.array(self.data_lists).transpose())
+        index = values[:count].searchsorted(value)
+        values[index + 1:count + 1] = values[index:count]
+        values[index] = value
+        ids[index + 1:count + 1] = ids[index:count]
+        ids[index] = datum_id
+        count += 1
+
+        # ---- POST 4
+        if count == len(values):
+            half = self.block_size
+            values_list.insert(b + 1, np.empty_like(values))
+            values_list[b + 1][:half] = values[half:]
+            ids_list.insert(b + 1, np.empty_like(ids))
+            ids_list[b + 1][:half] = ids[half:]
+            owned.insert(b + 1, True)
+            counts[b:b + 1] = [half, half]
+            maxes[b:b + 1] = [values[half - 1], values[-1]]
+        else:
+            counts[b] = count
+            if b == len(maxes):
+                maxes.append(values[count - 1])
+            else:
+                maxes[b] = values[count - 1]
+
+    def merge_sorted(self, column, batch_values, batch_ids):
+        """
+        INTENT: Merge a batch of values into the sorted blocks of a column, copying only the blocks which change.
+
+        PRE 1: the caller holds self.lock
+        PRE 2: batch_ids are the increasing ids of batch_values, all larger than the ids already in the column
+
+        POSTCONDITION 1: the batch is sorted by value, and by id from largest to smallest for equal values,
+            which is the order that adding the rows one at a time would leave them in
+        POST 2: each value goes to the same block as insert_sorted would choose, before any equal values
+        POST 3: each block receiving values is merged with them, in place if there is room and the block is not
+            shared with a snapshot, or else into new arrays which are cut into blocks of block_size rows
+        """
+        values_list, ids_list = self.block_values[column], self.block_ids[column]
+        counts, maxes, owned = self.block_counts[column], self.block_maxes[column], self.block_owned[column]
+
+        # ---- POST 1
+        order = np.lexsort((-batch_ids, batch_values))
+        batch_values, batch_ids = batch_values[order], batch_ids[order]
+
+        # ---- POST 2
+        batch_blocks = np.minimum(np.searchsorted(np.array(maxes), batch_values), len(counts) - 1)
+        group_starts = np.flatnonzero(np.diff(batch_blocks, prepend=-1))
+        group_ends = np.append(group_starts[1:], len(batch_values))
+
+        # ---- POST 3
+        # going from the last block back, so that the block numbers before each one stay the same
+        for start, end in zip(group_starts[::-1].tolist(), group_ends[::-1].tolist()):
+            b = batch_blocks[start]
+            count = counts[b]
+            indices = values_list[b][:count].searchsorted(batch_values[start:end]).tolist()
+
+            # a block with room left is merged in place, after being copied if it is shared with a snapshot
+            if count + end - start < 2 * self.block_size:
+                if not owned[b]:
+                    values_list[b], ids_list[b] = values_list[b].copy(), ids_list[b].copy()
+                    owned[b] = True
+                values, ids = values_list[b], ids_list[b]
+
+                # a few values are cheaper to shift in one at a time from the back, like insert_sorted
+                if end - start <= 8:
+                    for j in range(end - start - 1, -1, -1):
+                        index = indices[j]
+                        values[index + j + 1:count + j + 1] = values[index:count]
+                        values[index + j] = batch_values[start + j]
+                        ids[index + j + 1:count + j + 1] = ids[index:count]
+                        ids[index + j] = batch_ids[start + j]
+                        count = index
+                else:
+                    values[:count + end - start] = np.insert(values[:count], indices, batch_values[start:end])
+                    ids[:count + end - start] = np.insert(ids[:count], indices, batch_ids[start:end])
+                counts[b] += end - start
+                if b == len(maxes):
+                    maxes.append(values[counts[b] - 1])
+                else:
+                    maxes[b] = values[counts[b] - 1]
+                continue
+
+            values = np.insert(values_list[b][:count], indices, batch_values[start:end])
+            ids = np.insert(ids_list[b][:count], indices, batch_ids[start:end])
+            new_values, new_ids, new_counts = [], [], []
+            for cut in range(0, len(values), self.block_size):
+                new_counts.append(min(self.block_size, len(values) - cut))
+                new_values.append(np.empty(2 * self.block_size, self.dtype))
+                new_values[-1][:new_counts[-1]] = values[cut:cut + self.block_size]
+                new_ids.append(np.empty(2 * self.block_size, np.intp))
+                new_ids[-1][:new_counts[-1]] = ids[cut:cut + self.block_size]
+
+            values_list[b:b + 1] = new_values
+            ids_list[b:b + 1] = new_ids
+            counts[b:b + 1] = new_counts
+            owned[b:b + 1] = [True] * len(new_counts)
+            maxes[b:b + 1] = [block[count - 1] for block, count in zip(new_values, new_counts)]
+
+    def remove_sorted(self, column, removed_values, first_kept_id):
+        """
+        INTENT: Remove the ids before first_kept_id from the sorted blocks of a column.
+
+        PRE 1: the caller holds self.lock
+        PRE 2: removed_values are the values of the column for all of the ids before first_kept_id
+
+        POSTCONDITION 1: since equal values are kept from the newest to the oldest, the removed ids of a value
+            are the last ones with that value, so the blocks are searched back from the block where its values end,
+            until as many have been removed as the value has in removed_values
+        POST 2: the rest of a block is moved down in place, after copying it if it is shared with a snapshot
+        POST 3: a block which is left empty is removed, unless it is the only block
+        """
+        values_list, ids_list = self.block_values[column], self.block_ids[column]
+        counts, maxes, owned = self.block_counts[column], self.block_maxes[column], self.block_owned[column]
+
+        if len(removed_values) == 1:
+            removed_counts = [(float(removed_values[0]), 1)]
+        else:
+            unique_values, unique_counts = np.unique(removed_values, return_counts=True)
+            removed_counts = zip(unique_values.tolist(), unique_counts.tolist())
+
+        for value, num_left in removed_counts:
+            # ---- POST 1
+            b = min(bisect_right(maxes, value), len(counts) - 1)
+            while num_left > 0 and b >= 0:
+                count = counts[b]
+                end = int(values_list[b][:count].searchsorted(value, 'right'))
+                start = max(int(values_list[b][:end].searchsorted(value)), end - num_left)
+                num_left -= end - start
+
+                # ---- POST 3
+                if end - start == count and len(counts) > 1:
+                    del values_list[b], ids_list[b], counts[b], maxes[b], owned[b]
+
+                # ---- POST 2
+                elif end > start:
+                    if not owned[b]:
+                        values_list[b], ids_list[b] = values_list[b].copy(), ids_list[b].copy()
+                        owned[b] = True
+                    values, ids = values_list[b], ids_list[b]
+                    values[start:count - end + start] = values[end:count]
+                    ids[start:count - end + start] = ids[end:count]
+                    counts[b] = count - end + start
+                    if counts[b] > 0:
+                        maxes[b] = values[counts[b] - 1]
+                    else:
+                        maxes.clear()
+                b -= 1
+
+    def publish_if_due(self):
+        """
+        INTENT: Publish a snapshot if a reader asked for one, or publish_every rows have been added since the last.
+
+        PRE 1: the caller holds self.lock
+        """
+        num_added = (self.first_id + self.length) - (self.snapshot.first_id + self.snapshot.length)
+        if self.publish_requested or (self.publish_every is not None and num_added >= self.publish_every):
+            self.publish()
+
+    def publish(self):
+        """
+        INTENT: Publish a snapshot of the current version of the data for readers.
+
+        PRE 1: the caller holds self.lock
+
+        POSTCONDITION 1: the snapshot shares the column buffers and sorted blocks rather than copying them,
+            so publishing takes time in proportion to the number of blocks, not the number of rows
+        POST 2: every block is marked as shared, so that the next change to it is made on a copy
+        POST 3: the snapshot has the base_fuzzy of its data, as from get_base_fuzzy
+        """
+        # ---- POST 1, POST 3
+        start = self.first_id - self.buffer_first_id
+        self.snapshot = RealtimeSnapshot(self.version, self.columns[:, start:start + self.length].T,
+                                         self.base_fuzzy(), self.first_id,
+                                         [list(values_list) for values_list in self.block_values],
+                                         [list(ids_list) for ids_list in self.block_ids],
+                                         [list(counts) for counts in self.block_counts], self.compact)
+        self.publish_requested = False
+
+        # ---- POST 2
+        self.block_owned = [[False] * len(counts) for counts in self.block_counts]
+
+    def base_fuzzy(self):
+        """
+        INTENT: find the base_fuzzy of the data from the ends of the sorted columns, rather than searching the data
+
+        PRE 1: the caller holds self.lock
+
+        RETURN: the same column ranges as get_base_fuzzy, or None if there is no data
+        """
+        if self.length == 0:
+            return None
+
+        min_per_col = np.array([values_list[0][0] for values_list in self.block_values])[:-1]
+        max_per_col = np.array([maxes[-1] for maxes in self.block_maxes])[:-1]
+        base_fuzzy = max_per_col - min_per_col
+        base_fuzzy[base_fuzzy == 0] = 0.000001  # as in get_base_fuzzy
+        return base_fuzzy
+
+    def get_snapshot(self):
+        """
+        INTENT: get the most recent snapshot of the data without waiting for the writer
+
+        POSTCONDITION 1: if the data has changed since the last snapshot and the writer is not busy,
+            a new snapshot is published straight away
+        POST 2: if the writer is busy, it is asked to publish a snapshot when it finishes adding,
+            and the last snapshot is returned in the meantime
+
+        RETURN: a RealtimeSnapshot, which stays valid and unchanged as more data is added
+        """
+        if self.snapshot.version != self.version:
+            # ---- POST 1
+            if self.lock.acquire(blocking=False):
+                try:
+                    self.publish()
+                finally:
+                    self.lock.release()
+            # ---- POST 2
+            else:
+                self.publish_requested = True
+
+        return self.snapshot
 
     def get_sorter_data(self):
         """
         INTENT: get the data and sorter at the same time to control threading issues
         """
-        return self.arrays_tuple
+        return self.get_snapshot().get_sorter_data()
 
     def get_data(self):
         """
         INTENT: Get the data as a numpy array.
         """
-        return np.array(self.data_lists).transpose()
+        return self.get_snapshot().data
 
     def get_sorter(self):
         """
         INTENT: Get the sorter as a numpy array.
         """
-        return np.array(self.sort_lists).transpose()
+        return self.get_snapshot().get_sorter()
+
+
+class RealtimeDataCollectorTests(unittest.TestCase):
+
+    def test_add_datum(self):
+        rng = np.random.default_rng(11)
+        some_data = np.round(rng.random((300, 3)) * 8)  # many equal values
+        stream_collector = RealtimeDataCollector(3, capacity=5, block_size=4)
+        data_lists, sort_lists = [[], [], []], [[], [], []]
+        for row in some_data:
+            stream_collector.add_datum(row)
+
+            # the original list based insertion
+            for i in range(3):
+                index = np.searchsorted(data_lists[i], row[i], sorter=sort_lists[i]) if data_lists[i] else 0
+                sort_lists[i].insert(index, len(data_lists[i]))
+                data_lists[i].append(row[i])
+
+        sorter, data = stream_collector.get_sorter_data()
+        assert(np.array_equal(data, some_data))
+        assert(np.array_equal(sorter, np.array(sort_lists).transpose()))
+        assert(np.array_equal(stream_collector.get_sorter(), sorter))
+
+    def test_add_batch(self):
+        from dataset_preprocessing import get_base_fuzzy
+
+        rng = np.random.default_rng(13)
+        some_data = np.round(rng.random((500, 3)) * 5)  # many equal values
+        some_data[:20, 1] = 2.0  # a constant column at first
+
+        for block_size in (4, 16):
+            row_collector = RealtimeDataCollector(3, capacity=2, block_size=block_size)
+            batch_collector = RealtimeDataCollector(3, capacity=2, block_size=block_size)
+
+            start = 0
+            snapshots = []
+            for batch_size in (1, 7, 0, 30, 2, 100, 13, 347):
+                for row in some_data[start:start + batch_size]:
+                    row_collector.add_datum(row)
+                batch_collector.add_batch(some_data[start:start + batch_size])
+                start += batch_size
+
+                sorter, data = batch_collector.get_sorter_data()
+                assert(np.array_equal(data, some_data[:start]))
+                assert(np.array_equal(sorter, row_collector.get_sorter()))
+                snapshots.append((batch_collector.get_snapshot(), sorter.copy()))
+                if start > 0:
+                    assert(np.array_equal(batch_collector.get_snapshot().base_fuzzy, get_base_fuzzy(data)))
+                    assert(np.array_equal(row_collector.get_snapshot().base_fuzzy, get_base_fuzzy(data)))
+
+            # the blocks of earlier snapshots were not changed by the later batches
+            for snapshot, sorter in snapshots:
+                assert(np.array_equal(snapshot.get_sorted_columns()[1], sorter.T))
+
+            # rows added one at a time after a batch go to the right blocks
+            for row in some_data[:40]:
+                row_collector.add_datum(row)
+                batch_collector.add_datum(row)
+            assert(np.array_equal(batch_collector.get_sorter(), row_collector.get_sorter()))
+
+    def test_retention(self):
+        rng = np.random.default_rng(14)
+        some_data = np.round(rng.random((400, 3)) * 4)  # many equal values
+        some_data[:, 1] = 1.0  # a constant column, whose equal values span every block
+
+        stream_collector = RealtimeDataCollector(3, capacity=4, block_size=4, max_rows=50)
+        old_snapshots = []
+        start = 0
+        for batch_size in (1, 1, 30, 1, 70, 3, 100, 1, 1, 192):
+            if batch_size == 1:
+                stream_collector.add_datum(some_data[start])
+            else:
+                stream_collector.add_batch(some_data[start:start + batch_size])
+            start += batch_size
+
+            # the same as a collector given only the rows which are kept
+            kept_data = some_data[max(0, start - 50):start]
+            kept_collector = RealtimeDataCollector(3)
+            kept_collector.add_batch(kept_data)
+
+            snapshot = stream_collector.get_snapshot()
+            assert(np.array_equal(snapshot.data, kept_data))
+            assert(np.array_equal(snapshot.get_sorter(), kept_collector.get_sorter()))
+            assert(np.array_equal(snapshot.base_fuzzy, kept_collector.get_snapshot().base_fuzzy))
+            old_snapshots.append((snapshot, snapshot.get_sorter().copy(), kept_data))
+
+        # the buffers were moved as rows were removed, but the snapshots were not changed
+        for snapshot, sorter, kept_data in old_snapshots:
+            assert(np.array_equal(snapshot.data, kept_data))
+            assert(np.array_equal(snapshot.get_sorted_columns()[1], sorter.T))
+        assert(stream_collector.columns.shape[1] <= 512)
+
+        # time based retention
+        stream_collector = RealtimeDataCollector(3, block_size=4, max_age=10)
+        for t in range(30):
+            stream_collector.add_datum(some_data[t], timestamp=t)
+        assert(np.array_equal(stream_collector.get_data(), some_data[19:30]))
+        stream_collector.add_batch(some_data[30:40], timestamps=np.arange(30, 40) + 0.5)
+        assert(np.array_equal(stream_collector.get_data(), some_data[30:40]))
+
+        stream_collector.expire(now=100)
+        assert(stream_collector.get_snapshot().length == 0)
+        assert(stream_collector.get_snapshot().base_fuzzy is None)
+        stream_collector.add_batch(some_data[40:45], timestamps=[100] * 5)
+        kept_collector = RealtimeDataCollector(3)
+        kept_collector.add_batch(some_data[40:45])
+        assert(np.array_equal(stream_collector.get_sorter(), kept_collector.get_sorter()))
+
+    def test_snapshots(self):
+        rng = np.random.default_rng(12)
+        some_data = np.round(rng.random((200, 4)) * 6)
+        stream_collector = RealtimeDataCollector(4, capacity=3, block_size=4)
+        for row in some_data[:50]:
+            stream_collector.add_datum(row)
+        snapshot = stream_collector.get_snapshot()
+        sorter = snapshot.get_sorter().copy()
+
+        # a snapshot is not changed by later data, even though it shares blocks with the collector
+        for row in some_data[50:120]:
+            stream_collector.add_datum(row)
+        assert(snapshot.length == 50)
+        assert(np.array_equal(snapshot.get_sorter(), sorter))
+        assert(np.array_equal(snapshot.data, some_data[:50]))
+
+        # nor can a reader change it
+        sorted_values, sorted_indices = snapshot.get_sorted_columns()
+        for an_array in (snapshot.data, snapshot.get_sorter(), sorted_values, sorted_indices):
+            assert(not an_array.flags.writeable)
+            with self.assertRaises(ValueError):
+                an_array[0, 0] = 1
+        assert(np.array_equal(snapshot.get_sorter(), sorter) and np.array_equal(snapshot.data, some_data[:50]))
+
+        # a reader does not wait while the writer holds the lock, but gets the last snapshot,
+        #   and the writer publishes a new one once it has added its row
+        with stream_collector.lock:
+            assert(stream_collector.get_snapshot() is snapshot)
+        stream_collector.add_datum(some_data[120])
+        assert(stream_collector.snapshot.length == 121)
+
+        # publishing on a cadence
+        stream_collector = RealtimeDataCollector(4, publish_every=25)
+        for row in some_data[:60]:
+            stream_collector.add_datum(row)
+        assert(stream_collector.snapshot.length == 50)
+
+        sorted_values, sorted_indices = stream_collector.get_snapshot().get_sorted_columns()
+        assert(np.array_equal(sorted_indices, stream_collector.get_sorter().T))
+        assert(np.array_equal(sorted_values, np.take_along_axis(some_data[:60].T, sorted_indices, axis=1)))
+
+    def test_compact(self):
+        rng = np.random.default_rng(20)
+        some_data = np.round(rng.random((150, 4)) * 6)
+        collector = RealtimeDataCollector(4, capacity=8, block_size=4, max_rows=100)
+        compact_collector = RealtimeDataCollector(4, capacity=8, block_size=4, max_rows=100, compact=True)
+        for row in some_data[:20]:
+            collector.add_datum(row)
+            compact_collector.add_datum(row)
+        collector.add_batch(some_data[20:])
+        compact_collector.add_batch(some_data[20:])
+
+        # the values are stored and sorted as float32 throughout, and the sorter is as small as it can be
+        snapshot = compact_collector.get_snapshot()
+        assert(snapshot.data.dtype == np.float32 and snapshot.base_fuzzy.dtype == np.float32)
+        assert(snapshot.get_sorter().dtype == np.uint8)
+        assert(snapshot.get_sorted_columns()[0].dtype == np.float32)
+        assert(np.array_equal(snapshot.data, collector.get_data()))
+        assert(np.array_equal(snapshot.get_sorter(), collector.get_sorter()))
+        for an_array in (snapshot.data, snapshot.get_sorter()) + snapshot.get_sorted_columns():
+            with self.assertRaises(ValueError):
+                an_array[0, 0] = 0
 
 
 if __name__ == '__main__':
@@ -124,8 +785,6 @@ if __name__ == '__main__':
     for row in arr:
         stream_collector.add_datum(row)
 
-    print("data:", stream_collector.data_lists)
     print("data as array:\n", stream_collector.get_data())
     print()
-    print("sorter:", stream_collector.sort_lists)
     print("sorter as array:\n", stream_collector.get_sorter())
@@ -46,16 +46,18 @@ def setup_realtime_collector(train_set):
     return collector
 
 
-def query_input(an_input, the_dataset, the_sorter):
+def query_input(an_input, the_dataset, the_sorter, base_fuzzy=None):
     """
     INTENT: Query a current iteration of the real-time dataset with a single input.
 
     PRECONDITION 1: an_input could be a line of the_dataset.
     PRE 2: the_sorter is an index table for the_dataset.
+    PRE 3: base_fuzzy is the base_fuzzy of the_dataset, e.g. from a collector snapshot, or None to find it here
 
     POSTCONDITION 1: the_database is queried with an_input and the output is returned.
     """
-    base_fuzzy = dataset_preprocessing.get_base_fuzzy(the_dataset)
+    if base_fuzzy is None:
+        base_fuzzy = dataset_preprocessing.get_base_fuzzy(the_dataset)
 
     alpha, indices = get_alpha(an_input, the_dataset, the_sorter, base_fuzzy, 1, 10)
     return get_output(an_input, the_dataset, base_fuzzy * alpha, indices)
@@ -70,7 +72,7 @@ def send_test_set(test_set):
         portion is the training set, which is populating the realtime collector.
 
     POSTCONDITION 1: The collector is accessed to retrieve the current version of
-        the sorter and dataset.
+        the sorter, dataset and base_fuzzy.
     POST 2: Each line of the test_set is given as input to the current version of the dataset.
     POST 3: Each time a query is made, the result is printed, with a note indicating if it is correct.
     POST 4: The thread is paused between queries.
@@ -80,10 +82,10 @@ def send_test_set(test_set):
 
         # ---- POST 1
         global collector
-        sorter, data = collector.get_sorter_data()
+        snapshot = collector.get_snapshot()
 
         # ---- POST 2
-        output = query_input(line[:-1], data, sorter)
+        output = query_input(line[:-1], snapshot.data, snapshot.get_sorter(), snapshot.base_fuzzy)
         success = abs(target - output) < 0.5
 
         # ---- POST 3
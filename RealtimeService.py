@@ -0,0 +1,345 @@
+"""
+Answer queries on a real-time dataset from an asyncio service.
+
+Queries which arrive within a short window of each other are answered together with one batched
+hyperbox search and output calculation, rather than one at a time, so that a burst of queries
+does not queue up behind itself.
+"""
+import asyncio
+import json
+import numpy as np
+import unittest
+
+from get_alpha_sorted import get_alpha_batch
+from marz_get_output import get_output_batch
+
+
+def query_snapshot(inputs, snapshot, num_data_points, max_iterations=10):
+    """
+    INTENT: Query a snapshot of a RealtimeDataCollector with many inputs at once.
+
+    PRECONDITION 1: inputs is a 2D array with one input per row, each a line of the data without its target.
+    PRE 2: snapshot is a RealtimeSnapshot, as from RealtimeDataCollector.get_snapshot
+
+    POSTCONDITION 1: the hyperboxes of all of the inputs are found with get_alpha_batch, searching the sorted columns
+        of the snapshot, which keep their types in compact mode
+    POST 2: the outputs of all of the inputs are found with get_output_batch
+
+    RETURN: an array with the output for each input, which are 0 if the snapshot has no data
+    """
+    if snapshot.length == 0:
+        return np.zeros(len(inputs))
+
+    # ---- POST 1
+    alphas, offsets, indices = get_alpha_batch(inputs, snapshot.data, None, snapshot.base_fuzzy, num_data_points,
+                                               max_iterations, sorted_columns=snapshot.get_sorted_columns())
+
+    # ---- POST 2
+    return get_output_batch(inputs, snapshot.data, snapshot.base_fuzzy * alphas[:, None], offsets, indices)
+
+
+class QueryService:
+    """
+    An asyncio service which answers queries on a RealtimeDataCollector, batching the queries that arrive
+    within window seconds of the first one waiting, up to max_batch at a time.
+    Queries are made in-process with query, or over a unix socket with serve_unix.
+    """
+
+    def __init__(self, collector, num_data_points=1, max_iterations=10, window=0.002, max_batch=256):
+        self.collector = collector
+        self.num_data_points = num_data_points
+        self.max_iterations = max_iterations
+        self.window = window
+        self.max_batch = max_batch
+
+        self.queue = None
+        self.batch_task = None
+        self.num_batches = 0  # for checking how well queries are being batched
+
+    def start(self):
+        """
+        INTENT: Start batching queries in the running event loop.
+        """
+        self.queue = asyncio.Queue()
+        self.batch_task = asyncio.get_running_loop().create_task(self.run_batches())
+
+    async def stop(self):
+        """
+        INTENT: Stop batching queries, once the queries that are waiting have been answered.
+        """
+        await self.queue.join()
+        self.batch_task.cancel()
+        try:
+            await self.batch_task
+        except asyncio.CancelledError:
+            pass
+
+    async def query(self, an_input):
+        """
+        INTENT: Query the current data of the collector with a single input.
+
+        PRECONDITION 1: an_input could be a line of the dataset, without its target.
+
+        POSTCONDITION 1: an input of the wrong shape raises ValueError here, and is never batched with other queries
+
+        RETURN: the output for an_input
+        """
+        # ---- POST 1
+        an_input = np.asarray(an_input, dtype=float)
+        num_features = self.collector.data_width - 1
+        if an_input.shape != (num_features,):
+            raise ValueError(f"expected an input of {num_features} features, not of shape {an_input.shape}")
+
+        result = asyncio.get_running_loop().create_future()
+        await self.queue.put((an_input, result))
+        return await result
+
+    async def next_batch(self):
+        """
+        INTENT: Wait for the next batch of queries.
+
+        POSTCONDITION 1: the batch starts with the next query to arrive
+        POST 2: the queries already waiting are taken straight away, and then any more that arrive
+            before window seconds have passed, until there are max_batch
+
+        RETURN: a list of (input, result) pairs
+        """
+        loop = asyncio.get_running_loop()
+
+        # ---- POST 1
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+
+        # ---- POST 2
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def run_batches(self):
+        """
+        INTENT: Answer the queries one batch at a time, until cancelled.
+
+        POSTCONDITION 1: each batch is queried against a single snapshot of the collector,
+            in a worker thread so that the event loop can keep taking queries
+        POST 2: each query is given its own output, or the error if the batch failed,
+            and the batch is marked done whatever happens, so that stop never waits for it
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+
+            try:
+                # ---- POST 1
+                inputs = np.stack([an_input for an_input, result in batch])
+                outputs = await loop.run_in_executor(None, query_snapshot, inputs, self.collector.get_snapshot(),
+                                                     self.num_data_points, self.max_iterations)
+            except Exception as error:
+                # ---- POST 2
+                for an_input, result in batch:
+                    if not result.done():
+                        result.set_exception(error)
+            else:
+                # ---- POST 2
+                for (an_input, result), output in zip(batch, outputs):
+                    if not result.done():
+                        result.set_result(float(output))
+            finally:
+                self.num_batches += 1
+                for i in range(len(batch)):
+                    self.queue.task_done()
+
+    async def handle_connection(self, reader, writer):
+        """
+        INTENT: Answer the queries from one socket connection.
+
+        PRECONDITION 1: each line sent is a JSON list of the numbers of one input
+
+        POSTCONDITION 1: the queries of a connection are all queued as they arrive, so they can be batched
+        POST 2: the outputs are written back as one line each, in the order of the queries.
+            A line which is not valid JSON, or whose query fails, is answered with a line of {"error": message}.
+        POST 3: the writer is stopped and the connection closed however the reading ends
+        """
+        loop = asyncio.get_running_loop()
+        outputs = asyncio.Queue()
+
+        async def write_outputs():
+            while True:
+                output = await outputs.get()
+                if output is None:
+                    break
+                # ---- POST 2
+                try:
+                    answer = await output
+                except Exception as error:
+                    answer = {'error': str(error)}
+                writer.write((json.dumps(answer) + '\n').encode())
+                await writer.drain()
+
+        writing = loop.create_task(write_outputs())
+
+        try:
+            # ---- POST 1
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    output = asyncio.ensure_future(self.query(json.loads(line)))
+                except ValueError as error:  # including json.JSONDecodeError
+                    output = loop.create_future()
+                    output.set_exception(error)
+                await outputs.put(output)
+        finally:
+            # ---- POST 3
+            await outputs.put(None)
+            try:
+                await writing
+            finally:
+                writer.close()
+                await writer.wait_closed()
+
+    async def serve_unix(self, path):
+        """
+        INTENT: Answer queries from a unix socket at path, as well as in-process.
+
+        RETURN: the asyncio server, which can be closed to stop taking connections
+        """
+        return await asyncio.start_unix_server(self.handle_connection, path)
+
+
+class QueryServiceTests(unittest.TestCase):
+
+    def setUp(self):
+        from RealtimeDataCollector import RealtimeDataCollector
+
+        rng = np.random.default_rng(15)
+        self.some_data = np.round(rng.random((300, 5)) * 10)
+        self.collector = RealtimeDataCollector(5)
+        self.collector.add_batch(self.some_data)
+        self.inputs = rng.random((60, 4)) * 10
+
+    def expected_outputs(self, num_data_points):
+        from dataset_preprocessing import generate_index_table, get_base_fuzzy
+        from get_alpha_sorted import get_alpha
+        from marz_get_output import get_output
+
+        index_table = generate_index_table(self.some_data)
+        base_fuzzy = get_base_fuzzy(self.some_data)
+        expected = []
+        for an_input in self.inputs:
+            alpha, indices = get_alpha(an_input, self.some_data, index_table, base_fuzzy, num_data_points)
+            expected.append(get_output(an_input, self.some_data, base_fuzzy * alpha, indices))
+        return np.array(expected)
+
+    def test_query(self):
+        async def run_queries():
+            service = QueryService(self.collector, num_data_points=3, window=0.05)
+            service.start()
+            outputs = await asyncio.gather(*[service.query(an_input) for an_input in self.inputs])
+            await service.stop()
+            return np.array(outputs), service.num_batches
+
+        outputs, num_batches = asyncio.run(run_queries())
+        assert(np.allclose(outputs, self.expected_outputs(3)))
+        assert(num_batches < len(self.inputs))
+
+    def test_serve_unix(self):
+        import os
+        import tempfile
+
+        async def run_queries(path):
+            service = QueryService(self.collector, num_data_points=2)
+            service.start()
+            server = await service.serve_unix(path)
+
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(''.join(json.dumps(an_input.tolist()) + '\n' for an_input in self.inputs).encode())
+            writer.write_eof()
+            outputs = [json.loads(line) async for line in reader]
+            writer.close()
+
+            server.close()
+            await server.wait_closed()
+            await service.stop()
+            return np.array(outputs)
+
+        with tempfile.TemporaryDirectory() as directory:
+            outputs = asyncio.run(run_queries(os.path.join(directory, 'marz.sock')))
+        assert(np.allclose(outputs, self.expected_outputs(2)))
+
+    def test_bad_queries(self):
+        import os
+        import tempfile
+
+        async def run_queries(path):
+            service = QueryService(self.collector, num_data_points=2, window=0.05)
+            service.start()
+
+            # a query of the wrong shape fails alone, and the queries batched around it are still answered
+            results = await asyncio.gather(*[service.query(an_input) for an_input in self.inputs[:10]],
+                                           service.query([1.0, 2.0]),
+                                           *[service.query(an_input) for an_input in self.inputs[10:]],
+                                           return_exceptions=True)
+            assert(isinstance(results[10], ValueError))
+            assert(np.allclose(results[:10] + results[11:], self.expected_outputs(2)))
+
+            server = await service.serve_unix(path)
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(b'[1, 2\n[1, 2]\n' + (json.dumps(self.inputs[0].tolist()) + '\n').encode())
+            writer.write_eof()
+            lines = [json.loads(line) async for line in reader]
+            writer.close()
+
+            server.close()
+            await server.wait_closed()
+            await asyncio.wait_for(service.stop(), 5)
+            return lines
+
+        with tempfile.TemporaryDirectory() as directory:
+            lines = asyncio.run(run_queries(os.path.join(directory, 'marz.sock')))
+        assert(len(lines) == 3 and 'error' in lines[0] and 'error' in lines[1])
+        assert(np.isclose(lines[2], self.expected_outputs(2)[0]))
+
+
+if __name__ == '__main__':
+    """
+    INTENT: Run the realtime experiment on the digits dataset, sending bursts of queries to the service.
+
+    POSTCONDITION 1: The collector is set up with the training set, and fills in a thread as in RealtimeQuery.
+    POST 2: Each second, a burst of queries from the testing set is sent to the service at once,
+        and the accuracy and time taken of each burst are printed.
+    """
+    import threading
+    import time
+
+    from RealtimeQuery import split_dataset, setup_realtime_collector
+    from DatasetSelection import DatasetSelection
+
+    async def send_bursts(collector, testing_set, burst_size=20):
+        service = QueryService(collector)
+        service.start()
+        for start in range(0, len(testing_set), burst_size):
+            burst = testing_set[start:start + burst_size]
+            start_time = time.perf_counter()
+            outputs = await asyncio.gather(*[service.query(line[:-1]) for line in burst])
+            seconds = time.perf_counter() - start_time
+
+            num_correct = np.count_nonzero(np.abs(burst[:, -1] - outputs) < 0.5)
+            print(f" \t{num_correct} of {len(burst)} correct with {collector.get_snapshot().length} datapoints,"
+                  f" in {seconds * 1000:.1f} ms")
+            await asyncio.sleep(1)
+        await service.stop()
+
+    # ---- POST 1
+    training_set, testing_set = split_dataset(DatasetSelection('digits').dataset)
+    collector = setup_realtime_collector(training_set)
+    threading.Thread(target=collector.realtime_data_input, daemon=True).start()
+
+    # ---- POST 2
+    asyncio.run(send_bursts(collector, testing_set))
@@ -16,7 +16,8 @@ from sklearn.metrics import r2_score, mean_squared_error
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-from run_dataset import run_dataset, preprocessing
+from run_dataset import run_dataset
+from prepared_model import load_or_prepare
 
 
 # read data from file
@@ -28,10 +29,10 @@ pd.set_option('display.max_columns', None)
 print(df.describe().transpose())
 print("\ntargets range:", df['Decibels'].max() - df['Decibels'].min())
 
-data = df.to_numpy()
-
 start = time.time()
-index_table, base_fuzzy = preprocessing(data)
+# the sorted data is saved the first time, and loaded from then on until the data file changes
+data, index_table, base_fuzzy, unused_sorted_columns, unused_metadata = load_or_prepare(
+    'prepared/airfoil', 'airfoil_self_noise.dat', lambda path: df.to_numpy())
 
 y_actual, y_predicted = run_dataset(data, index_table, base_fuzzy, points=2, close_threshold=2)
 end = time.time()
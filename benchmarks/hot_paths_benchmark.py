@@ -0,0 +1,256 @@
+"""
+Benchmark the hot paths of MaRz over the number of rows, features and data points, and write the results as JSON,
+so that the results of two versions can be compared to find regressions.
+
+Run from the root of the repository, e.g.
+
+    python benchmarks/hot_paths_benchmark.py --output results.json
+    python benchmarks/hot_paths_benchmark.py --quick --compare results.json
+
+Synthetic datasets are made for every size in the grid, and the bundled airfoil and ozone datasets are run as well.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, 'LTC_experiments'))
+from dataset_preprocessing import generate_index_table, generate_sorted_columns, get_base_fuzzy  # noqa: E402
+from marz_get_output import get_output  # noqa: E402
+from run_dataset import run_dataset  # noqa: E402
+from RealtimeDataCollector import RealtimeDataCollector  # noqa: E402
+import get_alpha_exact  # noqa: E402
+import get_alpha_sorted  # noqa: E402
+import get_alpha_tree  # noqa: E402
+import get_alpha_unsorted  # noqa: E402
+
+
+RESULTS_FORMAT = 1
+
+
+def synthetic_dataset(num_rows, num_features, seed=23):
+    """
+    INTENT: make a random dataset of num_rows, with num_features and a target column, with some repeated values
+
+    RETURN: the dataset
+    """
+    rng = np.random.default_rng(seed)
+    some_data = rng.random((num_rows, num_features + 1))
+    some_data[:, ::3] = np.round(some_data[:, ::3] * 20)  # every third column has ties, as in real data
+    return some_data
+
+
+def bundled_datasets():
+    """
+    INTENT: load the datasets which are part of the repository, formatted for MaRz
+
+    RETURN: a dict of the name and dataset of each one that is there
+    """
+    datasets = {}
+    airfoil_path = os.path.join(ROOT, 'airfoil_self_noise.dat')
+    if os.path.exists(airfoil_path):
+        datasets['airfoil'] = np.loadtxt(airfoil_path, skiprows=1)
+
+    ozone_path = os.path.join(ROOT, 'LTC_experiments', 'data', 'ozone', 'eighthr.data')
+    if os.path.exists(ozone_path):
+        from dataset_loaders import parse_ozone
+        ozone = parse_ozone(ozone_path)
+        datasets['ozone'] = np.concatenate((ozone['x'], ozone['y'][:, None]), axis=1)
+
+    return datasets
+
+
+def measure(function, repeats):
+    """
+    INTENT: time function, taking the best of a few runs so that other work on the machine counts for less
+
+    RETURN: a dict of the best and median seconds of the runs
+    """
+    seconds = []
+    for repeat in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start_time)
+    return {'seconds': min(seconds), 'median_seconds': float(np.median(seconds)), 'repeats': repeats}
+
+
+def benchmark_dataset(name, some_data, points_list, num_queries, repeats):
+    """
+    INTENT: benchmark every hot path on one dataset
+
+    POSTCONDITION 1: preprocessing is timed once for the whole dataset
+    POST 2: each engine of get_alpha, and get_output, are timed on the same num_queries rows,
+        each left out of its own hyperbox where the engine can do so.
+        The unsorted engine is slow on large datasets, so it is only run on up to 10000 rows,
+        and the tree engine is only run on up to 10 features, as it is meant for few features.
+    POST 3: run_dataset is timed leaving out each of num_queries rows in turn
+    POST 4: RealtimeDataCollector.add_datum is timed adding up to 20000 rows, one at a time
+
+    RETURN: a list of dicts of the results, each with its benchmark, dataset, shape and number of points.
+        The seconds of the query benchmarks are for all num_queries queries.
+    """
+    num_rows, width = some_data.shape
+    results = []
+
+    def record(benchmark, function, num_points=None, num_calls=1):
+        result = {'benchmark': benchmark, 'dataset': name, 'rows': num_rows, 'features': width - 1,
+                  'points': num_points, 'calls': num_calls}
+        result.update(measure(function, repeats))
+        results.append(result)
+        print(f"{benchmark:>31} {name:>10} {num_rows:>8} x {width - 1:<4} points {str(num_points):>4}: "
+              f"{result['seconds'] * 1000:10.2f} ms")
+
+    # ---- POST 1
+    record('generate_index_table', lambda: generate_index_table(some_data))
+    record('get_base_fuzzy', lambda: get_base_fuzzy(some_data))
+    index_table = generate_index_table(some_data)
+    sorted_columns = generate_sorted_columns(some_data, index_table)
+    base_fuzzy = get_base_fuzzy(some_data)
+    tree_index = get_alpha_tree.generate_tree_index(some_data, base_fuzzy) if width - 1 <= 10 else None
+
+    rows = np.random.default_rng(0).choice(num_rows, min(num_queries, num_rows), replace=False)
+    for num_points in points_list:
+        # ---- POST 2
+        def run_queries(query):
+            return lambda: [query(i) for i in rows]
+
+        def get_alpha_sorted_query(i, **options):
+            return get_alpha_sorted.get_alpha(some_data[i, :-1], some_data, index_table, base_fuzzy, num_points,
+                                              exclude_index=i, **options)
+
+        record('get_alpha_sorted', run_queries(get_alpha_sorted_query), num_points, len(rows))
+        record('get_alpha_sorted_counting', run_queries(lambda i: get_alpha_sorted_query(i, intersection='counting')),
+               num_points, len(rows))
+        record('get_alpha_sorted_columns', run_queries(lambda i: get_alpha_sorted_query(
+            i, sorted_columns=sorted_columns)), num_points, len(rows))
+        record('get_alpha_exact', run_queries(lambda i: get_alpha_exact.get_alpha(
+            some_data[i, :-1], some_data, base_fuzzy, num_points, exclude_index=i)), num_points, len(rows))
+        if tree_index is not None:
+            record('get_alpha_tree', run_queries(lambda i: get_alpha_tree.get_alpha(
+                some_data[i, :-1], some_data, tree_index, base_fuzzy, num_points, exclude_index=i)),
+                   num_points, len(rows))
+        if num_rows <= 10000:
+            record('get_alpha_unsorted', run_queries(lambda i: get_alpha_unsorted.get_alpha(
+                some_data[i, :-1], some_data, base_fuzzy, num_points, 10)), num_points, len(rows))
+
+        boxes = [get_alpha_sorted.get_alpha(some_data[i, :-1], some_data, index_table, base_fuzzy, num_points,
+                                            exclude_index=i) for i in rows]
+        record('get_output', lambda: [get_output(some_data[i, :-1], some_data, base_fuzzy * alpha, indices)
+                                      for i, (alpha, indices) in zip(rows, boxes)], num_points, len(rows))
+
+        # ---- POST 3
+        def run_leave_one_out():
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_dataset(some_data, index_table, base_fuzzy, points=num_points,
+                            step=max(1, num_rows // num_queries))
+        record('run_dataset', run_leave_one_out, num_points, len(range(0, num_rows, max(1, num_rows // num_queries))))
+
+    # ---- POST 4
+    added_rows = some_data[:20000]
+
+    def add_rows():
+        collector = RealtimeDataCollector(width)
+        for row in added_rows:
+            collector.add_datum(row)
+    record('RealtimeDataCollector.add_datum', add_rows, num_calls=len(added_rows))
+
+    return results
+
+
+def environment():
+    """
+    INTENT: describe the machine and version the benchmarks were run on, to store with the results
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count(), 'commit': commit or None,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+
+def compare(results, baseline, threshold):
+    """
+    INTENT: print how the results compare with the same benchmarks in an earlier results file
+
+    POSTCONDITION 1: a benchmark is flagged as a regression if it takes more than threshold times as long
+
+    RETURN: the number of regressions
+    """
+    def key(result):
+        return result['benchmark'], result['dataset'], result['rows'], result['features'], result['points']
+
+    baseline_seconds = {key(result): result['seconds'] for result in baseline['results']}
+    num_regressions = 0
+    print(f"\ncompared with {baseline['environment'].get('commit')}:")
+    for result in results:
+        if key(result) not in baseline_seconds:
+            continue
+        ratio = result['seconds'] / baseline_seconds[key(result)]
+        # ---- POST 1
+        flag = ''
+        if ratio > threshold:
+            flag = '\t<- regression'
+            num_regressions += 1
+        print(f"{result['benchmark']:>31} {result['dataset']:>10} {result['rows']:>8} x {result['features']:<4} "
+              f"points {str(result['points']):>4}: {ratio:6.2f} times as long{flag}")
+
+    return num_regressions
+
+
+if __name__ == '__main__':
+    """
+    INTENT: Run the benchmarks over the grid of sizes given on the command line.
+
+    POSTCONDITION 1: sizes with more than --max-values values are left out, so the default grid fits in memory
+    POST 2: the results are written to --output as JSON, with the environment they were run in
+    POST 3: if --compare is given, the results are compared with that file, and the exit status is 1
+        if there are any regressions
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--features', type=int, nargs='+', default=[5, 20, 100])
+    parser.add_argument('--points', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--queries', type=int, default=100, help='queries per query benchmark')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--max-values', type=int, default=2 * 10 ** 7, help='largest rows x features to run')
+    parser.add_argument('--quick', action='store_true', help='a small grid, for checking a change quickly')
+    parser.add_argument('--no-bundled', action='store_true', help='leave out the airfoil and ozone datasets')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='an earlier results file to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio counted as a regression')
+    args = parser.parse_args()
+    if args.quick:
+        args.rows, args.features, args.points, args.queries, args.repeats = [1000, 10000], [5, 20], [1, 5], 50, 1
+
+    results = []
+    # ---- POST 1
+    for num_rows in args.rows:
+        for num_features in args.features:
+            if num_rows * num_features <= args.max_values:
+                results += benchmark_dataset('synthetic', synthetic_dataset(num_rows, num_features), args.points,
+                                             args.queries, args.repeats)
+    if not args.no_bundled:
+        for name, some_data in bundled_datasets().items():
+            results += benchmark_dataset(name, some_data, args.points, args.queries, args.repeats)
+
+    # ---- POST 2
+    with open(args.output, 'w') as f:
+        json.dump({'format': RESULTS_FORMAT, 'environment': environment(), 'arguments': vars(args),
+                   'results': results}, f, indent=2)
+    print(f"results written to {args.output}")
+
+    # ---- POST 3
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(results, json.load(f), args.threshold) > 0 else 0)
@@ -0,0 +1,94 @@
+"""
+Benchmark the preprocessing of a large dataset: the time taken and peak memory of generate_index_table,
+against the original version which sorted copies of the whole dataset.
+
+Run from the root of the repository, with the household power dataset at
+LTC_experiments/data/power/household_power_consumption.txt as for power_exp.py.
+Without it, random data of the same shape is used.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataset_preprocessing import generate_index_table  # noqa: E402
+
+
+POWER_PATH = os.path.join('LTC_experiments', 'data', 'power', 'household_power_consumption.txt')
+POWER_SHAPE = (2075258, 7)
+
+
+def generate_index_table_copying(some_data):
+    """
+    INTENT: the original generate_index_table, which adds an ID column to a copy of the dataset
+        and then sorts a copy of every row for each column, for comparison
+    """
+    length = len(some_data)
+    width = len(some_data[0])
+
+    ids = np.arange(length).reshape((length, 1))
+    some_data = np.concatenate((some_data, ids), axis=1)
+
+    index_table = np.empty((length, width), int)
+    for column in range(width):
+        index_table[:, column] = some_data[some_data[:, column].argsort(kind='stable')][:, -1]
+
+    return index_table
+
+
+def load_power_dataset():
+    """
+    INTENT: load the power dataset as power_exp.py does, or random data of its shape if it is not there
+
+    RETURN: the dataset and a description of it
+    """
+    if os.path.exists(POWER_PATH):
+        sys.path.insert(0, os.path.abspath('LTC_experiments'))
+        from power_exp import load_data_from_mit
+        working_directory = os.getcwd()
+        os.chdir('LTC_experiments')
+        try:
+            return load_data_from_mit(), 'power dataset'
+        finally:
+            os.chdir(working_directory)
+
+    rng = np.random.default_rng(19)
+    return np.round(rng.random(POWER_SHAPE) * 100, 1).astype(np.float32), 'random data of the power dataset shape'
+
+
+def measure(function, *args, **kwargs):
+    """
+    INTENT: run function once, measuring its time and the peak memory it allocates
+
+    RETURN: the result, the seconds taken, and the peak memory in bytes
+    """
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start_time
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+if __name__ == '__main__':
+    """
+    INTENT: Print the time taken and the peak memory of each way of generating the index table.
+
+    POSTCONDITION 1: the results of each way are checked to be the same as the original
+    """
+    some_data, description = load_power_dataset()
+    print(f"{description}: {some_data.shape[0]} rows, {some_data.shape[1]} columns, "
+          f"{some_data.nbytes / 2 ** 20:.0f} MiB")
+
+    expected, seconds, peak = measure(generate_index_table_copying, some_data)
+    print(f"{'original':>12}: {seconds:6.2f} s, peak {peak / 2 ** 20:6.0f} MiB")
+
+    for num_threads in sorted({1, os.cpu_count() or 1}):
+        index_table, seconds, peak = measure(generate_index_table, some_data, num_threads)
+        # ---- POST 1
+        assert np.array_equal(index_table, expected)
+        print(f"{f'{num_threads} threads':>12}: {seconds:6.2f} s, peak {peak / 2 ** 20:6.0f} MiB")
@@ -1,34 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import unittest
 
 
-def generate_index_table(some_data):
+def index_dtype(length):
+    """
+    INTENT: find the smallest unsigned integer type which can hold every index of a dataset of length rows
+
+    RETURN: a numpy dtype, e.g. uint16 for up to 65536 rows
+    """
+    return np.min_scalar_type(max(length - 1, 0))
+
+
+def search_dtype(some_data):
+    """
+    INTENT: find the type to compare inputs and hyper-rectangle bounds to some_data in, so that a float32 dataset
+        is searched with float32 bounds rather than numpy copying every column it searches up to float64
+
+    RETURN: the dtype of some_data if it is a floating point type, or else float
+    """
+    return some_data.dtype if some_data.dtype.kind == 'f' else np.dtype(float)
+
+
+def compact_data(some_data):
+    """
+    INTENT: store a dataset as float32 for compact mode, halving its memory. Values are rounded to float32,
+        so results can differ slightly from those of the float64 dataset.
+
+    RETURN: some_data as a float32 array, which is some_data itself if it is one already
+    """
+    return np.asarray(some_data, dtype=np.float32)
+
+
+def generate_index_table(some_data, num_threads=1, compact=False):
     """
     INTENT: take in a dataset and generate a table of indices in which each column contains
         the indices of the data set in order as sorted by that column
 
     PRE 1: some_data is a dataset of shape (x, y) where x is the number of rows and y is the number of columns
+    PRE 2: num_threads is the number of columns to sort at once. numpy sorts without holding the GIL,
+        so on large datasets the columns sort in parallel in a thread pool.
+    PRE 3: compact is True to store the indices in the smallest unsigned integer type that holds them
+        (see index_dtype), instead of np.intp. np.searchsorted needs an np.intp sorter, so a compact table
+        must be searched through generate_sorted_columns, which keeps its type (see get_alpha_sorted.search_columns).
 
-    POST 1: an ID column is added to some_data to preserve original index order
-    POST 2: each column is stable sorted and the new order of the ID column is added to the output array
+    POST 1: each column is stable sorted with argsort, so equal values keep their original index order,
+        and its order is written into its column of the output array.
+        No copy of the dataset is made, only one column of indices per thread at a time.
 
     RETURN: a numpy array of the same size as some_data with each column containing the IDs
             of some_data in the order attained by sorting on the given column
     """
-    length = len(some_data)
-    width = len(some_data[0])
+    some_data = np.asarray(some_data)
+    length, width = some_data.shape
 
-    ids = np.arange(length).reshape((length, 1))  # generate IDs column and shape it for appending to some_data
-    some_data = np.concatenate((some_data, ids), axis=1)
+    # create an empty array of some_data.shape to store ints
+    index_table = np.empty((length, width), index_dtype(length) if compact else np.intp)
 
-    index_table = np.empty((length, width), int)  # create an empty array of some_data.shape to store ints
+    # ---- POST 1
+    def sort_column(column):  # this includes any targets
+        index_table[:, column] = np.argsort(some_data[:, column], kind='stable')
 
-    for column in range(width):  # this will exclude the new IDs column, but include any targets
-        index_table[:, column] = some_data[some_data[:, column].argsort(kind='stable')][:, -1]
+    if num_threads > 1 and width > 1:
+        with ThreadPoolExecutor(min(num_threads, width)) as pool:
+            list(pool.map(sort_column, range(width)))
+    else:
+        for column in range(width):
+            sort_column(column)
 
     return index_table
 
 
+def generate_sorted_columns(some_data, index_table):
+    """
+    INTENT: store each column of some_data already in sorted order, so it can be binary searched directly
+        instead of through index_table as a sorter
+
+    PRE 1: index_table is the index table of some_data, from generate_index_table
+
+    POST 1: the columns of index_table are copied into the rows of a C ordered array, so each one is contiguous
+    POST 2: each column of some_data is copied in the order of its index_table column, into the same shape
+
+    RETURN: the sorted values and the sorted indices, as arrays of shape (y, x) where x is the number of rows
+            and y is the number of columns of some_data, such that sorted_values[c] is some_data[:, c] sorted
+            and sorted_indices[c] is index_table[:, c]
+    """
+    some_data = np.asarray(some_data)
+
+    # ---- POST 1
+    sorted_indices = np.ascontiguousarray(np.asarray(index_table).T)
+
+    # ---- POST 2
+    sorted_values = np.empty(sorted_indices.shape, some_data.dtype)
+    for column in range(len(sorted_indices)):
+        sorted_values[column] = some_data[sorted_indices[column], column]
+
+    return sorted_values, sorted_indices
+
+
 def get_base_fuzzy(some_data):
     """
     INTENT: generate a list of column ranges for a dataset
@@ -92,6 +161,35 @@ class Tests(unittest.TestCase):
 
         output_3 = generate_index_table(self.data_set_3)
         assert(output_3.shape[1] == 3)
+        assert(list(output_3[:, 1]) == list(range(8)))  # equal values keep their order
+
+        some_data = np.round(np.random.default_rng(18).random((500, 6)) * 4)
+        output_4 = generate_index_table(some_data, num_threads=4)
+        assert(np.array_equal(output_4, generate_index_table(some_data)))
+        for column in range(6):
+            assert(np.all(np.diff(some_data[output_4[:, column], column]) >= 0))
+
+    def test_compact(self):
+        assert(index_dtype(1) == np.uint8 and index_dtype(256) == np.uint8 and index_dtype(257) == np.uint16)
+        assert(index_dtype(2 ** 32) == np.uint32 and index_dtype(2 ** 32 + 1) == np.uint64)
+
+        some_data = compact_data(np.round(np.random.default_rng(20).random((300, 4)) * 10))
+        index_table = generate_index_table(some_data, compact=True)
+        assert(index_table.dtype == np.uint16)
+        assert(np.array_equal(index_table, generate_index_table(some_data)))
+
+        sorted_values, sorted_indices = generate_sorted_columns(some_data, index_table)
+        assert(sorted_values.dtype == np.float32 and sorted_indices.dtype == np.uint16)
+        assert(get_base_fuzzy(some_data).dtype == np.float32)
+
+    def test_generate_sorted_columns(self):
+        index_table = generate_index_table(self.data_set_2)
+        sorted_values, sorted_indices = generate_sorted_columns(self.data_set_2, index_table)
+        assert(sorted_values.shape == (3, 8))
+        assert(sorted_values.flags['C_CONTIGUOUS'] and sorted_indices.flags['C_CONTIGUOUS'])
+        assert(np.all(sorted_indices == index_table.T))
+        assert(list(sorted_values[1]) == [1, 2, 3, 4, 6, 7, 8, 9])
+        assert(list(sorted_values[2]) == [1, 1, 1, 2, 2, 3, 3, 3])
 
     def test_get_base_fuzzy(self):
         output_1 = get_base_fuzzy(self.data_set_1)
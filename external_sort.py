@@ -0,0 +1,182 @@
+"""
+Build the sorted columns of a dataset which is too large to sort in memory.
+
+Each column is sorted with an external merge sort: the dataset is read a chunk of rows at a time, each chunk
+is sorted and written to disk as a run, and then the runs of each column are merged into memory mapped files.
+Only about chunk_rows values of a column are held in memory at once. The files have the same layout as
+generate_sorted_columns and the prepared models of prepared_model, so they can be passed straight to get_alpha
+as sorted_columns, with index_table=None.
+"""
+
+import os
+import tempfile
+import numpy as np
+import unittest
+
+
+def write_sorted_runs(some_data, run_directory, chunk_rows):
+    """
+    INTENT: sort each column of some_data one chunk of rows at a time, writing each sorted chunk to a run file
+
+    PRE 1: some_data is a 2D array or memory mapped array
+
+    POST 1: each chunk of rows is read from some_data once, for all of its columns
+    POST 2: each column of the chunk is stable sorted, and its values and the indices of their rows are saved
+
+    RETURN: a list for each column of the (values path, indices path) of its runs, in the order of the rows
+    """
+    length, width = some_data.shape
+    runs = [[] for column in range(width)]
+
+    for start in range(0, length, chunk_rows):
+        # ---- POST 1
+        chunk = np.asarray(some_data[start:start + chunk_rows])
+
+        # ---- POST 2
+        for column in range(width):
+            order = np.argsort(chunk[:, column], kind='stable')
+            run_path = os.path.join(run_directory, f'{column}_{start}')
+            np.save(run_path + '_values.npy', chunk[order, column])
+            np.save(run_path + '_indices.npy', order + start)
+            runs[column].append((run_path + '_values.npy', run_path + '_indices.npy'))
+
+    return runs
+
+
+def merge_runs(runs, sorted_values, sorted_indices, buffer_rows):
+    """
+    INTENT: merge sorted runs of values and indices into one sorted column
+
+    PRE 1: each run is sorted by value, and by index for equal values, as from write_sorted_runs
+    PRE 2: sorted_values and sorted_indices are (memory mapped) arrays the total length of the runs
+
+    POST 1: a buffer of up to buffer_rows is read from each run which has values left
+    POST 2: every buffered value up to the smallest last (value, index) of the buffers which do not reach the end
+        of their runs is written out, after sorting them by value and index. Any value still left in a run
+        is larger than this, so these are the next values of the merged column, in the order of a stable sort.
+    """
+    runs = [(np.load(values_path, mmap_mode='r'), np.load(indices_path, mmap_mode='r'))
+            for values_path, indices_path in runs]
+    positions = [0] * len(runs)
+    num_written = 0
+
+    while num_written < len(sorted_values):
+        # ---- POST 1
+        buffers = [(r, run_values[positions[r]:positions[r] + buffer_rows],
+                    run_indices[positions[r]:positions[r] + buffer_rows])
+                   for r, (run_values, run_indices) in enumerate(runs) if positions[r] < len(run_values)]
+
+        # ---- POST 2
+        unfinished = [(values[-1], indices[-1]) for r, values, indices in buffers
+                      if positions[r] + len(values) < len(runs[r][0])]
+        cutoff_value, cutoff_index = min(unfinished) if unfinished else (None, None)
+
+        merge_values, merge_indices = [], []
+        for r, values, indices in buffers:
+            num_taken = len(values)
+            if cutoff_value is not None:
+                low, high = np.searchsorted(values, cutoff_value), np.searchsorted(values, cutoff_value, 'right')
+                num_taken = low + np.searchsorted(indices[low:high], cutoff_index, 'right')
+            merge_values.append(values[:num_taken])
+            merge_indices.append(indices[:num_taken])
+            positions[r] += num_taken
+
+        merge_values, merge_indices = np.concatenate(merge_values), np.concatenate(merge_indices)
+        order = np.lexsort((merge_indices, merge_values))
+        sorted_values[num_written:num_written + len(order)] = merge_values[order]
+        sorted_indices[num_written:num_written + len(order)] = merge_indices[order]
+        num_written += len(order)
+
+
+def generate_sorted_columns_on_disk(some_data, directory, chunk_rows=2 ** 20):
+    """
+    INTENT: build the sorted columns of some_data in directory, as generate_sorted_columns does in memory
+
+    PRE 1: some_data is a 2D array, and may be memory mapped, e.g. with np.load(path, mmap_mode='r')
+    PRE 2: chunk_rows is the number of rows to sort in memory at once
+
+    POST 1: the sorted runs of every column are written to a temporary directory inside directory,
+        which is removed afterwards
+    POST 2: the runs of each column are merged into row c of sorted_values.npy and sorted_indices.npy,
+        reading about chunk_rows values from the runs at once
+
+    RETURN: the sorted values and sorted indices, memory mapped read only, in the same layout as
+        generate_sorted_columns returns
+    """
+    length, width = some_data.shape
+    os.makedirs(directory, exist_ok=True)
+    values_path = os.path.join(directory, 'sorted_values.npy')
+    indices_path = os.path.join(directory, 'sorted_indices.npy')
+
+    sorted_values = np.lib.format.open_memmap(values_path, 'w+', some_data.dtype, (width, length))
+    sorted_indices = np.lib.format.open_memmap(indices_path, 'w+', np.intp, (width, length))
+
+    with tempfile.TemporaryDirectory(dir=directory) as run_directory:
+        # ---- POST 1
+        runs = write_sorted_runs(some_data, run_directory, chunk_rows)
+
+        # ---- POST 2
+        for column in range(width):
+            buffer_rows = max(1, chunk_rows // max(1, len(runs[column])))
+            merge_runs(runs[column], sorted_values[column], sorted_indices[column], buffer_rows)
+
+    sorted_values.flush()
+    sorted_indices.flush()
+    del sorted_values, sorted_indices
+
+    return np.load(values_path, mmap_mode='r'), np.load(indices_path, mmap_mode='r')
+
+
+def get_base_fuzzy_sorted(sorted_values):
+    """
+    INTENT: find the base fuzzy of a dataset from its sorted columns, without reading the whole dataset
+
+    RETURN: the same ranges as get_base_fuzzy, in the same type, from the first and last values of each sorted
+        feature column, e.g. float32 for compact data, so the bounds of get_alpha stay in that type
+    """
+    base_fuzzy = np.asarray(sorted_values[:-1, -1] - sorted_values[:-1, 0])
+    base_fuzzy[base_fuzzy == 0] = 0.000001  # as in get_base_fuzzy
+    return base_fuzzy
+
+
+class ExternalSortTests(unittest.TestCase):
+
+    def test_generate_sorted_columns_on_disk(self):
+        from dataset_preprocessing import compact_data, generate_index_table, generate_sorted_columns, get_base_fuzzy
+        from get_alpha_sorted import get_alpha
+
+        rng = np.random.default_rng(17)
+        some_data = np.round(rng.random((1000, 4)) * 6)  # many equal values across the runs
+        some_data[:, 1] = 2.0
+
+        with tempfile.TemporaryDirectory() as directory:
+            np.save(os.path.join(directory, 'data.npy'), some_data)
+            mapped_data = np.load(os.path.join(directory, 'data.npy'), mmap_mode='r')
+
+            index_table = generate_index_table(some_data)
+            expected = generate_sorted_columns(some_data, index_table)
+            for chunk_rows in (1000, 128, 7):
+                sorted_columns = generate_sorted_columns_on_disk(mapped_data, directory, chunk_rows)
+                assert(np.array_equal(sorted_columns[0], expected[0]))
+                assert(np.array_equal(sorted_columns[1], expected[1]))
+
+            base_fuzzy = get_base_fuzzy_sorted(sorted_columns[0])
+            assert(np.array_equal(base_fuzzy, get_base_fuzzy(some_data)))
+            assert(type(base_fuzzy) is np.ndarray and base_fuzzy.dtype == get_base_fuzzy(some_data).dtype)
+
+            # the mapped data and sorted columns are queried directly
+            for i in range(0, 1000, 97):
+                assert(get_alpha(mapped_data[i, :-1], mapped_data, None, base_fuzzy, 3, exclude_index=i,
+                                 sorted_columns=sorted_columns) ==
+                       get_alpha(some_data[i, :-1], some_data, index_table, base_fuzzy, 3, exclude_index=i))
+            del mapped_data, sorted_columns
+
+            # float32 data keeps its type, as with get_base_fuzzy
+            compact = compact_data(some_data)
+            np.save(os.path.join(directory, 'compact.npy'), compact)
+            mapped_compact = np.load(os.path.join(directory, 'compact.npy'), mmap_mode='r')
+            sorted_columns = generate_sorted_columns_on_disk(mapped_compact, os.path.join(directory, 'compact'), 128)
+            base_fuzzy = get_base_fuzzy_sorted(sorted_columns[0])
+            assert(base_fuzzy.dtype == get_base_fuzzy(compact).dtype == np.float32)
+            assert(np.array_equal(base_fuzzy, get_base_fuzzy(compact)))
+            del mapped_compact, sorted_columns
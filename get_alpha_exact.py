@@ -0,0 +1,110 @@
+import numpy as np
+import unittest
+
+
+def box_distances(an_input, some_data, base_fuzzy):
+    """
+    INTENT: find the smallest alpha for which each row of some_data is inside the hyper-rectangle around an_input
+
+    PRE 1: an_input is the size of one row of some_data, without the target
+    PRE 2: base_fuzzy is a list of positive column ranges of some_data, as from get_base_fuzzy
+
+    POST 1: for each row, the largest of |an_input[c] - row[c]| / base_fuzzy[c] over the columns c is found,
+        one column at a time so that no temporary copy of the whole dataset is made
+
+    RETURN: an array with the distance of each row of some_data, in the units of alpha
+    """
+    distances = np.zeros(len(some_data))
+    for c in range(len(an_input)):
+        np.maximum(distances, np.abs(some_data[:, c] - an_input[c]) / base_fuzzy[c], out=distances)
+
+    return distances
+
+
+def get_alpha(an_input, some_data, base_fuzzy, num_data_points, exclude_index=None):
+    """
+    INTENT: find the exact alpha value which multiplies base_fuzzy to create the smallest hyper-rectangle
+        around an_input within some_data which contains num_data_points of records.
+        Unlike the bisecting get_alpha versions, this takes a single pass and does not depend on max_iterations.
+
+    PRECONDITION 1: some_data is a list of rows of data, consisting of numbers, with targets in the last column
+    PRECONDITION 2: an_input is a list of numbers in the same scope as rows in some_data
+    PRECONDITION 3: base_fuzzy contains the positive ranges of values in each column of some_data
+    PRECONDITION 4: num_data_points is a positive integer
+    PRECONDITION 5: exclude_index is None, or the index of a row of some_data to leave out
+
+    POST_CONDITION 1: a row is inside the hyper-rectangle of alpha exactly when its box_distance is at most alpha,
+        so the smallest alpha holding num_data_points rows is the num_data_points-th smallest box_distance,
+        which is found with a partial selection rather than a full sort
+    POST_CONDITION 2: every row within that alpha is returned, which is num_data_points rows plus any ties
+
+    RETURNS: the exact alpha value, such that the hyper-rectangle includes the rows on its boundary
+    RETURNS: a sorted list of the indices within some_data inside that hyper-rectangle
+    """
+    if not isinstance(some_data, np.ndarray):
+        some_data = np.array(some_data)
+
+    distances = box_distances(an_input, some_data, base_fuzzy)
+    if exclude_index is not None:
+        distances[exclude_index] = np.inf
+
+    num_available = len(distances) - (exclude_index is not None)
+    if num_data_points <= 0 or num_available <= 0:
+        return 0.0, []
+
+    # ---- POST 1
+    k = min(num_data_points, num_available)
+    alpha = np.partition(distances, k - 1)[k - 1]
+
+    # ---- POST 2
+    return float(alpha), np.flatnonzero(distances <= alpha).tolist()
+
+
+class GetAlphaTests(unittest.TestCase):
+
+    def test_get_alpha(self):
+        some_data_2 = [[1, 9, 1],
+                       [2, 8, 1],
+                       [3, 7, 1],
+                       [4, 6, 2],
+                       [6, 4, 2],
+                       [7, 3, 3],
+                       [8, 2, 3],
+                       [9, 1, 3]]
+
+        alpha, indices = get_alpha([5, 5], some_data_2, [8, 8], 4)
+        assert(alpha == 2 / 8)
+        assert(indices == [2, 3, 4, 5])
+
+        # ties are all included, and there is no point closer than 1 / 8 to leave out
+        alpha, indices = get_alpha([5, 5], some_data_2, [8, 8], 1)
+        assert(alpha == 1 / 8)
+        assert(indices == [3, 4])
+
+        alpha, indices = get_alpha([6, 4], some_data_2, [8, 8], 1, exclude_index=4)
+        assert(alpha == 1 / 8)
+        assert(indices == [5])
+
+        # asking for more points than there are gives all of them
+        alpha, indices = get_alpha([5, 5], some_data_2, [8, 8], 20, exclude_index=0)
+        assert(indices == [1, 2, 3, 4, 5, 6, 7])
+
+    def test_get_alpha_is_smallest_box(self):
+        rng = np.random.default_rng(6)
+        some_data = np.round(rng.random((300, 6)) * 10)
+        base_fuzzy = np.ptp(some_data, axis=0)[:-1]
+
+        for i in range(0, 300, 7):
+            an_input = some_data[i, :-1]
+            distances = np.max(np.abs(some_data[:, :-1] - an_input) / base_fuzzy, axis=1)
+            for num_data_points in (1, 3, 10):
+                alpha, indices = get_alpha(an_input, some_data, base_fuzzy, num_data_points, exclude_index=i)
+                in_box = distances <= alpha
+                in_box[i] = False
+                assert(indices == np.flatnonzero(in_box).tolist())
+                assert(len(indices) >= num_data_points)
+
+                # any smaller box holds too few points
+                smaller = distances < alpha
+                smaller[i] = False
+                assert(np.count_nonzero(smaller) < num_data_points)
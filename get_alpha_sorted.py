@@ -1,7 +1,237 @@
+import time
+
 from dataset_preprocessing import *
+import get_alpha_exact
+
+
+def search_columns(some_data, index_table, sorted_columns=None):
+    """
+    INTENT: choose what get_alpha binary searches, and the type of the bounds searched for, so that numpy
+        never has to convert the columns or the sorter on a search
+
+    PRE 1: some_data is a numpy array, and index_table and sorted_columns are as for get_alpha
+
+    POST 1: if sorted_columns are given, their values are searched directly, and the sorted indices are used
+        as the index_table, as a view whose columns are contiguous
+    POST 2: otherwise index_table is used as the sorter, which np.searchsorted needs as np.intp. A compact
+        index_table of another integer type would be copied to np.intp on every search, so it raises ValueError,
+        and should be passed as sorted_columns (see generate_sorted_columns) instead.
+
+    RETURN: the sorted values (or None), the index_table, and the type of the bounds, which is that of the columns
+    """
+    # ---- POST 1
+    if sorted_columns is not None:
+        sorted_values = sorted_columns[0]
+        return sorted_values, sorted_columns[1].T, search_dtype(sorted_values)
+
+    # ---- POST 2
+    index_table = np.asarray(index_table)
+    if index_table.dtype != np.intp:
+        raise ValueError(f"An index_table of {index_table.dtype} would be copied to {np.dtype(np.intp)} on every "
+                         f"search; pass generate_sorted_columns of it as sorted_columns instead")
+    return None, index_table, search_dtype(some_data)
+
+
+def column_ranges(some_data, index_table, min_fuzzy, max_fuzzy, exclude_index=None, sorted_values=None):
+    """
+    INTENT: binary search each column of some_data for the range of the hyper-rectangle from min_fuzzy to max_fuzzy
+
+    PRE 1: index_table is the look-up table of some_data, as for get_alpha
+    PRE 2: min_fuzzy and max_fuzzy are the lower and upper bounds of the hyper-rectangle for each input column
+    PRE 3: sorted_values is None, or the sorted values from generate_sorted_columns, which are searched directly
+        rather than through index_table as a sorter
+
+    POST 1: for each column c, index_table[table_low[c]:table_high[c], c] are the indices of the rows
+        with min_fuzzy[c] <= value < max_fuzzy[c]
+    POST 2: if no rows are below max_fuzzy[c] (e.g. the column has all the same value), the whole column is included,
+        including when the excluded row is the only one below max_fuzzy[c]
+
+    RETURN: arrays of table_low and table_high, and a boolean array which is True for the whole columns
+    """
+    data_width = len(min_fuzzy)
+    table_low = np.empty(data_width, np.intp)
+    table_high = np.empty(data_width, np.intp)
+
+    # ---- POST 1
+    for c in range(data_width):
+        if sorted_values is None:
+            table_low[c] = np.searchsorted(some_data[:, c], min_fuzzy[c], sorter=index_table[:, c])
+            table_high[c] = np.searchsorted(some_data[:, c], max_fuzzy[c], sorter=index_table[:, c])
+        else:
+            table_low[c] = np.searchsorted(sorted_values[c], min_fuzzy[c])
+            table_high[c] = np.searchsorted(sorted_values[c], max_fuzzy[c])
+
+    # ---- POST 2
+    whole_column = (table_high == 0) | ((table_high == 1) & (index_table[0, :data_width] == exclude_index))
+    table_high[whole_column] = len(some_data)
+
+    return table_low, table_high, whole_column
+
+
+def intersect_ranges(index_table, table_low, table_high, exclude_index=None, column_counts=None):
+    """
+    INTENT: find the indices within every column range from column_ranges, searching the whole index_table
+
+    PRE 1: column_counts is None, or a list to append the number of candidates to after each column
+
+    POST 1: the intersection starts from the narrowest range and takes the columns in order of range size,
+        so the candidates are as few as possible from the start, and the columns which include
+        every row are not intersected at all
+
+    RETURN: an array of the indices in the hyper-rectangle, except for exclude_index
+    """
+    # ---- POST 1
+    range_sizes = table_high - table_low
+    order = np.argsort(range_sizes, kind='stable')
+    order = order[range_sizes[order] < len(index_table)]
+    if len(order) == 0:  # every column includes every row
+        order = [0]
+
+    candidate_indices = index_table[table_low[order[0]]:table_high[order[0]], order[0]]
+    if exclude_index is not None:
+        candidate_indices = candidate_indices[candidate_indices != exclude_index]
+    if column_counts is not None:
+        column_counts.append(len(candidate_indices))
+
+    for c in order[1:]:
+        candidate_indices = np.intersect1d(candidate_indices, index_table[table_low[c]:table_high[c], c],
+                                           assume_unique=True)
+        if column_counts is not None:
+            column_counts.append(len(candidate_indices))
+        # stop looking if a hyperbox with no contents is found
+        if len(candidate_indices) == 0:
+            break
+
+    return candidate_indices
+
+
+def count_ranges(index_table, ranges, num_data_points, in_range, exclude_index=None, column_counts=None):
+    """
+    INTENT: find the indices within every column range from column_ranges, like intersect_ranges,
+        but with a boolean scratch buffer instead of sorting and merging with np.intersect1d
+
+    PRE 1: ranges are the table_low, table_high and whole_column arrays from column_ranges
+    PRE 2: in_range is a boolean array with an entry for each row of the index_table, all False
+    PRE 3: column_counts is None, or a list to append the number of candidates to after each column
+
+    POST 1: the columns are processed from the narrowest range to the widest, skipping whole columns
+    POST 2: for each column, in_range is set for its range, the candidates are filtered with it,
+        and then it is cleared again, so it can be reused for the next column or call
+    POST 3: the search stops early once there are fewer than num_data_points candidates left,
+        since the hyperbox cannot have enough points after that
+
+    RETURN: an array of the indices in the hyper-rectangle (or some of them, if it stopped early),
+        and whether the search was completed
+    """
+    table_low, table_high, whole_column = ranges
+
+    # ---- POST 1
+    order = [c for c in np.argsort(table_high - table_low, kind='stable') if not whole_column[c]]
+    if len(order) == 0:  # every column is whole
+        order = [0]
+
+    candidate_indices = index_table[table_low[order[0]]:table_high[order[0]], order[0]]
+    if exclude_index is not None:
+        candidate_indices = candidate_indices[candidate_indices != exclude_index]
+    if column_counts is not None:
+        column_counts.append(len(candidate_indices))
+
+    for c in order[1:]:
+        # ---- POST 3
+        if len(candidate_indices) < num_data_points:
+            return candidate_indices, False
+
+        # ---- POST 2
+        index_range = index_table[table_low[c]:table_high[c], c]
+        in_range[index_range] = True
+        candidate_indices = candidate_indices[in_range[candidate_indices]]
+        in_range[index_range] = False
+        if column_counts is not None:
+            column_counts.append(len(candidate_indices))
+
+    return candidate_indices, True
+
+
+def refine_candidates(candidate_indices, some_data, min_fuzzy, max_fuzzy, whole_column, column_counts=None):
+    """
+    INTENT: find the indices within a hyper-rectangle by checking only candidate_indices, rather than some_data
+
+    PRE 1: candidate_indices holds every index within the hyper-rectangle from min_fuzzy to max_fuzzy,
+        e.g. those of a bigger hyper-rectangle around the same input
+    PRE 2: whole_column is from column_ranges for min_fuzzy and max_fuzzy
+    PRE 3: column_counts is None, or a list to append the number of candidates to after each column
+
+    RETURN: an array of the candidate_indices within the hyper-rectangle
+    """
+    for c in np.flatnonzero(~whole_column):
+        values = some_data[candidate_indices, c]
+        candidate_indices = candidate_indices[(values >= min_fuzzy[c]) & (values < max_fuzzy[c])]
+        if column_counts is not None:
+            column_counts.append(len(candidate_indices))
+        if len(candidate_indices) == 0:
+            break
 
+    return candidate_indices
 
-def get_alpha(an_input, some_data, index_table, base_fuzzy, num_data_points, max_iterations=10):
+
+def should_grow(old_ranges, new_ranges):
+    """
+    INTENT: decide whether grow_candidates will be cheaper than intersect_ranges for a bigger hyper-rectangle
+
+    PRE 1: old_ranges and new_ranges are from column_ranges, for a smaller and a bigger hyper-rectangle
+
+    RETURN: True if they have the same whole columns (see grow_candidates) and the new parts of the index_table
+        that grow_candidates would look at are smaller than the narrowest new column range
+    """
+    old_low, old_high, old_whole = old_ranges
+    new_low, new_high, new_whole = new_ranges
+    if not np.array_equal(old_whole, new_whole):
+        return False
+
+    new_parts_size = np.sum(((old_low - new_low) + (new_high - old_high))[~new_whole])
+    return new_parts_size < np.min(new_high - new_low)
+
+
+def grow_candidates(candidate_indices, old_ranges, new_ranges, some_data, index_table, min_fuzzy, max_fuzzy,
+                    exclude_index=None, column_counts=None):
+    """
+    INTENT: find the indices within a hyper-rectangle which contains a smaller one, whose indices are known
+
+    PRE 1: candidate_indices are the indices within the smaller hyper-rectangle, from which old_ranges were found
+    PRE 2: old_ranges and new_ranges are from column_ranges, and have the same whole columns
+    PRE 3: column_counts is None, or a list to append the number of candidates to after each column: the old
+        candidates and the new ones left after checking that column, before the new ones are made unique
+
+    POST 1: any new index must be outside an old column range, but inside the new one, so only those parts
+        of the index_table are looked at and then checked against the other columns
+    POST 2: an index can be in the new parts of more than one column, so the few that are left are made unique
+
+    RETURN: an array of the indices in the bigger hyper-rectangle
+    """
+    old_low, old_high, whole_column = old_ranges
+    new_low, new_high = new_ranges[:2]
+
+    # ---- POST 1
+    new_parts = [candidate_indices[:0]]
+    for c in np.flatnonzero(~whole_column):
+        new_parts.append(index_table[new_low[c]:old_low[c], c])
+        new_parts.append(index_table[old_high[c]:new_high[c], c])
+    new_counts = None if column_counts is None else []
+    new_indices = refine_candidates(np.concatenate(new_parts), some_data, min_fuzzy, max_fuzzy, whole_column,
+                                    new_counts)
+    if column_counts is not None:
+        column_counts.extend(len(candidate_indices) + count for count in new_counts)
+
+    # ---- POST 2
+    new_indices = np.unique(new_indices)
+    if exclude_index is not None:
+        new_indices = new_indices[new_indices != exclude_index]
+
+    return np.concatenate((candidate_indices, new_indices))
+
+
+def get_alpha(an_input, some_data, index_table, base_fuzzy, num_data_points, max_iterations=10,
+              exclude_index=None, exact=False, sorted_columns=None, intersection='intersect1d', stats=None):
     """
     INTENT: use binary search methods to quickly find the hyper-rectangle of some_data which contains
         an_input and num_data_points data points, as defined by an alpha value which multiplies base_fuzzy
@@ -12,64 +242,261 @@ def get_alpha(an_input, some_data, index_table, base_fuzzy, num_data_points, max
     PRE 3: num_data_points is an integer less than the number of rows in some_data
     PRE 4: base_fuzzy is a list of the differences between max and min of each column of some data
     PRE 5: max_iterations is an integer greater than 0
-
-    POST 1: the index_table is used to enable binary search of the dataset for each parameter of an_input
+    PRE 6: exclude_index is None, or the index of a row of some_data to leave out, e.g. the row of an_input
+    PRE 7: exact is True to use get_alpha_exact instead of searching, in which case index_table is not used
+    PRE 8: sorted_columns is None, or the sorted values and indices from generate_sorted_columns,
+        in which case index_table is not used
+    PRE 9: intersection is 'intersect1d' to intersect the column ranges with intersect_ranges,
+        or 'counting' to use count_ranges
+    PRE 10: some_data may be float32, as in compact mode (see compact_data), and the search is done in its type.
+        A compact index_table of a smaller integer type must be given as sorted_columns (see search_columns).
+    PRE 11: stats is None, or a query_stats.QueryStats to record what the search did in.
+        Nothing is timed or recorded when it is None.
+
+    POST 1: the index_table is used to enable binary search of the dataset for each parameter of an_input,
+        or if sorted_columns are given, their contiguous rows are binary searched directly
     POST 2: the dataset is searched per column using numpy
     POST 3: the found indices are intersected to create a list of indices within the hyperbox
+    POST 4: if exclude_index is given, the results are the same as if that row had been deleted from
+        some_data and index_table, except that the indices still refer to the full some_data
+    POST 5: since every new alpha is between the best low and high alphas so far, its hyperbox is inside
+        the one of best_high_alpha and contains the one of best_low_alpha. Once one of those is known,
+        its indices are refined or grown instead of searching the whole index_table again,
+        unless the whole-column edge case changes which columns are whole, or growing would take longer.
 
     RETURN: the alpha value that was found, and the list of indices in the hyper-rectangle defined by alpha
     """
-    data_width = len(an_input)
+    if exact:
+        if stats is None:
+            return get_alpha_exact.get_alpha(an_input, some_data, base_fuzzy, num_data_points, exclude_index)
+        search_start = time.perf_counter()
+        alpha, data_indices = get_alpha_exact.get_alpha(an_input, some_data, base_fuzzy, num_data_points,
+                                                        exclude_index)
+        stats.search_seconds += time.perf_counter() - search_start
+        stats.record_iteration(alpha, 'exact', len(data_indices))
+        stats.record_result(len(data_indices), num_data_points)
+        return alpha, data_indices
+    if intersection not in ('intersect1d', 'counting'):
+        raise ValueError(f"Unknown intersection '{intersection}'")
 
     # this is mostly for testing since all real data should be numpy arrays
-    if type(some_data) is not np.ndarray:
+    if not isinstance(some_data, np.ndarray):
         some_data = np.array(some_data)
+    sorted_values, index_table, dtype = search_columns(some_data, index_table, sorted_columns)
+    # the bounds are kept in the type of the columns, e.g. float32 in compact mode, so they are not upcast to search
+    an_input = np.asarray(an_input, dtype=dtype)
+    base_fuzzy = np.asarray(base_fuzzy, dtype=dtype)
 
     current_alpha = 0.1  # starting alpha is modified here; 0.07 seems to be faster, but 0.1 more precise
     best_low_alpha, best_high_alpha = 0, 1
     data_indices = []
+    data_ranges = None  # column ranges of the hyperbox of data_indices, at best_high_alpha
+    low_indices, low_ranges = None, None  # indices and column ranges of the hyperbox at best_low_alpha
+    in_range = None  # scratch buffer for count_ranges, made on first use and then reused
     num_iterations = 0
 
     # terminates because num_iterations begins at 0 and is incremented only
     while len(data_indices) != num_data_points and num_iterations < max_iterations:
         a_fuzzy_width = base_fuzzy * current_alpha
-        min_fuzzy = an_input - a_fuzzy_width
-        max_fuzzy = an_input + a_fuzzy_width
-        candidate_indices = np.array([])
+        min_fuzzy = (an_input - a_fuzzy_width).astype(dtype, copy=False)
+        max_fuzzy = (an_input + a_fuzzy_width).astype(dtype, copy=False)
+
+        column_counts = None
+        if stats is not None:
+            search_start = time.perf_counter()
+
+        # ---- POST 1, POST 2
+        ranges = column_ranges(some_data, index_table, min_fuzzy, max_fuzzy, exclude_index, sorted_values)
+        whole_column = ranges[2]
+
+        if stats is not None:
+            intersection_start = time.perf_counter()
+            stats.search_seconds += intersection_start - search_start
+            column_counts = []
+
+        # ---- POST 3, POST 5
+        if data_ranges is not None and not np.any(whole_column & ~data_ranges[2]):
+            strategy = 'refine'
+            candidate_indices = refine_candidates(data_indices, some_data, min_fuzzy, max_fuzzy, whole_column,
+                                                  column_counts)
+        elif low_ranges is not None and should_grow(low_ranges, ranges):
+            strategy = 'grow'
+            candidate_indices = grow_candidates(low_indices, low_ranges, ranges, some_data, index_table,
+                                                min_fuzzy, max_fuzzy, exclude_index, column_counts)
+        elif intersection == 'counting':
+            strategy = 'counting'
+            if in_range is None:
+                in_range = np.zeros(len(some_data), bool)
+            candidate_indices, completed = count_ranges(index_table, ranges, num_data_points, in_range,
+                                                        exclude_index, column_counts)
+            if not completed:
+                ranges = None  # the candidates are not the whole hyperbox, so they cannot be grown later
+        else:
+            strategy = 'intersect1d'
+            candidate_indices = intersect_ranges(index_table, ranges[0], ranges[1], exclude_index, column_counts)
 
-        for c in range(data_width):
-            # do the binary search for the range for this column c
-            table_low = np.searchsorted(some_data[:, c], min_fuzzy[c], sorter=index_table[:, c])
-            table_high = np.searchsorted(some_data[:, c], max_fuzzy[c], sorter=index_table[:, c])
-
-            # if column has all the same value, include the whole column
-            if table_high == 0:
-                table_high = len(some_data[:, c])
-
-            index_range = index_table[table_low:table_high, c]
-            if c == 0:  # catch the first loop to initialize the indices
-                candidate_indices = index_range
-            else:
-                candidate_indices = np.intersect1d(candidate_indices, index_range, assume_unique=True)
-                # stop looking if a hyperbox with no contents is found
-                if len(candidate_indices) == 0:
-                    break
+        if stats is not None:
+            stats.intersection_seconds += time.perf_counter() - intersection_start
+            stats.record_iteration(current_alpha, strategy, len(candidate_indices), column_counts)
 
         if len(candidate_indices) >= num_data_points:
             data_indices = candidate_indices  # this run is the new best, so save the results
+            data_ranges = ranges
             # if the right number of points have been found, stop changing alpha
             if len(candidate_indices) != num_data_points:
                 best_high_alpha = current_alpha
                 current_alpha -= (best_high_alpha - best_low_alpha) / 2
         else:
+            low_indices, low_ranges = candidate_indices, ranges
             best_low_alpha = current_alpha
             current_alpha += (best_high_alpha - best_low_alpha) / 2
 
         num_iterations += 1
 
+    if stats is not None:
+        stats.record_result(len(data_indices), num_data_points)
+
     return current_alpha, list(np.sort(data_indices))  # return data_indices as sorted list
 
 
+BATCH_GATHER_LIMIT = 2 ** 22  # max number of candidate rows gathered at once by batch_box_members
+
+
+def batch_box_members(inputs, some_data, index_table, fuzzy_widths, sorted_values=None):
+    """
+    INTENT: find the indices of some_data inside the hyper-rectangle of each row of inputs at once
+
+    PRE 1: inputs is a 2D array with one input per row, each the size of one row of some_data without the target,
+        of the type of the searched columns, from search_columns
+    PRE 2: some_data is a numpy array and index_table is its look-up table, as for get_alpha
+    PRE 3: fuzzy_widths has the shape of inputs and holds the half width of each hyper-rectangle
+    PRE 4: sorted_values is None, or the sorted values from generate_sorted_columns, as for column_ranges
+
+    POST 1: every column is binary searched for the bounds of every input with a single numpy call,
+        giving the same [table_low, table_high) ranges as get_alpha, including the whole-column edge case
+    POST 2: the narrowest range of each input is gathered and bounds checked against each column in turn
+
+    RETURN: the number of indices found for each input, and all the found indices as one flat array,
+        grouped by input and sorted within each input
+    """
+    num_inputs, data_width = inputs.shape
+    length = len(some_data)
+    min_fuzzy = (inputs - fuzzy_widths).astype(inputs.dtype, copy=False)  # e.g. float32, as in get_alpha
+    max_fuzzy = (inputs + fuzzy_widths).astype(inputs.dtype, copy=False)
+
+    # ---- POST 1
+    table_low = np.empty((num_inputs, data_width), np.intp)
+    table_high = np.empty((num_inputs, data_width), np.intp)
+    for c in range(data_width):
+        if sorted_values is None:
+            table_low[:, c] = np.searchsorted(some_data[:, c], min_fuzzy[:, c], sorter=index_table[:, c])
+            table_high[:, c] = np.searchsorted(some_data[:, c], max_fuzzy[:, c], sorter=index_table[:, c])
+        else:
+            table_low[:, c] = np.searchsorted(sorted_values[c], min_fuzzy[:, c])
+            table_high[:, c] = np.searchsorted(sorted_values[c], max_fuzzy[:, c])
+
+    # if column has all the same value, include the whole column
+    whole_column = table_high == 0
+    table_high[whole_column] = length
+
+    # ---- POST 2
+    narrowest = np.argmin(table_high - table_low, axis=1)
+    starts = table_low[np.arange(num_inputs), narrowest]
+    sizes = table_high[np.arange(num_inputs), narrowest] - starts
+
+    # split the inputs into groups so the gathered candidates stay a reasonable size
+    size_totals = np.cumsum(sizes)
+    counts = np.zeros(num_inputs, np.intp)
+    found = []
+    group_start = 0
+    while group_start < num_inputs:
+        gathered = size_totals[group_start - 1] if group_start > 0 else 0
+        group_end = np.searchsorted(size_totals, gathered + BATCH_GATHER_LIMIT, side='right')
+        group_end = max(group_end, group_start + 1)
+
+        group = np.arange(group_start, group_end)
+        group_sizes = sizes[group]
+        owner = np.repeat(group, group_sizes)
+        offsets = np.cumsum(group_sizes) - group_sizes
+        positions = np.arange(len(owner)) + np.repeat(starts[group] - offsets, group_sizes)
+        candidates = index_table[positions, narrowest[owner]]
+
+        # bounds check one column at a time, so the candidates shrink as they go
+        for c in range(data_width):
+            values = some_data[candidates, c]
+            inside = (values >= min_fuzzy[owner, c]) & (values < max_fuzzy[owner, c]) | whole_column[owner, c]
+            candidates, owner = candidates[inside], owner[inside]
+
+        found.append(candidates[np.lexsort((candidates, owner))])
+        counts[group] = np.bincount(owner - group_start, minlength=len(group))
+        group_start = group_end
+
+    return counts, np.concatenate(found) if found else np.array([], np.intp)
+
+
+def get_alpha_batch(inputs, some_data, index_table, base_fuzzy, num_data_points, max_iterations=10,
+                    sorted_columns=None):
+    """
+    INTENT: run get_alpha for many inputs at once, so the per-query python overhead is paid once per batch
+
+    PRE 1: inputs is a 2D array with one input per row, each as an_input for get_alpha
+    PRE 2: some_data, index_table, base_fuzzy, num_data_points, max_iterations and sorted_columns
+        are as for get_alpha
+
+    POST 1: every input follows the same alpha search as get_alpha, all of them advancing together,
+        and an input stops changing alpha once its hyper-rectangle holds num_data_points
+    POST 2: the indices are collected for the best hyper-rectangle found for every input
+
+    RETURN: an array of the alpha values that were found, an array of offsets, and a flat array of indices,
+        such that indices[offsets[i]:offsets[i + 1]] are the sorted indices found for inputs[i]
+        (the same as get_alpha(inputs[i], ...) would return)
+    """
+    # this is mostly for testing since all real data should be numpy arrays
+    if not isinstance(some_data, np.ndarray):
+        some_data = np.array(some_data)
+    sorted_values, index_table, dtype = search_columns(some_data, index_table, sorted_columns)
+    inputs = np.atleast_2d(np.asarray(inputs, dtype=dtype))
+    base_fuzzy = np.asarray(base_fuzzy, dtype=dtype)
+    num_inputs = len(inputs)
+
+    current_alpha = np.full(num_inputs, 0.1)
+    best_low_alpha, best_high_alpha = np.zeros(num_inputs), np.ones(num_inputs)
+    box_alpha = np.full(num_inputs, np.nan)  # the alpha of the best hyperbox found, nan if there is none
+    finished = np.full(num_inputs, num_data_points == 0)
+
+    # ---- POST 1
+    for num_iterations in range(max_iterations):
+        searching = np.flatnonzero(~finished)
+        if len(searching) == 0:
+            break
+        alpha = current_alpha[searching]
+        counts, unused_indices = batch_box_members(inputs[searching], some_data, index_table,
+                                                   base_fuzzy * alpha[:, None], sorted_values)
+
+        enough = counts >= num_data_points
+        box_alpha[searching[enough]] = alpha[enough]
+        finished[searching[counts == num_data_points]] = True
+
+        too_many = searching[enough & (counts != num_data_points)]
+        best_high_alpha[too_many] = current_alpha[too_many]
+        current_alpha[too_many] -= (best_high_alpha[too_many] - best_low_alpha[too_many]) / 2
+
+        too_few = searching[~enough]
+        best_low_alpha[too_few] = current_alpha[too_few]
+        current_alpha[too_few] += (best_high_alpha[too_few] - best_low_alpha[too_few]) / 2
+
+    # ---- POST 2
+    counts = np.zeros(num_inputs, np.intp)
+    indices = np.array([], np.intp)
+    have_box = np.flatnonzero(~np.isnan(box_alpha))
+    if len(have_box) > 0:
+        counts[have_box], indices = batch_box_members(inputs[have_box], some_data, index_table,
+                                                      base_fuzzy * box_alpha[have_box, None], sorted_values)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    return current_alpha, offsets, indices
+
+
 class GetAlphaTests(unittest.TestCase):
 
     DELTA = 0.001
@@ -215,3 +642,164 @@ class GetAlphaTests(unittest.TestCase):
         values_7 = get_alpha(an_input_7, some_data_7, index_table_7, base_fuzzy_7, 4, max_iterations=10)
         print(values_7[0], "<- alpha  7  indices ->", values_7[1])
         assert(abs(values_7[0] - 0.2) < self.DELTA)
+
+    def test_get_alpha_batch(self):
+        rng = np.random.default_rng(1)
+        some_data = np.round(rng.random((300, 5)) * 20) / 2  # coarse values so there are plenty of ties
+        some_data[:, 2] = 3.0  # a constant column triggers the whole-column edge case
+        index_table = generate_index_table(some_data)
+        base_fuzzy = get_base_fuzzy(some_data)
+
+        inputs = np.concatenate((some_data[:40, :-1], rng.random((10, 4)) * 12 - 1))
+        for num_data_points in (1, 4, 9):
+            alphas, offsets, indices = get_alpha_batch(inputs, some_data, index_table, base_fuzzy, num_data_points)
+            assert(len(offsets) == len(inputs) + 1)
+
+            for i, an_input in enumerate(inputs):
+                alpha, expected = get_alpha(an_input, some_data, index_table, base_fuzzy, num_data_points)
+                assert(alphas[i] == alpha)
+                assert(list(indices[offsets[i]:offsets[i + 1]]) == expected)
+
+    def test_get_alpha_exclude_index(self):
+        rng = np.random.default_rng(2)
+        some_data = np.round(rng.random((120, 5)) * 8)
+        some_data[:, 1] = 2.0
+        some_data[:3, 3] = -3.0  # excluding one of these changes which rows are below max_fuzzy
+        index_table = generate_index_table(some_data)
+        base_fuzzy = get_base_fuzzy(some_data)
+
+        for i in range(len(some_data)):
+            trimmed_data = np.delete(some_data, i, axis=0)
+            trimmed_table = generate_index_table(trimmed_data)
+            expected = get_alpha(some_data[i, :-1], trimmed_data, trimmed_table, base_fuzzy, 2)
+
+            alpha, indices = get_alpha(some_data[i, :-1], some_data, index_table, base_fuzzy, 2, exclude_index=i)
+            assert(alpha == expected[0])
+            assert(indices == [j + (j >= i) for j in expected[1]])  # indices of the full some_data
+
+    def test_get_alpha_reuses_candidates(self):
+        def get_alpha_searching_every_time(an_input, some_data, index_table, base_fuzzy, num_data_points,
+                                           exclude_index):
+            current_alpha, best_low_alpha, best_high_alpha = 0.1, 0, 1
+            data_indices = []
+            for num_iterations in range(10):
+                if len(data_indices) == num_data_points:
+                    break
+                a_fuzzy_width = base_fuzzy * current_alpha
+                ranges = column_ranges(some_data, index_table, an_input - a_fuzzy_width,
+                                       an_input + a_fuzzy_width, exclude_index)
+                candidate_indices = intersect_ranges(index_table, ranges[0], ranges[1], exclude_index)
+                if len(candidate_indices) >= num_data_points:
+                    data_indices = candidate_indices
+                    if len(candidate_indices) != num_data_points:
+                        best_high_alpha = current_alpha
+                        current_alpha -= (best_high_alpha - best_low_alpha) / 2
+                else:
+                    best_low_alpha = current_alpha
+                    current_alpha += (best_high_alpha - best_low_alpha) / 2
+            return current_alpha, list(np.sort(data_indices))
+
+        rng = np.random.default_rng(3)
+        for trial in range(6):
+            some_data = np.round(rng.random((400, 2 + trial)) * (3 + 5 * trial))
+            some_data[:2, 0] = -4.0  # excluding one of these flips the whole-column edge case
+            index_table = generate_index_table(some_data)
+            base_fuzzy = get_base_fuzzy(some_data)
+
+            for i in range(0, 400, 7):
+                for num_data_points in (1, 5):
+                    expected = get_alpha_searching_every_time(some_data[i, :-1], some_data, index_table, base_fuzzy,
+                                                              num_data_points, i)
+                    found = get_alpha(some_data[i, :-1], some_data, index_table, base_fuzzy, num_data_points,
+                                      exclude_index=i)
+                    assert(found == expected)
+
+    def test_get_alpha_sorted_columns(self):
+        rng = np.random.default_rng(8)
+        some_data = np.round(rng.random((300, 5)) * 12)
+        some_data[:, 3] = 1.0
+        index_table = generate_index_table(some_data)
+        sorted_columns = generate_sorted_columns(some_data, index_table)
+        base_fuzzy = get_base_fuzzy(some_data)
+
+        for i in range(0, 300, 5):
+            for num_data_points in (1, 6):
+                expected = get_alpha(some_data[i, :-1], some_data, index_table, base_fuzzy, num_data_points,
+                                     exclude_index=i)
+                found = get_alpha(some_data[i, :-1], some_data, None, base_fuzzy, num_data_points,
+                                  exclude_index=i, sorted_columns=sorted_columns)
+                assert(found == expected)
+
+        expected = get_alpha_batch(some_data[:50, :-1], some_data, index_table, base_fuzzy, 3)
+        found = get_alpha_batch(some_data[:50, :-1], some_data, None, base_fuzzy, 3, sorted_columns=sorted_columns)
+        for expected_part, found_part in zip(expected, found):
+            assert(np.array_equal(expected_part, found_part))
+
+    def test_get_alpha_counting_intersection(self):
+        rng = np.random.default_rng(9)
+        for trial in range(4):
+            some_data = np.round(rng.random((400, 3 + trial)) * (4 + 4 * trial))
+            some_data[:2, 1] = -3.0  # excluding one of these flips the whole-column edge case
+            index_table = generate_index_table(some_data)
+            base_fuzzy = get_base_fuzzy(some_data)
+
+            for i in range(0, 400, 9):
+                for num_data_points in (1, 4, 30):
+                    expected = get_alpha(some_data[i, :-1], some_data, index_table, base_fuzzy, num_data_points,
+                                         exclude_index=i)
+                    found = get_alpha(some_data[i, :-1], some_data, index_table, base_fuzzy, num_data_points,
+                                      exclude_index=i, intersection='counting')
+                    assert(found == expected)
+
+        self.assertRaises(ValueError, get_alpha, some_data[0, :-1], some_data, index_table, base_fuzzy, 2,
+                          intersection='bitmap')
+
+    def test_intersect_ranges(self):
+        rng = np.random.default_rng(10)
+        some_data = np.round(rng.random((300, 7)) * 6)
+        some_data[:, 2] = 0.0  # a constant column, which is whole in every hyperbox
+        index_table = generate_index_table(some_data)
+
+        for i in range(0, 300, 11):
+            an_input = some_data[i, :-1]
+            a_fuzzy_width = rng.random(6) * 3
+            table_low, table_high, whole_column = column_ranges(some_data, index_table, an_input - a_fuzzy_width,
+                                                                an_input + a_fuzzy_width, i)
+            in_box = np.all((some_data[:, :-1] >= an_input - a_fuzzy_width) |
+                            whole_column, axis=1) & np.all((some_data[:, :-1] < an_input + a_fuzzy_width) |
+                                                           whole_column, axis=1)
+            in_box[i] = False
+            found = intersect_ranges(index_table, table_low, table_high, i)
+            assert(np.sort(found).tolist() == np.flatnonzero(in_box).tolist())
+
+    def test_get_alpha_compact(self):
+        rng = np.random.default_rng(20)
+        some_data = compact_data(rng.random((400, 5)) * 10)
+        some_data[:, 2] = 4.0
+        wide_data = some_data.astype(float)
+        index_table = generate_index_table(some_data, compact=True)
+        sorted_columns = generate_sorted_columns(some_data, index_table)
+        base_fuzzy = get_base_fuzzy(some_data)
+        assert(index_table.dtype == np.uint16 and base_fuzzy.dtype == np.float32)
+
+        # the float32 data finds the same hyperboxes as the same values in float64, with a float64 input
+        wide_table = generate_index_table(wide_data)
+        for i in range(0, 400, 13):
+            for num_data_points in (1, 5):
+                expected = get_alpha(wide_data[i, :-1], wide_data, wide_table, get_base_fuzzy(wide_data),
+                                     num_data_points, exclude_index=i)
+                for intersection in ('intersect1d', 'counting'):
+                    assert(get_alpha(wide_data[i, :-1], some_data, None, base_fuzzy, num_data_points,
+                                     exclude_index=i, sorted_columns=sorted_columns,
+                                     intersection=intersection) == expected)
+
+        expected = get_alpha_batch(wide_data[:40, :-1], wide_data, wide_table, get_base_fuzzy(wide_data), 3)
+        found = get_alpha_batch(wide_data[:40, :-1], some_data, None, base_fuzzy, 3, sorted_columns=sorted_columns)
+        for expected_part, found_part in zip(expected, found):
+            assert(np.array_equal(expected_part, found_part))
+
+        # a compact index_table is never used as a sorter, since numpy would copy it on every search
+        with self.assertRaises(ValueError):
+            get_alpha(some_data[0, :-1], some_data, index_table, base_fuzzy, 3)
+        with self.assertRaises(ValueError):
+            get_alpha_batch(some_data[:5, :-1], some_data, index_table, base_fuzzy, 3)
@@ -0,0 +1,98 @@
+"""
+A space-partitioning alternative to the index table for finding hyperboxes.
+
+The MaRz hyperbox around an input is a ball of the Chebyshev (L-infinity) distance once each feature
+is divided by its base_fuzzy, so the points in the smallest hyperbox holding num_data_points are the
+num_data_points nearest neighbours of the input in that scaled space. A KD-tree answers this in
+sub-linear time, which is much faster than intersecting per-column ranges for low dimensional data.
+"""
+
+from sklearn.neighbors import KDTree
+
+from dataset_preprocessing import *
+from get_alpha_exact import box_distances
+
+
+def generate_tree_index(some_data, base_fuzzy, leaf_size=40):
+    """
+    INTENT: build a KD-tree over the features of some_data for get_alpha, in place of an index table
+
+    PRE 1: some_data is a dataset with targets in the last column
+    PRE 2: base_fuzzy is the list of column ranges for some_data, as from get_base_fuzzy
+
+    POST 1: each feature is divided by its base_fuzzy, so the hyperbox of any alpha is a Chebyshev ball of radius alpha
+    POST 2: a KD-tree with the Chebyshev metric is built over the scaled features
+
+    RETURN: the KD-tree
+    """
+    # ---- POST 1
+    scaled_data = np.asarray(some_data)[:, :-1] / base_fuzzy
+
+    # ---- POST 2
+    return KDTree(scaled_data, leaf_size=leaf_size, metric='chebyshev')
+
+
+def get_alpha(an_input, some_data, tree_index, base_fuzzy, num_data_points, max_iterations=10, exclude_index=None):
+    """
+    INTENT: find the exact alpha and hyperbox of some_data which contains an_input and num_data_points data points,
+        using a KD-tree. This takes the same arguments as get_alpha_sorted.get_alpha, so it can be used in its place.
+
+    PRE 1: an_input is the size of one row of some_data without the target
+    PRE 2: tree_index is the KD-tree from generate_tree_index(some_data, base_fuzzy)
+    PRE 3: num_data_points is a positive integer
+    PRE 4: max_iterations is not used, since the tree gives the exact result with no searching for alpha
+    PRE 5: exclude_index is None, or the index of a row of some_data to leave out, e.g. the row of an_input
+
+    POST 1: the tree finds the nearest neighbours of an_input, with one extra in case one of them is excluded
+    POST 2: the tree finds every point within the distance of the farthest neighbour, allowing for rounding,
+        so that all of the points tied with it are included
+    POST 3: the alpha and indices are settled with the same distances as get_alpha_exact
+
+    RETURN: the same alpha value and sorted list of indices as get_alpha_exact.get_alpha
+    """
+    if not isinstance(some_data, np.ndarray):
+        some_data = np.array(some_data)
+    scaled_input = (np.asarray(an_input) / base_fuzzy).reshape(1, -1)
+
+    num_available = len(some_data) - (exclude_index is not None)
+    if num_data_points <= 0 or num_available <= 0:
+        return 0.0, []
+    num_data_points = min(num_data_points, num_available)
+
+    # ---- POST 1
+    distances, unused_indices = tree_index.query(scaled_input, k=min(num_data_points + 1, len(some_data)))
+
+    # ---- POST 2
+    candidates = tree_index.query_radius(scaled_input, r=distances[0, -1] * (1 + 1e-9))[0]
+    if exclude_index is not None:
+        candidates = candidates[candidates != exclude_index]
+
+    # ---- POST 3
+    candidate_distances = box_distances(an_input, some_data[candidates], base_fuzzy)
+    alpha = np.partition(candidate_distances, num_data_points - 1)[num_data_points - 1]
+
+    return float(alpha), np.sort(candidates[candidate_distances <= alpha]).tolist()
+
+
+class GetAlphaTests(unittest.TestCase):
+
+    def test_get_alpha_matches_exact(self):
+        import get_alpha_exact
+
+        rng = np.random.default_rng(7)
+        some_data = np.round(rng.random((500, 6)) * 10)  # many ties between distances
+        base_fuzzy = get_base_fuzzy(some_data)
+        tree_index = generate_tree_index(some_data, base_fuzzy, leaf_size=8)
+
+        for i in range(0, 500, 9):
+            for num_data_points in (1, 2, 7):
+                expected = get_alpha_exact.get_alpha(some_data[i, :-1], some_data, base_fuzzy, num_data_points,
+                                                     exclude_index=i)
+                found = get_alpha(some_data[i, :-1], some_data, tree_index, base_fuzzy, num_data_points,
+                                  exclude_index=i)
+                assert(found == expected)
+
+            # inputs that are not rows of some_data
+            an_input = rng.random(5) * 12 - 1
+            assert(get_alpha(an_input, some_data, tree_index, base_fuzzy, 3) ==
+                   get_alpha_exact.get_alpha(an_input, some_data, base_fuzzy, 3))
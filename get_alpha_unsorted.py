@@ -1,6 +1,8 @@
 import numpy as np
 import unittest
 
+import get_alpha_exact
+
 
 def in_range(a_data_point, data_width, min_fuzzy, max_fuzzy):
     """
@@ -36,7 +38,7 @@ def indices_in_range(some_array, lower_bound, upper_bound):
     return np.all(tf_array, axis=1).nonzero()[0].tolist()
 
 
-def get_alpha(an_input, some_data, base_fuzzy_width, num_data_points, max_iterations):
+def get_alpha(an_input, some_data, base_fuzzy_width, num_data_points, max_iterations, exact=False):
     """
     INTENT: Find an alpha value which modifies a_fuzzy_width such that it creates a hyper-rectangle
         around an_input within some_data which contains num_data_points of records.
@@ -47,6 +49,7 @@ def get_alpha(an_input, some_data, base_fuzzy_width, num_data_points, max_iterat
     PRECONDITION 3: a_fuzzy_width contains the ranges of values in each column of some_data
     PRECONDITION 4: num_data_points is less than the number of data points in some_data
     PRECONDITION 5: max_iterations is a positive number of times to search before stopping
+    PRECONDITION 6: exact is True to use get_alpha_exact instead of searching, ignoring max_iterations
 
     POST_CONDITION: current_alpha is a float between 0 and 1 such that it multiplies a_fuzzy_width
         to create a hyper-rectangle within some_data that contains the points at data_indices
@@ -54,6 +57,9 @@ def get_alpha(an_input, some_data, base_fuzzy_width, num_data_points, max_iterat
     RETURNS: an alpha value that defines a good-sized hyper-rectangle
     RETURNS: a list of length num_data_points of indices within some_data
     """
+    if exact:
+        return get_alpha_exact.get_alpha(an_input, some_data, base_fuzzy_width, num_data_points)
+
     if type(some_data) == list:
         some_data = np.array(some_data)
     data_width = len(an_input)
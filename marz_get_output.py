@@ -3,6 +3,12 @@ Attribution:
 These functions were initially written for the iris dataset by Dr. Eric Braude and then later generalized.
 """
 
+import time
+import numpy as np
+import unittest
+
+from dataset_preprocessing import search_dtype
+
 
 VAL, WT = 0, 1  # labels for convenience
 SMALL_DELTA = 0.0001
@@ -45,7 +51,7 @@ def add_output_contributions(a_contribution, an_input, a_datum, a_fuzzy_width):
     a_contribution[WT] += output_weight
 
 
-def get_output(an_input, some_data, a_fuzzy_width, indices_in_width):
+def get_output(an_input, some_data, a_fuzzy_width, indices_in_width, stats=None):
     """
     NUM_INPUTS = the number of features in the data
 
@@ -53,17 +59,136 @@ def get_output(an_input, some_data, a_fuzzy_width, indices_in_width):
     PRE2 (some_data) = a non-empty list of lists of NUM_INPUTS positive reals ordered left-to-right
         with targets at column [-1]
     PRE3 (a_fuzzy_width) = NUM_INPUTS non-negative floats <=1 = half width fuzzy triangle per field
+    PRE4 (stats) = None, or a query_stats.QueryStats to add the time taken to, as its output_seconds
 
     POST-CONDITION: --as for add_output_contributions(contribution_) for every a_datum
     in the (hyper-)rectangle defined by min_fuzzy and max_fuzzy, exclusive,
     where contribution_ is initially [0, SMALL_DELTA].
+        All of the data in the hyper-rectangle is processed at once as numpy arrays
+        rather than one a_datum at a time.
 
     RETURNS contribution_[VAL] / contribution_[WT]
     """
+    if stats is not None:
+        output_start = time.perf_counter()
+        output = get_output(an_input, some_data, a_fuzzy_width, indices_in_width)
+        stats.output_seconds += time.perf_counter() - output_start
+        return output
+
+    indices_in_width = np.asarray(indices_in_width, dtype=np.intp)
+    if len(indices_in_width) == 0:
+        return 0 / SMALL_DELTA
+
+    data_in_width = np.asarray(some_data)[indices_in_width]
+    dtype = search_dtype(data_in_width)
+    an_input = np.asarray(an_input, dtype=dtype)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # --- [O1] (fuzzy_slope) = slope of the left triangle side
+        fuzzy_slope = 1 / np.asarray(a_fuzzy_width, dtype=dtype)
+
+        # --- [O2] = POST1 (weight_) of add_output_contributions, for every a_datum at once
+        horizontal_distance = np.abs(an_input - data_in_width[:, :len(an_input)])
+        temp_weight = fuzzy_slope * horizontal_distance
+    temp_weight[horizontal_distance == 0] = 1.0
+    weight_ = np.minimum(temp_weight.min(axis=1), 1.0)  # 1.0 is the max, as in the per-datum version
 
-    contribution = [0, SMALL_DELTA]
+    # --- [O3] = POST2 (Contribution to Output)
+    output_weight = weight_ * (2 - weight_)
+    contribution_val = output_weight @ data_in_width[:, -1]
+    contribution_wt = SMALL_DELTA + output_weight.sum()
 
-    for index in indices_in_width:
-        add_output_contributions(contribution, an_input, some_data[index], a_fuzzy_width)
+    return contribution_val / contribution_wt
+
+
+def get_output_batch(inputs, some_data, fuzzy_widths, offsets, indices):
+    """
+    INTENT: get_output for many inputs at once, e.g. with the hyper-rectangles from get_alpha_batch
 
-    return contribution[VAL] / contribution[WT]
+    PRECONDITION 1 (inputs) = a 2D array with one an_input per row
+    PRE2 (fuzzy_widths) = an array the shape of inputs, with a_fuzzy_width for each input
+    PRE3 (offsets, indices) = indices[offsets[i]:offsets[i + 1]] are the indices_in_width of inputs[i]
+
+    POST-CONDITION: --as for get_output for every input, with the weights of all of the inputs
+        found together and then summed per input
+
+    RETURNS an array with the output for each input
+    """
+    data_in_width = np.asarray(some_data)[np.asarray(indices, dtype=np.intp)]
+    dtype = search_dtype(data_in_width)
+    inputs = np.atleast_2d(np.asarray(inputs, dtype=dtype))
+    num_inputs = len(inputs)
+    input_of = np.repeat(np.arange(num_inputs), np.diff(offsets))  # the input of each of the indices
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # --- [O1] (fuzzy_slope) = slope of the left triangle side
+        fuzzy_slope = 1 / np.asarray(fuzzy_widths, dtype=dtype)
+
+        # --- [O2] = POST1 (weight_) of add_output_contributions
+        horizontal_distance = np.abs(inputs[input_of] - data_in_width[:, :inputs.shape[1]])
+        temp_weight = fuzzy_slope[input_of] * horizontal_distance
+    temp_weight[horizontal_distance == 0] = 1.0
+    weight_ = temp_weight.min(axis=1, initial=1.0)  # 1.0 is the max, as in the per-datum version
+
+    # --- [O3] = POST2 (Contribution to Output)
+    output_weight = weight_ * (2 - weight_)
+    contribution_val = np.bincount(input_of, output_weight * data_in_width[:, -1], minlength=num_inputs)
+    contribution_wt = SMALL_DELTA + np.bincount(input_of, output_weight, minlength=num_inputs)
+
+    return contribution_val / contribution_wt
+
+
+class GetOutputTests(unittest.TestCase):
+
+    DELTA = 1e-9
+
+    def test_get_output_matches_per_datum(self):
+        rng = np.random.default_rng(0)
+        some_data = rng.random((200, 6))
+        some_data[:, 2] = 0.5  # a constant column gives zero horizontal distances
+        some_data[:, -1] = rng.integers(0, 3, 200)
+        an_input = some_data[17, :-1]
+        a_fuzzy_width = np.full(5, 0.3)
+        indices = [i for i in range(200) if i % 3 == 0]
+
+        contribution = [0, SMALL_DELTA]
+        for index in indices:
+            add_output_contributions(contribution, an_input, some_data[index], a_fuzzy_width)
+        expected = contribution[VAL] / contribution[WT]
+
+        assert(abs(get_output(an_input, some_data, a_fuzzy_width, indices) - expected) < self.DELTA)
+        assert(get_output(an_input, some_data, a_fuzzy_width, []) == 0)
+
+        # lists work as well as arrays
+        list_output = get_output(list(an_input), some_data.tolist(), list(a_fuzzy_width), indices)
+        assert(abs(list_output - expected) < self.DELTA)
+
+    def test_get_output_batch(self):
+        rng = np.random.default_rng(1)
+        some_data = rng.random((100, 4))
+        some_data[:, 1] = 0.5
+        inputs = rng.random((6, 3))
+        fuzzy_widths = rng.random((6, 3)) * 0.5 + 0.1
+        index_lists = [rng.choice(100, size, replace=False) for size in (5, 0, 1, 40, 12, 3)]
+        offsets = np.cumsum([0] + [len(indices) for indices in index_lists])
+
+        outputs = get_output_batch(inputs, some_data, fuzzy_widths, offsets, np.concatenate(index_lists))
+        for i in range(6):
+            expected = get_output(inputs[i], some_data, fuzzy_widths[i], index_lists[i])
+            assert(abs(outputs[i] - expected) < self.DELTA)
+
+    def test_get_output_float32(self):
+        rng = np.random.default_rng(2)
+        some_data = rng.random((100, 4))
+        inputs = rng.random((3, 3))
+        fuzzy_widths = np.full((3, 3), 0.4)
+        indices = np.arange(0, 100, 2)
+        offsets = np.array([0, 20, 30, 50])
+
+        # float32 data is weighted in float32, and gives nearly the same outputs as float64
+        compact = some_data.astype(np.float32)
+        output = get_output(inputs[0], compact, fuzzy_widths[0], indices)
+        assert(output.dtype == np.float32)
+        assert(abs(output - get_output(inputs[0], some_data, fuzzy_widths[0], indices)) < 1e-5)
+        assert(np.allclose(get_output_batch(inputs, compact, fuzzy_widths, offsets, indices),
+                           get_output_batch(inputs, some_data, fuzzy_widths, offsets, indices), atol=1e-5))
@@ -0,0 +1,220 @@
+"""
+Save a dataset which has been prepared for MaRz, so that later runs can load it instead of preprocessing it again.
+
+A prepared model is a directory of .npy files for the data, the index table and the base fuzzy (and optionally
+the sorted columns), with a metadata.json file describing them and the file the data came from.
+The arrays are loaded with memory mapping, so loading does not read or sort anything up front,
+and every process which loads the same model shares the same pages of memory.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+import unittest
+
+from dataset_preprocessing import generate_index_table, generate_sorted_columns, get_base_fuzzy
+
+
+MODEL_FORMAT = 1  # changed whenever the files of a prepared model change, so that old ones are prepared again
+
+
+def file_checksum(path, chunk_size=2 ** 20):
+    """
+    INTENT: find the sha256 checksum of a file, reading it in chunks so that large files are not held in memory
+
+    RETURN: the checksum as a hex string
+    """
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def source_description(source_path):
+    """
+    INTENT: describe the source file of a prepared model, to tell if it has changed since the model was saved
+
+    RETURN: a dict of the path, size, modification time and checksum of the file
+    """
+    status = os.stat(source_path)
+    return {'path': os.path.abspath(source_path), 'size': status.st_size, 'mtime_ns': status.st_mtime_ns,
+            'sha256': file_checksum(source_path)}
+
+
+def save_prepared(directory, some_data, index_table, base_fuzzy, sorted_columns=None, source_path=None):
+    """
+    INTENT: save a prepared dataset to directory
+
+    PRE 1: index_table and base_fuzzy are from generate_index_table and get_base_fuzzy of some_data
+    PRE 2: sorted_columns is None, or the sorted columns of some_data from generate_sorted_columns
+    PRE 3: source_path is None, or the file some_data was loaded from
+
+    POST 1: any metadata.json of an older model is removed first
+    POST 2: each array is saved to its own .npy file, so it can be memory mapped when loaded.
+        Each file is written under another name and then replaced in one step, so that processes
+        which still have the older files mapped keep their pages.
+    POST 3: metadata.json is written last, in the same way, so a directory with a metadata.json
+        always has a complete model, even if saving was interrupted
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    # ---- POST 1
+    metadata_path = os.path.join(directory, 'metadata.json')
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+
+    # ---- POST 2
+    arrays = {'data': some_data, 'index_table': index_table, 'base_fuzzy': base_fuzzy}
+    if sorted_columns is not None:
+        arrays['sorted_values'], arrays['sorted_indices'] = sorted_columns
+    for name, array in arrays.items():
+        array_path = os.path.join(directory, name + '.npy')
+        with open(array_path + '.tmp', 'wb') as f:
+            np.save(f, np.asarray(array))
+        os.replace(array_path + '.tmp', array_path)
+
+    # ---- POST 3
+    metadata = {'format': MODEL_FORMAT,
+                'arrays': {name: {'shape': list(np.shape(array)), 'dtype': str(np.asarray(array).dtype)}
+                           for name, array in arrays.items()},
+                'source': None if source_path is None else source_description(source_path)}
+    with open(metadata_path + '.tmp', 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(metadata_path + '.tmp', metadata_path)
+
+
+def load_metadata(directory):
+    """
+    INTENT: read the metadata of a prepared model
+
+    RETURN: the metadata as a dict, or None if there is no complete model of this format in directory
+    """
+    try:
+        with open(os.path.join(directory, 'metadata.json')) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return metadata if metadata.get('format') == MODEL_FORMAT else None
+
+
+def load_prepared(directory, mmap_mode='r'):
+    """
+    INTENT: load a prepared dataset saved by save_prepared
+
+    PRE 1: mmap_mode is as for np.load, 'r' to share read only pages of the files between processes,
+        or None to read the arrays into memory
+
+    RETURN: the data, index table and base fuzzy, the sorted columns or None if they were not saved,
+        and the metadata
+    """
+    metadata = load_metadata(directory)
+    if metadata is None:
+        raise FileNotFoundError(f"No prepared model in '{directory}'")
+
+    arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+              for name in metadata['arrays']}
+    sorted_columns = None
+    if 'sorted_values' in arrays:
+        sorted_columns = arrays['sorted_values'], arrays['sorted_indices']
+
+    return arrays['data'], arrays['index_table'], arrays['base_fuzzy'], sorted_columns, metadata
+
+
+def is_prepared_from(metadata, source_path):
+    """
+    INTENT: check whether a prepared model was made from the current contents of source_path
+
+    POST 1: if the size and modification time of the file are unchanged, it is taken to be the same file
+        without reading it, otherwise its checksum is compared
+    """
+    if metadata is None or metadata['source'] is None:
+        return False
+    source = metadata['source']
+    status = os.stat(source_path)
+
+    # ---- POST 1
+    if status.st_size != source['size']:
+        return False
+    if status.st_mtime_ns == source['mtime_ns']:
+        return True
+    return file_checksum(source_path) == source['sha256']
+
+
+def load_or_prepare(directory, source_path, load_data, sorted_columns=False, mmap_mode='r'):
+    """
+    INTENT: load the prepared model of source_path from directory, preparing and saving it first if needed
+
+    PRE 1: load_data is a function which takes source_path and returns a dataset formatted for MaRz
+    PRE 2: sorted_columns is True to prepare the sorted columns as well
+
+    POST 1: if directory has a model prepared from the current source_path, it is loaded without calling load_data
+    POST 2: otherwise the data is loaded and prepared with generate_index_table and get_base_fuzzy,
+        saved, and then loaded in the same way
+
+    RETURN: as for load_prepared
+    """
+    # ---- POST 1
+    metadata = load_metadata(directory)
+    if is_prepared_from(metadata, source_path) and ('sorted_values' in metadata['arrays'] or not sorted_columns):
+        return load_prepared(directory, mmap_mode)
+
+    # ---- POST 2
+    some_data = np.asarray(load_data(source_path))
+    index_table = generate_index_table(some_data)
+    save_prepared(directory, some_data, index_table, get_base_fuzzy(some_data),
+                  generate_sorted_columns(some_data, index_table) if sorted_columns else None, source_path)
+    return load_prepared(directory, mmap_mode)
+
+
+class PreparedModelTests(unittest.TestCase):
+
+    def test_load_or_prepare(self):
+        import tempfile
+
+        rng = np.random.default_rng(16)
+        some_data = np.round(rng.random((50, 4)) * 10)
+        num_loads = []
+
+        def load_data(path):
+            num_loads.append(path)
+            return np.loadtxt(path)
+
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, 'data.txt')
+            model_directory = os.path.join(directory, 'model')
+            np.savetxt(source_path, some_data)
+
+            loaded_data, index_table, base_fuzzy, sorted_columns, metadata = load_or_prepare(
+                model_directory, source_path, load_data, sorted_columns=True)
+            assert(isinstance(loaded_data, np.memmap))
+            assert(np.array_equal(loaded_data, some_data))
+            assert(np.array_equal(index_table, generate_index_table(some_data)))
+            assert(np.array_equal(base_fuzzy, get_base_fuzzy(some_data)))
+            assert(np.array_equal(sorted_columns[0], generate_sorted_columns(some_data, index_table)[0]))
+            assert(metadata['source']['sha256'] == file_checksum(source_path))
+
+            # the mapped arrays are queried as they are
+            from get_alpha_sorted import get_alpha
+            expected = get_alpha(some_data[3, :-1], some_data, generate_index_table(some_data),
+                                 get_base_fuzzy(some_data), 2, exclude_index=3)
+            assert(get_alpha(loaded_data[3, :-1], loaded_data, index_table, base_fuzzy, 2, exclude_index=3) ==
+                   expected)
+            assert(get_alpha(loaded_data[3, :-1], loaded_data, None, base_fuzzy, 2, exclude_index=3,
+                             sorted_columns=sorted_columns) == expected)
+
+            # the second time, the prepared model is loaded without loading the data
+            load_or_prepare(model_directory, source_path, load_data)
+            assert(len(num_loads) == 1)
+
+            # the same contents with a new modification time are checked by checksum
+            os.utime(source_path, ns=(0, 0))
+            load_or_prepare(model_directory, source_path, load_data)
+            assert(len(num_loads) == 1)
+
+            # changed contents are prepared again
+            np.savetxt(source_path, some_data[:40])
+            loaded_data = load_or_prepare(model_directory, source_path, load_data)[0]
+            assert(len(num_loads) == 2)
+            assert(np.array_equal(loaded_data, some_data[:40]))
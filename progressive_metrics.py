@@ -0,0 +1,257 @@
+"""
+Metrics which are updated online as the lines of a dataset are run, with confidence intervals for their estimates,
+so that run_dataset_progressive can stop once the metric of the whole dataset is known well enough.
+
+The lines are a random sample without replacement from the dataset, so the intervals include the finite population
+correction, and narrow to nothing once every line has been run.
+"""
+
+from statistics import NormalDist
+import numpy as np
+import unittest
+
+
+METRICS = ('mse', 'accuracy', 'f1', 'close')
+
+
+def population_correction(count, population):
+    """
+    INTENT: find the factor by which the variance of a mean of count lines sampled without replacement
+        from population lines is smaller than with replacement
+
+    RETURN: the factor, or 1 if population is None
+    """
+    if population is None or population <= 1:
+        return 1.0
+    return max(population - count, 0) / (population - 1)
+
+
+class RunningMean:
+    """
+    The mean and variance of values added a batch at a time, with Welford's method, merging the mean and sum of
+    squared differences of each batch into the totals as in Chan et al., so no values are kept.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # the sum of squared differences from the mean
+
+    def add(self, values):
+        """
+        INTENT: add a batch of values to the mean and variance
+        """
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        batch_mean = values.mean()
+        batch_m2 = np.square(values - batch_mean).sum()
+        count = self.count + len(values)
+        delta = batch_mean - self.mean
+        self.mean += delta * len(values) / count
+        self.m2 += batch_m2 + delta ** 2 * self.count * len(values) / count
+        self.count = count
+
+    def variance(self):
+        """
+        RETURN: the sample variance of the values, or nan for fewer than two values
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    def half_width(self, z, population=None):
+        """
+        INTENT: find the half width of the confidence interval of the mean, by the normal approximation
+
+        RETURN: z standard errors of the mean, or inf for fewer than two values
+        """
+        if self.count < 2:
+            return np.inf
+        return z * np.sqrt(self.variance() / self.count * population_correction(self.count, population))
+
+
+class RunningProportion(RunningMean):
+    """
+    A RunningMean of values which are all 0 or 1, e.g. whether each output is correct. Its interval is Wilson's,
+    which, unlike the normal approximation, does not fall to nothing when every value so far is the same.
+    """
+
+    def interval(self, z, population=None):
+        """
+        INTENT: find the Wilson score interval of the proportion, with the variance reduced by the finite
+            population correction, as if from a sample that many times as large
+
+        RETURN: the low and high ends of the interval, which is (0, 1) before any values are added
+        """
+        correction = population_correction(self.count, population)
+        if self.count == 0:
+            return 0.0, 1.0
+        if correction == 0:
+            return self.mean, self.mean  # every line of the population is known
+        count = self.count / correction
+        z2 = z ** 2 / count
+        centre = (self.mean + z2 / 2) / (1 + z2)
+        half_width = z / (1 + z2) * np.sqrt(self.mean * (1 - self.mean) / count + z2 / (4 * count))
+        return centre - half_width, centre + half_width
+
+    def half_width(self, z, population=None):
+        """
+        INTENT: find half the width of the Wilson interval of the proportion. Near 0 or 1 the interval is not
+            centred on the proportion, so this measures how wide it is, rather than giving its ends
+
+        RETURN: half the width of the interval, or inf for fewer than two values
+        """
+        if self.count < 2:
+            return np.inf
+        low, high = self.interval(z, population)
+        return (high - low) / 2
+
+
+class RunningF1:
+    """
+    The F1 score of binary predictions added a batch at a time, from the counts of true positives and of errors.
+    F1 = 2 tp / (2 tp + fp + fn) is not a mean of the lines, so its interval is found by the delta method from the
+    multinomial proportions of true positives and errors.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.true_positives = 0
+        self.errors = 0
+
+    def add(self, targets, predictions):
+        """
+        INTENT: add a batch of binary targets and predictions, with 1 as the positive class
+        """
+        targets, predictions = np.asarray(targets) == 1, np.asarray(predictions) == 1
+        self.count += len(targets)
+        self.true_positives += np.count_nonzero(targets & predictions)
+        self.errors += np.count_nonzero(targets != predictions)
+
+    def estimate(self):
+        """
+        RETURN: the F1 score, which is 0 when there are no positive targets or predictions, as in sklearn
+        """
+        denominator = 2 * self.true_positives + self.errors
+        return 2 * self.true_positives / denominator if denominator > 0 else 0.0
+
+    def half_width(self, z, population=None):
+        """
+        INTENT: find the half width of the confidence interval of the F1 score, by the delta method
+
+        RETURN: z standard errors of the F1 score, or inf for fewer than two lines or no positives
+        """
+        denominator = 2 * self.true_positives + self.errors
+        if self.count < 2 or denominator == 0:
+            return np.inf
+        p_true, p_error = self.true_positives / self.count, self.errors / self.count
+        gradient = np.array([2 * p_error, -2 * p_true]) * self.count ** 2 / denominator ** 2
+        covariance = np.array([[p_true * (1 - p_true), -p_true * p_error],
+                               [-p_true * p_error, p_error * (1 - p_error)]]) / self.count
+        variance = gradient @ covariance @ gradient * population_correction(self.count, population)
+        return z * np.sqrt(max(variance, 0.0))
+
+
+class ProgressiveMetrics:
+    """
+    The METRICS of the lines run so far: the mean squared error, the accuracy and F1 score of the outputs rounded
+    to the nearest integer (as in the person and ozone experiments), and the rate of close results.
+    The accuracy and the rate of close results have Wilson intervals, see RunningProportion.
+    """
+
+    def __init__(self, close_threshold, confidence=0.95, population=None):
+        self.close_threshold = close_threshold
+        self.z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self.population = population
+        self.squared_error = RunningMean()
+        self.correct = RunningProportion()
+        self.close = RunningProportion()
+        self.f1 = RunningF1()
+
+    def add(self, targets, outputs):
+        """
+        INTENT: add a batch of targets and MaRz outputs to every metric
+        """
+        targets, outputs = np.asarray(targets, dtype=float), np.asarray(outputs, dtype=float)
+        rounded = np.rint(outputs)
+        self.squared_error.add(np.square(outputs - targets))
+        self.correct.add(rounded == targets)
+        self.close.add(np.abs(outputs - targets) < self.close_threshold)
+        self.f1.add(targets, rounded)
+
+    def estimates(self):
+        """
+        RETURN: a dict of each of the METRICS and its (estimate, half width of its confidence interval)
+        """
+        return {'mse': (self.squared_error.mean, self.squared_error.half_width(self.z, self.population)),
+                'accuracy': (self.correct.mean, self.correct.half_width(self.z, self.population)),
+                'f1': (self.f1.estimate(), self.f1.half_width(self.z, self.population)),
+                'close': (self.close.mean, self.close.half_width(self.z, self.population))}
+
+
+class ProgressiveMetricsTests(unittest.TestCase):
+
+    def test_running_mean(self):
+        rng = np.random.default_rng(25)
+        values = rng.random(1000) * 50 + 1000  # far from 0, where a sum of squares would lose precision
+
+        running = RunningMean()
+        for batch in np.array_split(values, [1, 2, 100, 350, 351, 999]):
+            running.add(batch)
+        assert(running.count == 1000)
+        assert(abs(running.mean - values.mean()) < 1e-9)
+        assert(abs(running.variance() - values.var(ddof=1)) < 1e-6)
+
+        z = NormalDist().inv_cdf(0.975)
+        assert(abs(running.half_width(z) - z * values.std(ddof=1) / np.sqrt(1000)) < 1e-9)
+        assert(running.half_width(z, population=1000) == 0)  # every line of the population is known
+        assert(RunningMean().half_width(z) == np.inf)
+
+    def test_running_proportion(self):
+        z = NormalDist().inv_cdf(0.975)
+
+        # every line correct so far still leaves an interval, which shrinks as more lines agree
+        all_correct = ProgressiveMetrics(0.1, population=100000)
+        all_correct.add(np.ones(100), np.ones(100))
+        accuracy, half_width = all_correct.estimates()['accuracy']
+        assert(accuracy == 1 and 0.015 < half_width < 0.025)
+        assert(all_correct.correct.interval(z)[1] == 1)
+        all_correct.add(np.ones(900), np.ones(900))
+        assert(0 < all_correct.estimates()['accuracy'][1] < half_width)
+        assert(all_correct.estimates()['close'][1] > 0)
+
+        # the interval is close to the normal one away from 0 and 1, and nothing once the population is known
+        proportion, mean = RunningProportion(), RunningMean()
+        values = np.random.default_rng(27).random(5000) < 0.4
+        proportion.add(values)
+        mean.add(values)
+        assert(abs(proportion.half_width(z) - mean.half_width(z)) < 1e-4)
+        assert(proportion.half_width(z, population=5000) == 0)
+
+    def test_progressive_metrics(self):
+        from sklearn.metrics import f1_score
+
+        rng = np.random.default_rng(26)
+        targets = rng.integers(0, 2, 500).astype(float)
+        outputs = np.clip(targets + rng.normal(0, 0.4, 500), 0, 1)
+
+        metrics = ProgressiveMetrics(0.1, population=2000)
+        for start in range(0, 500, 64):
+            metrics.add(targets[start:start + 64], outputs[start:start + 64])
+        estimates = metrics.estimates()
+
+        assert(abs(estimates['mse'][0] - np.mean((outputs - targets) ** 2)) < 1e-12)
+        assert(abs(estimates['accuracy'][0] - np.mean(np.rint(outputs) == targets)) < 1e-12)
+        assert(abs(estimates['f1'][0] - f1_score(targets, np.rint(outputs))) < 1e-12)
+        assert(abs(estimates['close'][0] - np.mean(np.abs(outputs - targets) < 0.1)) < 1e-12)
+        assert(set(estimates) == set(METRICS))
+        assert(all(0 < half_width < 0.1 for estimate, half_width in estimates.values()))
+
+        # the F1 interval covers the F1 of a larger sample from the same distribution about as often as it should
+        covered = 0
+        for trial in range(200):
+            sample_targets = rng.integers(0, 2, 300)
+            sample_outputs = np.where(rng.random(300) < 0.8, sample_targets, 1 - sample_targets)
+            f1 = RunningF1()
+            f1.add(sample_targets, sample_outputs)
+            covered += abs(f1.estimate() - 0.8) < f1.half_width(NormalDist().inv_cdf(0.975))
+        assert(0.88 < covered / 200 <= 1)
@@ -0,0 +1,151 @@
+"""
+Record what each query did, to find out why some queries are slow.
+
+A QueryStats is passed as the stats of get_alpha_sorted.get_alpha and marz_get_output.get_output, which fill it in.
+run_dataset(..., stats=True) does this for every test line, and prints the percentiles of the summaries
+of all of the queries with summarize.
+"""
+
+import numpy as np
+import unittest
+
+
+# the fields of QueryStats.summary, which run_dataset collects for every query
+SUMMARY_FIELDS = ('iterations', 'first_candidates', 'max_candidates', 'column_steps',
+                  'search_ms', 'intersection_ms', 'output_ms', 'exact')
+
+
+class QueryStats:
+    """
+    The record of one query. For each iteration of the alpha search, it has the alpha tried, how the hyperbox
+    was found ('intersect1d', 'counting', 'refine', 'grow' or 'exact'), the number of candidates found,
+    and the number of candidates left after each column was intersected (empty for 'exact';
+    for 'grow', the known candidates and the new ones left after each column, see grow_candidates).
+    Times are in seconds: search is the binary search of the columns, intersection is finding the indices
+    within all of them, and output is get_output.
+    """
+
+    def __init__(self):
+        self.alphas = []
+        self.strategies = []
+        self.candidates = []
+        self.column_counts = []
+        self.search_seconds = 0.0
+        self.intersection_seconds = 0.0
+        self.output_seconds = 0.0
+        self.num_points = None
+        self.exact = None
+
+    def record_iteration(self, alpha, strategy, num_candidates, column_counts=None):
+        """
+        INTENT: record one iteration of the alpha search
+        """
+        self.alphas.append(alpha)
+        self.strategies.append(strategy)
+        self.candidates.append(num_candidates)
+        self.column_counts.append(column_counts or [])
+
+    def record_result(self, num_points, num_data_points):
+        """
+        INTENT: record the number of points found, and whether it was exactly the number asked for
+        """
+        self.num_points = num_points
+        self.exact = num_points == num_data_points
+
+    def summary(self):
+        """
+        INTENT: summarize the query as numbers, for collecting the summaries of many queries in an array
+
+        RETURN: a tuple of the SUMMARY_FIELDS, with times in milliseconds and exact as 1 or 0
+        """
+        return (len(self.candidates), self.candidates[0] if self.candidates else 0, max(self.candidates, default=0),
+                sum(len(counts) for counts in self.column_counts), self.search_seconds * 1000,
+                self.intersection_seconds * 1000, self.output_seconds * 1000, float(bool(self.exact)))
+
+
+def summarize(summaries, percentiles=(50, 90, 99, 100)):
+    """
+    INTENT: find the percentiles of each of the SUMMARY_FIELDS over many queries
+
+    PRE 1: summaries is an array with a row of QueryStats.summary for each query
+
+    RETURN: a dict of each field and its list of values at percentiles, and of 'iterations_histogram',
+        the number of queries which took each number of iterations, from 0 up
+    """
+    summaries = np.asarray(summaries, dtype=float).reshape(-1, len(SUMMARY_FIELDS))
+    summarized = {}
+    for f, field in enumerate(SUMMARY_FIELDS):
+        column = summaries[:, f]
+        summarized[field] = np.percentile(column, percentiles).tolist() if len(column) else [0.0] * len(percentiles)
+    summarized['iterations_histogram'] = np.bincount(summaries[:, 0].astype(int)).tolist()
+    return summarized
+
+
+class QueryStatsTests(unittest.TestCase):
+
+    def test_query_stats(self):
+        from dataset_preprocessing import generate_index_table, get_base_fuzzy
+        from get_alpha_sorted import get_alpha
+        from marz_get_output import get_output
+
+        rng = np.random.default_rng(24)
+        some_data = np.round(rng.random((300, 5)) * 10)
+        index_table = generate_index_table(some_data)
+        base_fuzzy = get_base_fuzzy(some_data)
+
+        summaries = []
+        for i in range(0, 300, 7):
+            for intersection in ('intersect1d', 'counting'):
+                stats = QueryStats()
+                alpha, indices = get_alpha(some_data[i, :-1], some_data, index_table, base_fuzzy, 3,
+                                           exclude_index=i, intersection=intersection, stats=stats)
+                output = get_output(some_data[i, :-1], some_data, base_fuzzy * alpha, indices, stats=stats)
+
+                # the results are the same as without stats
+                assert((alpha, indices) == get_alpha(some_data[i, :-1], some_data, index_table, base_fuzzy, 3,
+                                                     exclude_index=i, intersection=intersection))
+                assert(output == get_output(some_data[i, :-1], some_data, base_fuzzy * alpha, indices))
+
+                assert(1 <= len(stats.candidates) <= 10 and stats.exact == (len(indices) == 3))
+                assert(stats.num_points == len(indices))
+                for strategy, num_candidates, column_counts in zip(stats.strategies, stats.candidates,
+                                                                   stats.column_counts):
+                    if strategy != 'exact':
+                        # the candidates only shrink as the columns are intersected
+                        assert(all(a >= b for a, b in zip(column_counts, column_counts[1:])))
+                        if strategy in ('intersect1d', 'refine'):
+                            assert(column_counts == [] or column_counts[-1] == num_candidates)
+                        if strategy == 'grow':  # the new candidates are only made unique after the last column
+                            assert(column_counts[-1] >= num_candidates)
+                assert(stats.search_seconds > 0 and stats.output_seconds > 0)
+                summaries.append(stats.summary())
+
+        summarized = summarize(summaries)
+        assert(sum(summarized['iterations_histogram']) == len(summaries))
+        assert(summarized['iterations'][-1] <= 10 and 0 <= summarized['exact'][0] <= 1)
+
+        stats = QueryStats()
+        get_alpha(some_data[0, :-1], some_data, index_table, base_fuzzy, 3, exact=True, stats=stats)
+        assert(stats.strategies == ['exact'] and stats.exact)
+
+    def test_grow_column_counts(self):
+        from dataset_preprocessing import generate_index_table, get_base_fuzzy
+        from get_alpha_sorted import column_ranges, grow_candidates, intersect_ranges
+
+        rng = np.random.default_rng(24)
+        some_data = rng.random((500, 4))
+        index_table = generate_index_table(some_data)
+        an_input, base_fuzzy = some_data[9, :-1], get_base_fuzzy(some_data)
+
+        # growing a hyperbox records the candidates after each column it is not whole in, as intersecting does
+        small_ranges = column_ranges(some_data, index_table, an_input - base_fuzzy * 0.2, an_input + base_fuzzy * 0.2)
+        small_indices = intersect_ranges(index_table, *small_ranges[:2])
+        min_fuzzy, max_fuzzy = an_input - base_fuzzy * 0.25, an_input + base_fuzzy * 0.25
+        big_ranges = column_ranges(some_data, index_table, min_fuzzy, max_fuzzy)
+        column_counts = []
+        grown = grow_candidates(small_indices, small_ranges, big_ranges, some_data, index_table, min_fuzzy, max_fuzzy,
+                                column_counts=column_counts)
+        assert(np.array_equal(np.sort(grown), np.sort(intersect_ranges(index_table, *big_ranges[:2]))))
+        assert(len(column_counts) == np.count_nonzero(~big_ranges[2]))
+        assert(all(a >= b for a, b in zip(column_counts, column_counts[1:])))
+        assert(column_counts[-1] >= len(grown) > len(small_indices))
@@ -1,6 +1,14 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from itertools import repeat
+from multiprocessing.shared_memory import SharedMemory
+import time
+
 from dataset_preprocessing import *
 from get_alpha_sorted import get_alpha
 from marz_get_output import get_output
+from query_stats import QueryStats, SUMMARY_FIELDS, summarize
+from progressive_metrics import METRICS, ProgressiveMetrics
 
 """
 This allows full datasets to be run consistently for testing purposes.
@@ -19,6 +27,9 @@ def extract_test_line(some_data, index_table, test_row_number):
     POST 2: test_row_number is removed from the index_table and later rows are shifted up to fill in the gap
 
     RETURN: the reduced some_data, the reduced sorter, the test line
+
+    NOTE: run_dataset no longer uses this, since get_alpha's exclude_index gives the same hyperbox
+        without copying some_data and index_table for every test line.
     """
     row = some_data[test_row_number]
     an_input = (row[:-1], row[-1])  # test row as a tuple: input, target
@@ -37,18 +48,239 @@ def perc(x, total):
     return (x / total) * 100
 
 
-def preprocessing(some_data):
+def preprocessing(some_data, compact=False):
     """
     INTENT: do the preprocessing steps for running a dataset
+    compact is True to make the index_table in the smallest unsigned integer type, as for generate_index_table.
+        Together with a float32 dataset from compact_data, this halves the memory of the data and index_table or more.
+        run_dataset searches a compact index_table through its sorted columns (see sorted_columns_for_compact).
     RETURN: the index_table and base_fuzzy
     """
-    index_table = generate_index_table(some_data)
+    index_table = generate_index_table(some_data, compact=compact)
     base_fuzzy = get_base_fuzzy(some_data)
 
     return index_table, base_fuzzy
 
 
-def run_dataset(some_data, index_table, base_fuzzy, points=2, close_threshold=0.1, start=0, step=1, verbose=False):
+def sorted_columns_for_compact(some_data, index_table, alpha_options):
+    """
+    INTENT: search a compact index_table through sorted columns, which get_alpha needs (see search_columns),
+        so that run_dataset can be given the index_table from preprocessing(some_data, compact=True)
+
+    POST 1: if index_table is an array of a smaller integer type than np.intp, and it would be searched by
+        get_alpha_sorted.get_alpha without sorted_columns, its sorted columns are made once, for the whole run.
+        They keep its type, and the data's, at the cost of a sorted copy of the data.
+
+    RETURN: the index_table and alpha_options to run the lines with
+    """
+    # ---- POST 1
+    if (isinstance(index_table, np.ndarray) and index_table.dtype != np.intp
+            and alpha_options.get('alpha_search', get_alpha) is get_alpha
+            and alpha_options.get('sorted_columns') is None and not alpha_options.get('exact')):
+        return None, dict(alpha_options, sorted_columns=generate_sorted_columns(some_data, index_table))
+
+    return index_table, alpha_options
+
+
+def check_stats_engine(stats, alpha_options):
+    """
+    INTENT: fail before any line is run if stats are asked for from an engine which does not record them
+
+    POST 1: raises ValueError if stats is True and the alpha_search of alpha_options is not
+        get_alpha_sorted.get_alpha, e.g. get_alpha_tree.get_alpha, which takes no stats
+    """
+    # ---- POST 1
+    if stats and alpha_options.get('alpha_search', get_alpha) is not get_alpha:
+        raise ValueError(f"stats are only recorded by get_alpha_sorted.get_alpha, "
+                         f"not {alpha_options['alpha_search'].__module__}.{alpha_options['alpha_search'].__name__}")
+
+
+def run_line(some_data, index_table, base_fuzzy, test_row_number, points, alpha_search=get_alpha, stats=False,
+             **alpha_options):
+    """
+    INTENT: run a single line of some_data through MaRz as a test input, with the rest of some_data as data
+
+    PRE 1: some_data is a dataset with targets in the last column and index_table is a sorter table for it
+    PRE 2: test_row_number is an index within some_data
+    PRE 3: alpha_search is get_alpha_sorted.get_alpha, or a function taking the same arguments,
+        such as get_alpha_tree.get_alpha, in which case index_table is the index it uses
+    PRE 4: alpha_options are any further keyword arguments for alpha_search, e.g. exact=True
+    PRE 5: if stats is True, alpha_search takes a stats argument, as get_alpha_sorted.get_alpha does
+        (get_alpha_tree.get_alpha does not, see check_stats_engine)
+
+    POST 1: the test line is left out of its own hyperbox with get_alpha's exclude_index,
+        so some_data and index_table are never copied (see extract_test_line)
+    POST 2: if stats is True, the query is recorded in a query_stats.QueryStats
+
+    RETURN: the target of the test line, the MaRz output, the alpha found and the number of points in the hyperbox,
+        followed by the QueryStats.summary of the query if stats is True
+    """
+    row = some_data[test_row_number]
+    test = (row[:-1], row[-1])  # test row as a tuple: input, target
+
+    # ---- POST 2
+    if stats:
+        query_stats = QueryStats()
+        alpha, indices = alpha_search(test[0], some_data, index_table, base_fuzzy, points, max_iterations=10,
+                                      exclude_index=test_row_number, stats=query_stats, **alpha_options)
+        output = get_output(test[0], some_data, base_fuzzy * alpha, indices, stats=query_stats)
+        return (test[1], output, alpha, len(indices)) + query_stats.summary()
+
+    # ---- POST 1
+    alpha, indices = alpha_search(test[0], some_data, index_table, base_fuzzy, points, max_iterations=10,
+                                  exclude_index=test_row_number, **alpha_options)
+    output = get_output(test[0], some_data, base_fuzzy * alpha, indices)
+
+    return test[1], output, alpha, len(indices)
+
+
+def run_lines(some_data, index_table, base_fuzzy, test_row_numbers, points, stats=False, **alpha_options):
+    """
+    INTENT: run_line for each of test_row_numbers
+
+    RETURN: an array with a row of (target, output, alpha, number of points) for each test row number, in order,
+        followed by the query_stats.SUMMARY_FIELDS if stats is True
+    """
+    results = np.empty((len(test_row_numbers), 4 + len(SUMMARY_FIELDS) * bool(stats)))
+    for j, i in enumerate(test_row_numbers):
+        results[j] = run_line(some_data, index_table, base_fuzzy, i, points, stats=stats, **alpha_options)
+
+    return results
+
+
+# the values attached from shared memory by each worker process of run_lines_parallel
+shared_blocks = []
+shared_values = {}
+
+
+def share_value(a_value, blocks):
+    """
+    INTENT: copy a_value into shared memory if it is an array, or a tuple of arrays, for run_lines_parallel
+
+    POST 1: each numpy array is copied into a new shared memory block, which is added to blocks
+    POST 2: anything else (e.g. a tree index or a flag) is left as it is, to be sent to each worker once
+
+    RETURN: a spec of a_value for attach_value
+    """
+    # ---- POST 1
+    if isinstance(a_value, np.ndarray):
+        an_array = np.ascontiguousarray(a_value)
+        block = SharedMemory(create=True, size=max(an_array.nbytes, 1))
+        blocks.append(block)
+        np.ndarray(an_array.shape, an_array.dtype, buffer=block.buf)[...] = an_array
+        return 'array', (block.name, an_array.shape, an_array.dtype.str)
+    if isinstance(a_value, tuple):
+        return 'tuple', [share_value(part, blocks) for part in a_value]
+
+    # ---- POST 2
+    return 'value', a_value
+
+
+def attach_value(a_spec):
+    """
+    INTENT: in a worker process, rebuild a value from its spec from share_value, without copying shared memory
+
+    RETURN: the value
+    """
+    kind, contents = a_spec
+    if kind == 'array':
+        name, shape, dtype = contents
+        block = SharedMemory(name=name)
+        shared_blocks.append(block)  # keep the block open for as long as the worker lives
+        return np.ndarray(shape, dtype, buffer=block.buf)
+    if kind == 'tuple':
+        return tuple(attach_value(part) for part in contents)
+
+    return contents
+
+
+def attach_shared_values(value_specs):
+    """
+    INTENT: in a worker process, attach to the values shared by run_lines_parallel
+
+    PRE 1: value_specs is a dictionary of specs from share_value, for the arguments of run_lines
+
+    POST 1: shared_values holds the arguments, with numpy arrays backed by the shared memory
+    """
+    for name, a_spec in value_specs.items():
+        shared_values[name] = attach_value(a_spec)
+
+
+def run_shared_lines(test_row_numbers, points):
+    """
+    INTENT: run_lines in a worker process, with the arguments attached by attach_shared_values
+    """
+    return run_lines(test_row_numbers=test_row_numbers, points=points, **shared_values)
+
+
+@contextmanager
+def shared_line_runner(some_data, index_table, base_fuzzy, workers, **alpha_options):
+    """
+    INTENT: start a pool of worker processes that share one copy of the dataset, for running lines more than once
+
+    PRE 1: as for run_lines
+    PRE 2: workers is the number of worker processes to start, greater than 1
+
+    POST 1: some_data, index_table, base_fuzzy and any arrays in alpha_options (e.g. sorted_columns)
+        are copied once into shared memory, and anything else (e.g. a tree index) is sent once to each worker
+    POST 2: each call of the runner splits its test_row_numbers into contiguous slices which are sent out to the workers
+    POST 3: the shared memory is released once the pool is done with
+
+    RETURN: (yield) a function of test_row_numbers and points, which returns the same array as run_lines,
+        with the results of the slices put back in the original order
+    """
+    blocks = []
+    try:
+        # ---- POST 1
+        arguments = dict(alpha_options, some_data=some_data, index_table=index_table, base_fuzzy=base_fuzzy)
+        value_specs = {name: share_value(a_value, blocks) for name, a_value in arguments.items()}
+
+        with ProcessPoolExecutor(workers, initializer=attach_shared_values, initargs=(value_specs,)) as pool:
+            # ---- POST 2
+            def run_lines_shared(test_row_numbers, points):
+                # a few slices per worker, so a slow slice does not hold up the whole run
+                bounds = np.linspace(0, len(test_row_numbers), workers * 4 + 1).astype(int)
+                slices = [test_row_numbers[bounds[j]:bounds[j + 1]] for j in range(len(bounds) - 1)]
+                return np.concatenate(list(pool.map(run_shared_lines, slices, repeat(points))))
+
+            yield run_lines_shared
+    finally:
+        # ---- POST 3
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def run_lines_parallel(some_data, index_table, base_fuzzy, test_row_numbers, points, workers, **alpha_options):
+    """
+    INTENT: run_lines with a pool of worker processes that share one copy of the dataset, see shared_line_runner
+
+    PRE 1: as for run_lines
+    PRE 2: workers is the number of worker processes to start, greater than 1
+
+    RETURN: the same array as run_lines, with the results of the slices put back in the original order
+    """
+    with shared_line_runner(some_data, index_table, base_fuzzy, workers, **alpha_options) as run_lines_shared:
+        return run_lines_shared(test_row_numbers, points)
+
+
+def print_query_stats(summaries):
+    """
+    INTENT: print the percentiles of the query_stats.SUMMARY_FIELDS of many queries, and a histogram
+        of their iterations, for run_dataset and run_dataset_progressive with stats=True
+
+    PRE 1: summaries is an array with a row of QueryStats.summary for each query
+    """
+    summarized = summarize(summaries)
+    print("query stats (p50, p90, p99, max):")
+    for field in SUMMARY_FIELDS:
+        print(f"{field:>17}: " + ", ".join(f"{value:.3f}" for value in summarized[field]))
+    print("queries by iterations: " + ", ".join(f"{iterations}: {count}" for iterations, count
+                                                in enumerate(summarized['iterations_histogram']) if count))
+
+
+def run_dataset(some_data, index_table, base_fuzzy, points=2, close_threshold=0.1, start=0, step=1, verbose=False,
+                workers=1, stats=False, **alpha_options):
     """
     INTENT: the procedural work of running a full set of tests on a dataset and printing results
 
@@ -57,13 +289,34 @@ def run_dataset(some_data, index_table, base_fuzzy, points=2, close_threshold=0.
 
     start and step are used in the range() for which lines of the dataset to run.
 
-    This uses the get_alpha sorted version
+    workers is the number of processes to run the lines with; for workers > 1 see run_lines_parallel.
+        Where processes are spawned rather than forked, the calling script needs an if __name__ == '__main__' guard.
+
+    alpha_options are passed on to run_line, e.g. exact=True to use get_alpha_exact instead of searching,
+        or alpha_search=get_alpha_tree.get_alpha with the tree from generate_tree_index as the index_table.
+
+    stats is True to record each query in a query_stats.QueryStats, and print the percentiles of the iterations,
+        candidates, times and exact point counts of the queries, and a histogram of the iterations,
+        after the points found. The tree engine does not record stats, so asking it for them raises ValueError.
+
+    This uses the get_alpha sorted version. Each test line is left out of its own hyperbox with
+        get_alpha's exclude_index, so some_data and index_table are never copied (see extract_test_line).
     """
     # print some_data info
     print(f"data shape: {some_data.shape}")
     # print(f"base fuzzy: {base_fuzzy}")
 
+    check_stats_engine(stats, alpha_options)
     length = some_data.shape[0]
+    test_row_numbers = range(start, length, step)
+    index_table, alpha_options = sorted_columns_for_compact(some_data, index_table, alpha_options)
+
+    if workers > 1:
+        results = run_lines_parallel(some_data, index_table, base_fuzzy, test_row_numbers, points, workers,
+                                     stats=stats, **alpha_options)
+    else:
+        results = run_lines(some_data, index_table, base_fuzzy, test_row_numbers, points, stats=stats,
+                            **alpha_options)
 
     close = 0
     close_lines = []
@@ -74,21 +327,16 @@ def run_dataset(some_data, index_table, base_fuzzy, points=2, close_threshold=0.
     targets = []
     outputs = []
 
-    for i in range(start, length, step):
-        trimmed_data, trimmed_table, test = extract_test_line(some_data, index_table, i)
-
-        alpha, indices = get_alpha(test[0], trimmed_data, trimmed_table, base_fuzzy, points, max_iterations=10)
-        output = get_output(test[0], trimmed_data, base_fuzzy * alpha, indices)
-
+    for i, (target, output, alpha, num_points) in zip(test_row_numbers, results[:, :4]):
         # increment appropriate counter to track the number of times the requested number of points was found
-        if len(indices) == points:
+        if num_points == points:
             points_count[0] += 1
-        elif len(indices) == points + 1:
+        elif num_points == points + 1:
             points_count[1] += 1
         else:
             points_count[2] += 1
 
-        difference = abs(output - test[1])
+        difference = abs(output - target)
         if difference < close_threshold:
             end = f"\t <- within {close_threshold}"
             close += 1
@@ -98,11 +346,11 @@ def run_dataset(some_data, index_table, base_fuzzy, points=2, close_threshold=0.
 
         # print results
         if print_lines:
-            print(f"{i:4}) alpha: {alpha:.3f}, points: {len(indices):2}\t"
-                  f"output: {output:.3f}\ttarget: {test[1]:.3f}\tdiff: {difference:.3f}{end}")
+            print(f"{i:4}) alpha: {alpha:.3f}, points: {int(num_points):2}\t"
+                  f"output: {output:.3f}\ttarget: {target:.3f}\tdiff: {difference:.3f}{end}")
 
-        targets.append(test[1])  # add target, output to the loss vectors
-        outputs.append(output)   # to compute accuracy (R-Square, Mean Square, etc)
+        targets.append(target)  # add target, output to the loss vectors
+        outputs.append(output)  # to compute accuracy (R-Square, Mean Square, etc)
         lines_run += 1
 
     print(f'threshold for "close result": {close_threshold}')
@@ -112,4 +360,218 @@ def run_dataset(some_data, index_table, base_fuzzy, points=2, close_threshold=0.
           f"number with {points + 1} points found: {points_count[1]} or {perc(points_count[1], lines_run):.2f}%\n"
           f"number with more points found: {points_count[2]} or {perc(points_count[2], lines_run):.2f}%")
 
+    if stats:
+        print_query_stats(results[:, 4:])
+
     return targets, outputs
+
+
+def run_dataset_progressive(some_data, index_table, base_fuzzy, points=2, close_threshold=0.1, metric='mse',
+                            ci_width=None, time_budget=None, confidence=0.95, min_lines=100, batch_size=100, seed=0,
+                            workers=1, stats=False, **alpha_options):
+    """
+    INTENT: estimate the results of run_dataset from a random sample of its lines, running only as many lines
+        as are needed to know them well enough, rather than every step-th line
+
+    PRE 1: as for run_dataset, with alpha_options passed on to run_line
+    PRE 2: metric is one of progressive_metrics.METRICS: 'mse', 'accuracy' or 'f1' of the outputs rounded
+        to the nearest integer, or the rate of 'close' results within close_threshold
+    PRE 3: ci_width is None, or the width of the confidence interval of metric to stop at,
+        and time_budget is None, or the number of seconds to stop after
+    PRE 4: stats is as for run_dataset, for the lines which were run
+
+    POST 1: the lines are run in a random permutation from seed, batch_size lines at a time (for each worker),
+        with one pool of workers for the whole run if workers > 1
+    POST 2: after each batch, every metric and its confidence interval are updated online (see ProgressiveMetrics)
+    POST 3: the run stops once at least min_lines have been run and the interval of metric is narrower than
+        ci_width (but not of no width), once time_budget seconds have passed, or once every line has been run
+    POST 4: the estimate of each metric and the half width of its interval are printed, with the lines run
+        and why the run stopped, followed by the query stats of the lines run if stats is True
+
+    RETURN: the targets and outputs of the lines run, in the order they were run,
+        and a dict of each metric and its (estimate, half width of its confidence interval)
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'")
+    check_stats_engine(stats, alpha_options)
+    print(f"data shape: {some_data.shape}")
+
+    start_time = time.perf_counter()
+    length = some_data.shape[0]
+    index_table, alpha_options = sorted_columns_for_compact(some_data, index_table, alpha_options)
+    order = np.random.default_rng(seed).permutation(length)
+    metrics = ProgressiveMetrics(close_threshold, confidence, population=length)
+    targets = []
+    outputs = []
+    summaries = []
+
+    with ExitStack() as stack:
+        # ---- POST 1
+        if workers > 1:
+            run_batch = stack.enter_context(shared_line_runner(some_data, index_table, base_fuzzy, workers,
+                                                               stats=stats, **alpha_options))
+        else:
+            def run_batch(test_row_numbers, points):
+                return run_lines(some_data, index_table, base_fuzzy, test_row_numbers, points, stats=stats,
+                                 **alpha_options)
+
+        lines_run = 0
+        stopped_by = 'every line was run'
+        while lines_run < length:
+            batch = order[lines_run:lines_run + batch_size * max(workers, 1)]
+            results = run_batch(batch, points)
+            lines_run += len(batch)
+
+            # ---- POST 2
+            metrics.add(results[:, 0], results[:, 1])
+            targets += results[:, 0].tolist()
+            outputs += results[:, 1].tolist()
+            summaries.append(results[:, 4:])
+
+            # ---- POST 3
+            estimate, half_width = metrics.estimates()[metric]
+            # an interval of no width before every line is run only means the lines so far were all the same
+            if (ci_width is not None and lines_run >= min_lines and 2 * half_width < ci_width
+                    and (half_width > 0 or lines_run == length)):
+                stopped_by = f"the {confidence:.0%} interval of {metric} is narrower than {ci_width}"
+                break
+            if time_budget is not None and time.perf_counter() - start_time >= time_budget:
+                stopped_by = f"the time budget of {time_budget} seconds ran out"
+                break
+
+    # ---- POST 4
+    estimates = metrics.estimates()
+    print(f"{lines_run} random lines of {length} run, or {perc(lines_run, length):.2f}%, "
+          f"in {time.perf_counter() - start_time:.2f} seconds, stopped as {stopped_by}")
+    print(f"estimates with {confidence:.0%} confidence intervals (close threshold {close_threshold}):")
+    for name, (estimate, half_width) in estimates.items():
+        print(f"{name:>9}: {estimate:.4f} ± {half_width:.4f}")
+    if stats:
+        print_query_stats(np.concatenate(summaries))
+
+    return targets, outputs, estimates
+
+
+class RunDatasetTests(unittest.TestCase):
+
+    def test_run_dataset_parallel(self):
+        rng = np.random.default_rng(4)
+        some_data = np.round(rng.random((150, 4)) * 10)
+        index_table, base_fuzzy = preprocessing(some_data)
+
+        serial = run_dataset(some_data, index_table, base_fuzzy, points=2, start=1, step=2)
+        parallel = run_dataset(some_data, index_table, base_fuzzy, points=2, start=1, step=2, workers=3)
+        assert(serial == parallel)
+        assert(len(serial[0]) == 75)
+
+        serial = run_dataset(some_data, index_table, base_fuzzy, points=2, exact=True)
+        parallel = run_dataset(some_data, index_table, base_fuzzy, points=2, workers=2, exact=True)
+        assert(serial == parallel)
+
+        sorted_columns = generate_sorted_columns(some_data, index_table)
+        parallel = run_dataset(some_data, None, base_fuzzy, points=2, start=1, step=2, workers=2,
+                               sorted_columns=sorted_columns)
+        assert(parallel == run_dataset(some_data, index_table, base_fuzzy, points=2, start=1, step=2))
+
+        # the tree engine finds the same hyperboxes as the exact one, and its index is not an array
+        import get_alpha_tree
+        tree_index = get_alpha_tree.generate_tree_index(some_data, base_fuzzy)
+        tree = run_dataset(some_data, tree_index, base_fuzzy, points=2, workers=2,
+                           alpha_search=get_alpha_tree.get_alpha)
+        assert(serial == tree)
+
+    def test_run_dataset_stats(self):
+        import contextlib
+        import io
+
+        rng = np.random.default_rng(24)
+        some_data = np.round(rng.random((100, 4)) * 10)
+        index_table, base_fuzzy = preprocessing(some_data)
+
+        # the stats are gathered from the workers too, and do not change the results
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            with_stats = run_dataset(some_data, index_table, base_fuzzy, points=2, workers=2, stats=True)
+        assert(with_stats == run_dataset(some_data, index_table, base_fuzzy, points=2))
+        assert("query stats" in printed.getvalue() and "queries by iterations" in printed.getvalue())
+
+        results = run_lines(some_data, index_table, base_fuzzy, range(100), 2, stats=True)
+        assert(results.shape == (100, 4 + len(SUMMARY_FIELDS)))
+        exact = results[:, 4 + SUMMARY_FIELDS.index('exact')]
+        assert(np.array_equal(exact, results[:, 3] == 2))
+
+        # the progressive run prints the same stats, of the lines it ran, from the workers too
+        for workers in (1, 2):
+            printed = io.StringIO()
+            with contextlib.redirect_stdout(printed):
+                progressive = run_dataset_progressive(some_data, index_table, base_fuzzy, points=2, ci_width=1e6,
+                                                      min_lines=40, batch_size=20, workers=workers, stats=True)
+            assert(progressive[:2] == run_dataset_progressive(some_data, index_table, base_fuzzy, points=2,
+                                                              ci_width=1e6, min_lines=40, batch_size=20)[:2])
+            assert("query stats" in printed.getvalue())
+            histogram = printed.getvalue().split("queries by iterations: ")[1].splitlines()[0]
+            assert(sum(int(count) for count in histogram.replace(',', ' ').split()[1::2]) == len(progressive[0]))
+
+        # the tree engine records no stats, which is found before any line is run
+        import get_alpha_tree
+        tree_index = get_alpha_tree.generate_tree_index(some_data, base_fuzzy)
+        with self.assertRaises(ValueError):
+            run_dataset(some_data, tree_index, base_fuzzy, workers=2, stats=True, alpha_search=get_alpha_tree.get_alpha)
+        with self.assertRaises(ValueError):
+            run_dataset_progressive(some_data, tree_index, base_fuzzy, stats=True,
+                                    alpha_search=get_alpha_tree.get_alpha)
+
+    def test_run_dataset_progressive(self):
+        rng = np.random.default_rng(25)
+        some_data = np.round(rng.random((300, 4)) * 10)
+        some_data[:, -1] = some_data[:, 0] > 5  # a binary target, for every metric
+        index_table, base_fuzzy = preprocessing(some_data)
+
+        # run to the end, the estimates are those of the whole dataset, with no uncertainty left
+        targets, outputs = run_dataset(some_data, index_table, base_fuzzy, points=2)
+        random_targets, random_outputs, estimates = run_dataset_progressive(some_data, index_table, base_fuzzy,
+                                                                            points=2, batch_size=64)
+        assert(sorted(zip(random_targets, random_outputs)) == sorted(zip(targets, outputs)))
+        assert(abs(estimates['mse'][0] - np.mean((np.array(outputs) - targets) ** 2)) < 1e-12)
+        assert(all(half_width == 0 for estimate, half_width in estimates.values()))
+
+        # a wide interval stops after min_lines, with the same results from the workers
+        stopped = run_dataset_progressive(some_data, index_table, base_fuzzy, points=2, metric='accuracy',
+                                          ci_width=1, min_lines=50, batch_size=25)
+        assert(len(stopped[0]) == 50)
+        parallel = run_dataset_progressive(some_data, index_table, base_fuzzy, points=2, metric='accuracy',
+                                           ci_width=1, min_lines=50, batch_size=25, workers=2)
+        assert(parallel[:2] == stopped[:2])  # the workers run bigger batches, so the sums may differ in rounding
+        assert(all(np.allclose(parallel[2][name], stopped[2][name]) for name in METRICS))
+
+        # lines which are all correct so far do not stop the run on an interval of no width
+        same_data = some_data.copy()
+        same_data[:, -1] = 1
+        index_table, base_fuzzy = preprocessing(same_data)
+        all_correct = run_dataset_progressive(same_data, index_table, base_fuzzy, metric='accuracy', ci_width=0.01,
+                                              min_lines=50, batch_size=50)
+        assert(all_correct[2]['accuracy'][0] == 1 and len(all_correct[0]) > 50)
+
+        # a used up time budget stops after the first batch
+        assert(len(run_dataset_progressive(some_data, index_table, base_fuzzy, time_budget=0, batch_size=30)[0]) == 30)
+        with self.assertRaises(ValueError):
+            run_dataset_progressive(some_data, index_table, base_fuzzy, metric='r2')
+
+    def test_run_dataset_compact(self):
+        rng = np.random.default_rng(20)
+        some_data = compact_data(rng.random((120, 4)) * 10)
+        index_table, base_fuzzy = preprocessing(some_data, compact=True)
+        assert(index_table.dtype == np.uint8)
+
+        # the compact arrays are shared with the workers in their own types
+        sorted_columns = generate_sorted_columns(some_data, index_table)
+        targets, outputs = run_dataset(some_data, None, base_fuzzy, points=2, workers=2, sorted_columns=sorted_columns)
+        wide_data = some_data.astype(float)
+        wide_targets, wide_outputs = run_dataset(wide_data, *preprocessing(wide_data), points=2)
+        assert(targets == wide_targets)
+        assert(np.allclose(outputs, wide_outputs, atol=1e-4))
+
+        # the compact index_table is searched through its sorted columns, rather than as a sorter
+        index_table, alpha_options = sorted_columns_for_compact(some_data, index_table, {})
+        assert(index_table is None and alpha_options['sorted_columns'][1].dtype == np.uint8)
+        assert(run_dataset(some_data, *preprocessing(some_data, compact=True), points=2) == (targets, outputs))